@@ -35,3 +35,4 @@ class CPU_ARMv7(CPU):
 
 
 cpu = CPU_ARMv7(env, asm, disassemble, env.pc_)
+cpu.modname = __name__
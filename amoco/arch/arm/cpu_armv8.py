@@ -29,3 +29,4 @@ class CPU_ARMv8(CPU):
 
 
 cpu = CPU_ARMv8(env, asm64, disassemble, env.pc)
+cpu.modname = __name__
@@ -17,3 +17,4 @@ instruction_avr.set_formatter(AVR_full)
 disassemble = disassembler([spec], iclass=instruction_avr)
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
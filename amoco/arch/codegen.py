@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+# This code is part of Amoco
+# Copyright (C) 2006-2014 Axel Tillequin (bdcht3@gmail.com)
+# published under GPLv2 license
+
+"""
+arch/codegen.py
+===============
+
+The codegen module translates the specifications tree of a
+:class:`arch.core.disassembler` into python source code: every node of the
+tree becomes a function that dispatches on the masked integer value of the
+instruction bytes, and every leaf ispec becomes a function that extracts
+its directives with inlined shifts and masks and calls its hook directly.
+
+Generated modules are cached in the conf.Arch.cachedir directory (if not
+empty) and are reused as long as the specifications are unchanged.
+The interpreted tree walk of :meth:`disassembler.__call__` remains the
+reference implementation, see :meth:`disassembler.compile`.
+"""
+
+import os
+import keyword
+import hashlib
+import importlib.util
+from types import FunctionType, ModuleType
+
+from amoco.config import conf
+from amoco.logger import Log
+
+logger = Log(__name__)
+logger.debug("loading module")
+
+# version of the generated code, part of the signature of generated modules:
+VERSION = 2
+
+# inner nodes with more branches than this use a dict dispatch:
+MAXIFS = 4
+
+
+def walk(d):
+    "yields all ispecs of disassembler d in tree order"
+
+    def _walk(fl):
+        f, l = fl
+        if f == 0:
+            yield from l
+        else:
+            for x in l.values():
+                yield from _walk(x)
+
+    for fl in d.specs:
+        yield from _walk(fl)
+
+
+def signature(d, e):
+    "returns the hash of all parameters of disassembler d used by generate"
+    h = hashlib.sha1()
+    h.update(b"%d:%d:%d:%d" % (VERSION, e, d.maxlen, len(d.specs)))
+    for s in walk(d):
+        t = [s.format, str(s.pfx), str(s.precond is not None)]
+        for D in (s.iattr, s.fargs):
+            t.append(",".join(("%s%d" % (k, isinstance(v, FunctionType)) for k, v in D.items())))
+        h.update(("|".join(t) + "\n").encode())
+    return h.hexdigest()
+
+
+def inlined(s, e):
+    "returns True if ispec s can be decoded by generated code"
+    if s.hook is None:
+        return False
+    if s.size == 0 and e != 1:
+        return False
+    names = list(s.iattr.keys()) + list(s.fargs.keys())
+    names += [x[1] for x in s.fields]
+    return not any((keyword.iskeyword(k) or not k.isidentifier() for k in names))
+
+
+def generate(d, e):
+    """
+    returns the python source of the decoders of disassembler d for the
+    fetch endianness e. The source defines the list of decoders functions
+    (one for each instruction set) with arguments (b, istr, i, iclass) where
+    b is the integer value of istr (see :meth:`disassembler.__call__`) and
+    i is the current prefix instruction (or None.) A decoder returns the
+    decoded instruction or None. Ispecs and their hooks are referenced by
+    their index in the tree order (see walk and namespace.)
+    """
+    maxsize = d.maxlen * 8
+    count = [0]
+    src = ["# generated by amoco.arch.codegen, do not edit.", ""]
+    src.append("from crysp.bits import Bits")
+    src.append("from amoco.arch.core import DecodeError, InstructionError")
+
+    def spec(s):
+        k = count[0]
+        count[0] += 1
+        if not inlined(s, e):
+            return k
+        blen = s.fix.size // 8
+        c = ["", "", "def d%d(istr, v, i, iclass):" % k]
+        c.append("    bs = istr[0:%d]" % blen)
+        if s.size == 0:
+            c.append('    v |= int.from_bytes(istr[%d:], "little") << %d' % (blen, 8 * blen))
+            if s.bits:
+                c.append("    b = Bits(v, 8 * len(istr))")
+        elif s.bits:
+            c.append("    b = Bits(v, %d)" % s.fix.size)
+        c.append("    if i is None:")
+        c.append("        i = iclass(bs)")
+        c.append("    else:")
+        c.append("        i.bytes += bs")
+        c.append("    saved_bytes = i.bytes[:-%d]" % blen)
+        c.append("    i.spec = s%d" % k)
+        attrs = []
+        for j, (a, x) in enumerate(s.iattr.items()):
+            x = "c%d_%d%s" % (k, j, "(b)" if isinstance(x, FunctionType) else "")
+            c.append("    i.%s = %s" % (a, x))
+            attrs.append(a)
+        kargs = ["obj=i"]
+        for j, (a, x) in enumerate(s.fargs.items()):
+            x = "f%d_%d%s" % (k, j, "(b)" if isinstance(x, FunctionType) else "")
+            kargs.append("%s=%s" % (a, x))
+        for attr, a, _, x in s.fields:
+            if attr:
+                c.append("    i.%s = %s" % (a, x))
+                attrs.append(a)
+            else:
+                kargs.append("%s=%s" % (a, x))
+        c.append("    try:")
+        if s.precond is not None:
+            c.append("        if not p%d(i):" % k)
+            c.append("            raise InstructionError(i)")
+        c.append("        h%d(%s)" % (k, ", ".join(kargs)))
+        c.append("    except InstructionError:")
+        c.append("        i.bytes = saved_bytes")
+        for a in attrs:
+            c.append("        del i.%s" % a)
+        c.append("        raise InstructionError(i)")
+        c.append("    return i")
+        src.extend(c)
+        return k
+
+    def node(fl, n):
+        f, l = fl
+        name = "n%d" % n[0]
+        n[0] += 1
+        if f == 0:
+            body = []
+            for s in l:
+                blen = s.fix.size // 8
+                sh = maxsize - s.fix.size
+                if e == -1:
+                    m, x = s.imask << sh, s.ifix << sh
+                else:
+                    m, x = s.imask, s.ifix
+                k = spec(s)
+                if inlined(s, e):
+                    v = "b >> %d" % sh if e == -1 else "b & %#x" % ((1 << s.fix.size) - 1)
+                    call = "d%d(istr, %s, i, iclass)" % (k, v)
+                else:
+                    call = "s%d.decode(istr, %d, i=i, iclass=iclass)" % (k, e)
+                body.append("    if len(istr) >= %d and b & %#x == %#x:" % (blen, m, x))
+                body.append("        try:")
+                body.append("            return %s" % call)
+                body.append("        except (DecodeError, InstructionError):")
+                body.append("            pass")
+        else:
+            T = [(x, node(sub, n)) for (x, sub) in l.items()]
+            if len(T) > MAXIFS:
+                src.extend(["", ""])
+                src.append("T%s = {" % name)
+                src.extend(["    %#x: %s," % (x, c) for (x, c) in T])
+                src.append("}")
+                body = ["    c = T%s.get(b & %#x, None)" % (name, f)]
+                body.append("    if c is not None:")
+                body.append("        return c(b, istr, i, iclass)")
+            else:
+                body = ["    x = b & %#x" % f]
+                for x, c in T:
+                    body.append("    if x == %#x:" % x)
+                    body.append("        return %s(b, istr, i, iclass)" % c)
+        src.extend(["", "", "def %s(b, istr, i, iclass):" % name])
+        src.extend(body)
+        src.append("    return None")
+        return name
+
+    n = [0]
+    roots = [node(fl, n) for fl in d.specs]
+    src.extend(["", ""])
+    src.append("decoders = [%s]" % ", ".join(roots))
+    src.append("")
+    return "\n".join(src)
+
+
+def namespace(S):
+    "returns the dict of ispecs' objects that are referenced by generated code"
+    ns = {}
+    for k, s in enumerate(S):
+        ns["s%d" % k] = s
+        ns["h%d" % k] = s.hook
+        ns["p%d" % k] = s.precond
+        for j, x in enumerate(s.iattr.values()):
+            ns["c%d_%d" % (k, j)] = x
+        for j, x in enumerate(s.fargs.values()):
+            ns["f%d_%d" % (k, j)] = x
+    return ns
+
+
+def load(d, e):
+    """
+    returns the list of generated decoders of disassembler d for fetch
+    endianness e, using the cached module in conf.Arch.cachedir if found.
+    """
+    name = "amoco_decoders_%s" % signature(d, e)[:16]
+    cachedir = conf.Arch.cachedir
+    filename = None
+    if cachedir:
+        cachedir = os.path.expanduser(cachedir)
+        filename = os.path.join(cachedir, "%s.py" % name)
+        if not os.path.exists(filename):
+            logger.verbose("generating decoders in %s" % filename)
+            try:
+                os.makedirs(cachedir, exist_ok=True)
+                with open(filename + ".tmp", "w") as f:
+                    f.write(generate(d, e))
+                os.replace(filename + ".tmp", filename)
+            except OSError as err:
+                logger.warning("decoders cache error: %s" % err)
+                filename = None
+    if filename:
+        # the module bytecode is cached by importlib in __pycache__:
+        spec = importlib.util.spec_from_file_location(name, filename)
+        m = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(m)
+    else:
+        m = ModuleType(name)
+        exec(compile(generate(d, e), "<%s>" % name, "exec"), m.__dict__)
+    m.__dict__.update(namespace(list(walk(d))))
+    return m.decoders
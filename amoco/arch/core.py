@@ -20,17 +20,23 @@ for the definition of new cpu architectures:
 # Copyright (C) 2006-2014 Axel Tillequin (bdcht3@gmail.com)
 # published under GPLv2 license
 
+import os
+import sys
 import inspect
 import importlib
 import codecs
+import hashlib
+import marshal
 from types import FunctionType
 from collections import defaultdict
+from collections.abc import MutableMapping
 from functools import reduce
 import pyparsing as pp
 
 from crysp.bits import Bits
 from crysp.bits import pack, unpack  # noqa: F401
 
+from amoco.config import conf
 from amoco.logger import Log
 
 logger = Log(__name__)
@@ -55,6 +61,7 @@ class CPU:
         )
         self.disassemble = disassemble
         self.disassemble.iclass.set_uarch(self.uarch)
+        self.disassemble.iclass.set_internals(getattr(env, "internals", None))
         if pc_expr is not None:
             self.__pc = pc_expr
         elif pc_found is not None:
@@ -102,25 +109,63 @@ class icore(object):
                        to instanciate this instruction.
       mnemonic (str) : the mnemonic string as defined by the specification.
       operands (list): the list of operands' expressions.
-      misc (dict)    : a defaultdict for passing various arch-dependent infos
+      misc (dict)    : a dict for passing various arch-dependent infos
                        (which returns None for undefined keys.)
     """
 
+    __slots__ = ("bytes", "type", "spec", "mnemonic", "operands", "_misc")
+
     def __init__(self, istr=b""):
         self.bytes = bytes(istr)
         self.type = type_undefined
         self.spec = None
         self.mnemonic = None
         self.operands = []
-        # we add a misc defaultdict container.
+        # the misc dict is allocated only when some info is written into it.
         # see x86 specs for example of misc usage.
-        self.misc = defaultdict(_core_misc_default)
+        self._misc = None
+
+    @property
+    def misc(self):
+        m = self._misc
+        return m if m is not None else _lazymisc(self)
+
+    @misc.setter
+    def misc(self, m):
+        self._misc = imisc(m) if m else None
+
+    def __getstate__(self):
+        S = {}
+        for c in self.__class__.__mro__:
+            for k in c.__dict__.get("__slots__", ()):
+                # caches (like instruction._toks) are not pickled:
+                if k in ("__dict__", "__weakref__", "_toks") or not hasattr(self, k):
+                    continue
+                S[k] = getattr(self, k)
+        return (getattr(self, "__dict__", None), S)
+
+    def __setstate__(self, state):
+        # state is either the (dict, slots) tuple of slotted instances or
+        # the __dict__ of instructions pickled by previous versions.
+        if isinstance(state, tuple):
+            d, s = state
+            state = dict(d or {}, **(s or {}))
+        for k, v in state.items():
+            setattr(self, k, v)
 
     @classmethod
     def set_uarch(cls, uarch):
         "class method to define the instructions' semantics uarch dict"
         cls._uarch = uarch
 
+    # the cpu internals dict (see CPU), which formatters may depend on.
+    _internals = None
+
+    @classmethod
+    def set_internals(cls, internals):
+        "class method to define the instructions' cpu internals dict"
+        cls._internals = internals
+
     def typename(self):
         "returns the instruction's type as a string"
         return INSTRUCTION_TYPES[self.type]
@@ -160,9 +205,17 @@ class instruction(icore):
         address (cst): the memory address where this instruction as been disassembled.
     """
 
+    # arch-dependent attributes (see ispec iattr) are stored in the __dict__.
+    __slots__ = ("address", "_toks", "__dict__")
+
     def __init__(self, istr):
         icore.__init__(self, istr)
         self.address = None
+        self._toks = None
+
+    def __setstate__(self, state):
+        self._toks = None
+        icore.__setstate__(self, state)
 
     def __repr__(self):
         s = self.__class__.__name__
@@ -201,11 +254,39 @@ class instruction(icore):
         return t if toks else View.engine.highlight(t)
 
     def __str__(self):
-        return self.formatter(i=self)
+        t = self.toks()
+        return t if isinstance(t, str) else View.engine.highlight(t)
 
     def toks(self):
-        "returns the (unjoined) list of formatted tokens."
-        return self.formatter(i=self, toks=True)
+        """returns the (unjoined) list of formatted tokens.
+        Tokens are cached until the formatter of the instruction's class
+        or any object it may depend on is replaced (see _tokskey).
+        """
+        c = self._toks
+        if c is None or not _same(c[0], self._tokskey()):
+            t = self.formatter(i=self, toks=True)
+            # formatters can add infos in misc (see x86 formats oprel) so
+            # the key is taken after formatting:
+            c = self._toks = (self._tokskey(), t)
+        return list(c[1]) if isinstance(c[1], list) else c[1]
+
+    def _tokskey(self):
+        # the formatter, address, operands, misc infos, arch-dependent
+        # attributes and cpu internals of the instruction, which are
+        # compared by identity (and thus kept alive by the cache):
+        k = [self.__class__.formatter, self.address, self.operands]
+        k.extend(self.operands)
+        for d in (self._misc, self.__dict__, self._internals):
+            k.append(len(d) if d else 0)
+            if d:
+                k.extend(d.keys())
+                k.extend(d.values())
+        return k
+
+
+def _same(k1, k2):
+    "returns True if lists k1 and k2 hold the same objects"
+    return len(k1) == len(k2) and all(x is y for x, y in zip(k1, k2))
 
 
 class InstructionError(Exception):
@@ -224,6 +305,68 @@ def _core_misc_default():
     return None
 
 
+class imisc(dict):
+    """The misc dict of instructions, which returns None for undefined keys
+    (without adding them.)
+    """
+
+    __slots__ = ()
+
+    def __missing__(self, k):
+        return None
+
+
+class _lazymisc(MutableMapping):
+    """Empty misc dict view of an instruction that has no misc infos yet.
+    Reads don't allocate anything, the instruction's :class:`imisc` dict is
+    allocated on first write.
+    """
+
+    __slots__ = ("ins",)
+
+    def __init__(self, ins):
+        self.ins = ins
+
+    def _dict(self):
+        m = self.ins._misc
+        if m is None:
+            m = self.ins._misc = imisc()
+        return m
+
+    def __getitem__(self, k):
+        m = self.ins._misc
+        return None if m is None else m[k]
+
+    def get(self, k, default=None):
+        m = self.ins._misc
+        return default if m is None else m.get(k, default)
+
+    def __contains__(self, k):
+        m = self.ins._misc
+        return m is not None and k in m
+
+    def __setitem__(self, k, v):
+        self._dict()[k] = v
+
+    def __delitem__(self, k):
+        del self._dict()[k]
+
+    def __iter__(self):
+        return iter(self.ins._misc or ())
+
+    def __len__(self):
+        return len(self.ins._misc or ())
+
+    def __eq__(self, other):
+        return dict(self) == other
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        return (imisc, (dict(self),))
+
+
 # disassembler core  class
 # ------------------------
 
@@ -246,6 +389,8 @@ class disassembler(object):
       iset: the lambda used to select the right specifications for decoding
       endian: the lambda used to define endianess.
       specs: the *tree* of :class:`ispec` objects that defines the cpu architecture.
+      compiled: the list of generated decoders for each specs tree (or None),
+                see :meth:`compile`.
     """
 
     def __init__(
@@ -266,11 +411,46 @@ class disassembler(object):
             "building specs tree for modules %s", [m.__name__ for m in specmodules]
         )
         # self.indent = 0
-        self.specs = [self.setup(m.ISPECS) for m in specmodules]
+        self.specs = [self.build(m) for m in specmodules]
         # del self.indent
-        # some arch like x86 require a stateful decoding due to optional prefixes,
-        # so we keep an __i instruction for decoding until a non prefix ispec is used.
-        self.__i = None
+        self.compiled = None
+        self.cendian = None
+        if conf.Arch.codegen:
+            self.compile()
+
+    def compile(self):
+        """compile the specs trees into generated python decoders (see :mod:`arch.codegen`)
+        that are used by __call__ instead of walking the trees, as long as the
+        fetch endianess is the one used to build the trees.
+        """
+        from amoco.arch import codegen
+
+        self.cendian = self.endian()
+        self.compiled = codegen.load(self, self.cendian)
+
+    def build(self, m):
+        """returns the specs tree of spec module m (see :meth:`setup`), using the
+        tree saved in the module's :class:`SpecsCache` if its ispecs are unchanged.
+        """
+        S = m.ISPECS
+        S.sort(key=(lambda x: x.mask.hw()), reverse=True)
+        c = SpecsCache.caches.get(m.__name__, None)
+        if c is None:
+            return self.setup(S)
+        key = "%d:%d" % (self.endian(), self.maxlen)
+        formats = tuple((s.format for s in S))
+        t = c.trees.get(key, None)
+        if t is not None and t[0] == formats:
+            fl = _tree_load(t[1], S)
+        else:
+            fl = self.setup(S)
+            index = {s: k for (k, s) in enumerate(S)}
+            c.trees[key] = (formats, _tree_dump(fl, index))
+            c.dirty = True
+        # S may include ispecs of other spec modules:
+        for x in SpecsCache.caches.values():
+            x.save()
+        return fl
 
     def setup(self, ispecs):
         """setup will (recursively) organize the provided ispecs list into an optimal tree so that
@@ -320,48 +500,76 @@ class disassembler(object):
         return (f, l)
 
     def __call__(self, bytestring, **kargs):
-        e = self.endian(**kargs)
-        adjust = lambda x: x.ival
-        bs = bytestring[0 : self.maxlen]
-        if e == -1:
-            maxsize = self.maxlen * 8
-            adjust = lambda x: x.ival << (maxsize - x.size)
-            bs = bytestring[self.maxlen - 1 :: -1]
-        b = adjust(Bits(bs, bitorder=1))
-        # get organized/optimized tree of specs:
-        fl = self.specs[self.iset(**kargs)]
+        # some arch like x86 require a stateful decoding due to optional prefixes,
+        # so we keep the p instruction for decoding until a non prefix ispec is used.
+        # This state is local to the call so that a disassembler can be used
+        # concurrently by several threads.
+        p = None
+        while True:
+            e = self.endian(**kargs)
+            bs = bytestring[0 : self.maxlen]
+            if e == -1:
+                b = int.from_bytes(bs, "big") << (8 * (self.maxlen - len(bs)))
+            else:
+                b = int.from_bytes(bs, "little")
+            n = self.iset(**kargs)
+            if self.compiled is not None and e == self.cendian:
+                i = self.compiled[n](b, bytestring, p, self.iclass)
+            else:
+                i = self.lookup(self.specs[n], b, bytestring, e, p)
+            if i is None:
+                return None
+            # we found the instruction (or prefix)
+            if i.spec.pfx is not True:
+                break
+            p = i
+            bytestring = bytestring[i.spec.mask.size // 8 :]
+        if i.spec.pfx == "xdata":
+            i.xdata(i, **kargs)
+        if "address" in kargs:
+            i.address = kargs["address"]
+        return i
+
+    def lookup(self, fl, b, bytestring, e, p=None):
+        """walk the specs tree fl according to integer value b of bytestring
+        and returns the instruction decoded by the first matching spec (or None).
+        The decoded instruction extends the prefix instruction p if provided.
+        """
         while True:
             f, l = fl
             if f == 0:  # we are on a leaf...
                 for s in l:  # lets search linearly over this branch
                     try:
-                        i = s.decode(bytestring, e, i=self.__i, iclass=self.iclass)
+                        return s.decode(bytestring, e, i=p, iclass=self.iclass)
                     except (DecodeError, InstructionError):
                         # logger.debug(u'exception raised by disassembler:'
                         #             u'decoding %s with spec %s'%(codecs.encode(bytestring,'hex'),s.format))
                         continue
-                    # we found the instruction (or prefix)
-                    if i.spec.pfx is True:
-                        if self.__i is None:
-                            self.__i = i
-                        return self(bytestring[s.mask.size // 8 :], **kargs)
-                    elif i.spec.pfx == "xdata":
-                        i.xdata(i, **kargs)
-                    self.__i = None
-                    if "address" in kargs:
-                        i.address = kargs["address"]
-                    return i
                 logger.debug(
                     "no instruction spec matching %s"
                     % (codecs.encode(bytestring, "hex"))
                 )
-                break
+                return None
             else:  # go deeper in the tree according to submask value of b
                 fl = l.get(b & f, None)
                 if fl is None:
-                    break
-        self.__i = None
-        return None
+                    return None
+
+
+def _tree_dump(fl, index):
+    # returns the specs tree fl with ispecs replaced by their index:
+    f, l = fl
+    if f == 0:
+        return (0, [index[s] for s in l])
+    return (f, {x: _tree_dump(sub, index) for (x, sub) in l.items()})
+
+
+def _tree_load(fl, S):
+    # returns the specs tree fl with indices replaced by ispecs of S:
+    f, l = fl
+    if f == 0:
+        return (0, [S[k] for k in l])
+    return (f, {x: _tree_load(sub, S) for (x, sub) in l.items()})
 
 
 # -----------------------------------------
@@ -402,8 +610,17 @@ class ispec(object):
                         and returns a boolean to indicate wether the hook can be called or not.
                         (This allows to avoid decoding when a prefix is missing for example.)
         size (int): the bit length of the format (``LEN`` value)
+        direction (str): the direction of the format (``<`` or ``>``)
         fix (Bits): the values of fixed bits within the format
         mask (Bits): the mask of fixed bits within the format
+        ifix (int): the integer value of fix
+        imask (int): the integer value of mask
+        fields (list): the (attr, symbol, extractor, source) tuples of decoded directives
+                       where extractor is a function of the integer value v of the bytestring
+                       and of its Bits instance b (which is only created if required by a
+                       ``~`` or ``#`` directive, or by a function value in the spec's kargs),
+                       and source is the python expression of the extractor.
+        bits (bool): indicates that decode needs to create the Bits instance.
 
     Examples:
 
@@ -491,9 +708,13 @@ class ispec(object):
         "iattr",
         "fargs",
         "precond",
-        "ast",
+        "direction",
         "fix",
         "mask",
+        "ifix",
+        "imask",
+        "fields",
+        "bits",
         "pfx",
         "size",
         "hook",
@@ -505,21 +726,26 @@ class ispec(object):
         # when ispec is used as a function decorator, hook holds the decorated function
         self.hook = None
 
-    def __getstate__(self):
-        D = {}
-        D["format"] = self.format
-        D["module"] = self.hook.__module__
-        return D
-
-    def __setstate__(self, state):
-        self.format = state["format"]
-        modname = state["module"]
-        m = importlib.import_module(modname)
-        self.hook = None
-        for h in m.ISPECS:
-            if h.format == self.format:
-                self.hook = h.hook
-                break
+    def __getattr__(self, attr):
+        # the layout of decorators is built (with the cached layouts of the
+        # module of the decorated function) by __call__, the layout of other
+        # ispecs is built on first access:
+        if attr in _layout_slots:
+            self.buildspec()
+            return object.__getattribute__(self, attr)
+        raise AttributeError(attr)
+
+    def __reduce__(self):
+        # unpickled ispecs are the registered objects of their module,
+        # other ispecs are rebuilt from their format and arguments:
+        modname = getattr(self.hook, "__module__", None)
+        for k, s in enumerate(ISPECS_REGISTRY.get(modname, ())):
+            if s is self:
+                return (ispec_lookup, (modname, k))
+        kargs = dict(self.iattr, **self.fargs)
+        if self.precond is not None:
+            kargs["__obj"] = self.precond
+        return (ispec_rebuild, (self.__class__, self.format, kargs, self.hook))
 
     def setup(self, kargs):
         self.iattr = {}
@@ -533,114 +759,57 @@ class ispec(object):
                     self.fargs[k] = v
             else:
                 self.iattr[k] = v
-        self.ast = self.buildspec()
+
+    @property
+    def ast(self):
+        "the pyparsing result of the format string"
+        return specdecode.parseString(self.format, True)
 
     def fixed(self):
         s = list(str(self.fix))
         for i, x in enumerate(self.mask):
             if x == 0:
                 s[i] = "-"
-        if self.ast[0][1] == "<":
+        if self.direction == "<":
             s.reverse()
         return "".join(s)
 
-    def buildspec(self):
-        ast = specdecode.parseString(self.format, True)
-        size, direction = ast[0]
+    def buildspec(self, cache=None):
+        L = None
+        if cache is not None:
+            L = cache.layouts.get(self.format, None)
+        if L is None:
+            L = speclayout(self.format)
+            if cache is not None:
+                cache.layouts[self.format] = L
+                cache.dirty = True
+        size, self.direction, self.pfx, fsize, self.ifix, self.imask, bits, F = L
         self.size = size
-        fmt = ast[1]
-        self.pfx = ast[2]
-        xsz = ast[3]
-        if xsz:
-            self.pfx = xsz
-        go = +1
-        chklen = True
-        if direction == "<":  # format goes from high bits to low bits
-            fmt = list(reversed(fmt))
-            go = -1
-        if size == "*":
-            self.size = 0
-            chklen = False
-            size = 0
-            for d in fmt:
-                if d in ("-", "0", "1"):
-                    size += 1
-                elif isinstance(d, Bits):
-                    size += d.size
-                else:
-                    loc = d[2]
-                    if loc == "*":
-                        break
-                    if d[0] != "=":
-                        size += loc
-        if size % 8 != 0:
-            logger.error("ispec length %d not a multiple of 8 %s" % (size, self.format))
-        self.fix = Bits(0, size)  # values of fixed bits
-        self.mask = Bits(0, size)  # location of fixed bits
-        i = 0
-        count = 0
-        for d in fmt:
-            if chklen and not i < size:
-                logger.error("ispec format too wide %s" % self.format)
-            # unknown bit (skipped)
-            if d == "-":
-                i += 1
-                count += 1
-                continue
-            # fixed bit:
-            if d in ("0", "1"):
-                self.fix[i] = int(d)
-                self.mask[i] = 1
-                i += 1
-                count += 1
-                continue
-            # fixed byte:
-            if isinstance(d, Bits):
-                self.fix[i : i + d.size] = d
-                self.mask[i : i + d.size] = d.mask
-                i += d.size
-                count += d.size
-                continue
-            # directive:
-            opt, symbol, loc = d
-            if loc != "*":
-                if opt == "=" and go > 0:
-                    i = i - loc
-                sta = i
-                sto = i + loc
-                if sta < 0 or sto > size:
-                    logger.error("ispec directive out of bound in %s" % self.format)
-                if opt != "=":
-                    count += loc
-                i = sto
-                if opt == "=" and go < 0:
-                    i = i - loc
-            else:
-                if opt == "=":
-                    logger.error("ispec directive invalid length in %s" % self.format)
-                sta = i
-                sto = None
-                i = size
-                if count < size:
-                    count = size
-                chklen = True
-            # now set D (fargs or iattr) to corresponding extractor lambdas which
-            # will be called when decode is called by the disassembler:
-            D = self.fargs
-            if "." in opt:
-                D = self.iattr
-            if symbol in D:
+        self.fix = Bits(self.ifix, fsize)  # values of fixed bits
+        self.mask = Bits(self.imask, fsize)  # location of fixed bits
+        self.fields = []
+        self.bits = bits
+        self.bits |= any((isinstance(v, FunctionType) for v in self.iattr.values()))
+        self.bits |= any((isinstance(v, FunctionType) for v in self.fargs.values()))
+        for attr, symbol, opt, sta, sto, go in F:
+            # add the extractor lambda of this symbol to fields, it will be
+            # called when decode is called by the disassembler:
+            D = self.iattr if attr else self.fargs
+            if symbol in D or (attr, symbol) in ((x[0], x[1]) for x in self.fields):
                 raise logger.error("ispec symbol %s redefined" % symbol)
             if "~" in opt:
-                f = lambda b, p=sta, q=sto: b[p:q]
+                f = lambda v, b, p=sta, q=sto: b[p:q]
+                src = "b[%d:%s]" % (sta, "" if sto is None else sto)
             elif "#" in opt:
-                f = lambda b, p=sta, q=sto, x=go: str(b[p:q])[::x]
+                f = lambda v, b, p=sta, q=sto, x=go: str(b[p:q])[::x]
+                src = "str(b[%d:%s])[::%d]" % (sta, "" if sto is None else sto, go)
+            elif sto is None:
+                f = lambda v, b, p=sta: v >> p
+                src = "v >> %d" % sta
             else:
-                f = lambda b, p=sta, q=sto: b[p:q].ival
-            D[symbol] = f
-        if count != size:
-            logger.error("ispec size mismatch (%s)" % self.format)
-        return ast
+                f = lambda v, b, p=sta, m=(1 << (sto - sta)) - 1: (v >> p) & m
+                src = "(v >> %d) & %#x" % (sta, (1 << (sto - sta)) - 1)
+            self.fields.append((attr, symbol, f, src))
 
     # decode always receive input bytes in ascending memory order
     def decode(self, istr, endian=1, i=None, iclass=instruction):
@@ -649,15 +818,19 @@ class ispec(object):
         if len(istr) < blen:
             raise DecodeError
         bs = istr[0:blen]
-        # Bits object created with LSB to MSB byte string:
-        ival = bs[::endian]
-        b = Bits(ival, self.fix.size, bitorder=1)
-        if b & self.mask != self.fix:
+        # integer value of the LSB to MSB byte string:
+        v = int.from_bytes(bs, "little" if endian == 1 else "big")
+        if v & self.imask != self.ifix:
             raise DecodeError
+        b = None
         if self.size == 0:  # variable length spec:
             if endian != 1:
                 logger.error("invalid endianess")
-            b = b // Bits(istr[blen:], bitorder=1)
+            v |= int.from_bytes(istr[blen:], "little") << (8 * blen)
+            if self.bits:
+                b = Bits(v, 8 * len(istr))
+        elif self.bits:
+            b = Bits(v, self.fix.size)
         # create & update instruction object:
         if i is None:
             i = iclass(bs)
@@ -668,15 +841,20 @@ class ispec(object):
         # set instruction attributes from directives, and then
         # call hook function with instruction as first parameter
         # and fargs (note that hook can thus overwrite previous attributes)
-        for k, v in iter(self.iattr.items()):
-            if isinstance(v, FunctionType):
-                v = v(b)
-            setattr(i, k, v)
+        for k, x in iter(self.iattr.items()):
+            if isinstance(x, FunctionType):
+                x = x(b)
+            setattr(i, k, x)
         kargs = {}
-        for k, v in iter(self.fargs.items()):
-            if isinstance(v, FunctionType):
-                v = v(b)
-            kargs[k] = v
+        for k, x in iter(self.fargs.items()):
+            if isinstance(x, FunctionType):
+                x = x(b)
+            kargs[k] = x
+        for attr, k, f, _ in self.fields:
+            if attr:
+                setattr(i, k, f(v, b))
+            else:
+                kargs[k] = f(v, b)
         # and finally call the hook:
         try:
             # check any precondition on i:
@@ -689,6 +867,9 @@ class ispec(object):
             i.bytes = saved_bytes
             for k in iter(self.iattr.keys()):
                 delattr(i, k)
+            for attr, k, _, _ in self.fields:
+                if attr:
+                    delattr(i, k)
             raise InstructionError(i)
         return i
 
@@ -698,10 +879,13 @@ class ispec(object):
     # decorate:
     def __call__(self, handler):
         m = inspect.getmodule(handler)
+        # layouts of ispecs declared in a spec module are cached (see SpecsCache):
+        self.buildspec(SpecsCache.get(vars(m)))
         ispec_register(self, m)
         varnames = handler.__code__.co_varnames
         fname = handler.__name__
-        for k in iter(self.fargs.keys()):
+        fargs = [k for (attr, k, _, _) in self.fields if not attr]
+        for k in list(self.fargs.keys()) + fargs:
             if k not in varnames:
                 logger.error("ispec symbol not found in decorated function %s" % fname)
         self.hook = handler
@@ -785,6 +969,109 @@ specmore = pp.Optional(pp.Literal("&").setParseAction(lambda r: "xdata"), defaul
 specdecode = speclen + specformat + specoption + specmore
 
 
+def speclayout(format):
+    """parses the ispec format string and returns its layout, a tuple of plain
+    values (size, direction, pfx, fixsize, fix, mask, bits, fields) where fix
+    and mask are the integer values of fixed bits and of their location,
+    bits indicates that a directive needs the Bits instance, and fields is
+    the list of (attr, symbol, opt, sta, sto, go) directives (see ispec.)
+    """
+    ast = specdecode.parseString(format, True)
+    size, direction = ast[0]
+    fmt = ast[1]
+    pfx = ast[2]
+    xsz = ast[3]
+    if xsz:
+        pfx = xsz
+    go = +1
+    chklen = True
+    if direction == "<":  # format goes from high bits to low bits
+        fmt = list(reversed(fmt))
+        go = -1
+    if size == "*":
+        chklen = False
+        size = 0
+        for d in fmt:
+            if d in ("-", "0", "1"):
+                size += 1
+            elif isinstance(d, Bits):
+                size += d.size
+            else:
+                loc = d[2]
+                if loc == "*":
+                    break
+                if d[0] != "=":
+                    size += loc
+        vsize = 0
+    else:
+        vsize = size
+    if size % 8 != 0:
+        logger.error("ispec length %d not a multiple of 8 %s" % (size, format))
+    fix = Bits(0, size)  # values of fixed bits
+    mask = Bits(0, size)  # location of fixed bits
+    fields = []
+    bits = False
+    i = 0
+    count = 0
+    for d in fmt:
+        if chklen and not i < size:
+            logger.error("ispec format too wide %s" % format)
+        # unknown bit (skipped)
+        if d == "-":
+            i += 1
+            count += 1
+            continue
+        # fixed bit:
+        if d in ("0", "1"):
+            fix[i] = int(d)
+            mask[i] = 1
+            i += 1
+            count += 1
+            continue
+        # fixed byte:
+        if isinstance(d, Bits):
+            fix[i : i + d.size] = d
+            mask[i : i + d.size] = d.mask
+            i += d.size
+            count += d.size
+            continue
+        # directive:
+        opt, symbol, loc = d
+        if loc != "*":
+            if opt == "=" and go > 0:
+                i = i - loc
+            sta = i
+            sto = i + loc
+            if sta < 0 or sto > size:
+                logger.error("ispec directive out of bound in %s" % format)
+            if opt != "=":
+                count += loc
+            i = sto
+            if opt == "=" and go < 0:
+                i = i - loc
+        else:
+            if opt == "=":
+                logger.error("ispec directive invalid length in %s" % format)
+            sta = i
+            sto = None
+            i = size
+            if count < size:
+                count = size
+            chklen = True
+        bits |= ("~" in opt) or ("#" in opt)
+        fields.append((("." in opt), symbol, opt, sta, sto, go))
+    if count != size:
+        logger.error("ispec size mismatch (%s)" % format)
+    return (vsize, direction, pfx, size, fix.ival, mask.ival, bits, tuple(fields))
+
+
+# ispec attributes defined by buildspec:
+_layout_slots = ("direction", "fix", "mask", "ifix", "imask", "fields", "bits", "pfx", "size")
+
+# all decorated ispecs in order of definition, by module name:
+ISPECS_REGISTRY = defaultdict(list)
+
+
 def ispec_register(x, module):
     F = []
     try:
@@ -792,6 +1079,7 @@ def ispec_register(x, module):
     except AttributeError:
         logger.error("spec modules must declare ISPECS=[] before @ispec decorators")
         raise AttributeError
+    ISPECS_REGISTRY[module.__name__].append(x)
     f = x.fixed()
     if f in F:
         logger.error(
@@ -803,6 +1091,105 @@ def ispec_register(x, module):
             F.append(f)
 
 
+def ispec_lookup(modname, index):
+    "returns the index-th ispec defined in module modname"
+    if modname not in ISPECS_REGISTRY:
+        importlib.import_module(modname)
+    return ISPECS_REGISTRY[modname][index]
+
+
+def ispec_rebuild(cls, format, kargs, hook):
+    "returns a new (unregistered) ispec of class cls"
+    x = cls.__new__(cls)
+    ispec.__init__(x, format, **kargs)
+    x.hook = hook
+    return x
+
+
+# version of the layouts and trees saved by SpecsCache:
+SPECS_VERSION = 1
+
+
+class SpecsCache(object):
+    """SpecsCache holds the parsed layouts (see :func:`speclayout`) of all ispecs
+    of a spec module, and the specs trees built from them by disassemblers.
+    The cache is saved into the conf.Arch.cachedir directory (if not empty) in
+    a file keyed by the hash of the spec module source and of this module source
+    (which defines the layouts and trees), and is loaded when the module defines
+    its first ispec so that formats don't need to be parsed again.
+
+    Attributes:
+        name (str): the spec module name.
+        filename (str): the cache file (or None.)
+        layouts (dict): the layout of every format string.
+        trees (dict): the (formats, tree) tuple of disassemblers' specs trees,
+                      see :meth:`disassembler.build`.
+        dirty (bool): indicates that the cache needs to be saved.
+    """
+
+    caches = {}
+    # hash of this module source:
+    core = None
+
+    def __init__(self, name, filename=None):
+        self.name = name
+        self.filename = None
+        self.layouts = {}
+        self.trees = {}
+        self.dirty = False
+        cachedir = conf.Arch.cachedir
+        if cachedir and filename:
+            try:
+                if SpecsCache.core is None:
+                    with open(__file__, "rb") as f:
+                        SpecsCache.core = hashlib.sha1(f.read()).digest()
+                with open(filename, "rb") as f:
+                    h = hashlib.sha1(b"%d:" % SPECS_VERSION + SpecsCache.core + f.read())
+            except OSError:
+                return
+            self.filename = os.path.join(
+                os.path.expanduser(cachedir),
+                "amoco_ispecs_%s_%s.%s"
+                % (name, h.hexdigest()[:16], sys.implementation.cache_tag),
+            )
+            self.load()
+
+    @classmethod
+    def get(cls, g):
+        "returns the cache of the spec module with globals g (or None)"
+        if "ISPECS" not in g:
+            return None
+        name = g.get("__name__")
+        c = cls.caches.get(name, None)
+        if c is None:
+            c = cls.caches[name] = cls(name, g.get("__file__"))
+        return c
+
+    def load(self):
+        try:
+            with open(self.filename, "rb") as f:
+                self.layouts, self.trees = marshal.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            logger.warning("ispecs cache error: %s" % e)
+            self.layouts, self.trees = {}, {}
+
+    def save(self):
+        if self.filename is None or not self.dirty:
+            return
+        logger.verbose("saving ispecs cache %s" % self.filename)
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            tmp = "%s.%d.tmp" % (self.filename, os.getpid())
+            with open(tmp, "wb") as f:
+                marshal.dump((self.layouts, self.trees), f)
+            os.replace(tmp, self.filename)
+        except (OSError, ValueError) as e:
+            logger.warning("ispecs cache error: %s" % e)
+        self.dirty = False
+
+
 def test_parser():
     while 1:
         try:
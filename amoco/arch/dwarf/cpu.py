@@ -17,3 +17,4 @@ disassemble = disassembler([spec], iclass=instruction_dwarf)
 disassemble.maxlen = 21
 
 cpu = CPU(env, asm, disassemble, env.op_ptr)
+cpu.modname = __name__
@@ -17,4 +17,5 @@ instruction_eBPF.set_formatter(eBPF_full)
 disassemble = disassembler([spec], iclass=instruction_eBPF)
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
 cpu.registers = env.R + [env.pc]
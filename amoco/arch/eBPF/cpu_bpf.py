@@ -18,4 +18,5 @@ instruction_BPF.set_formatter(eBPF_full)
 disassemble = disassembler([spec_bpf], iclass=instruction_BPF)
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
 cpu.registers = [env.A, env.X] + env.M + [env.pc]
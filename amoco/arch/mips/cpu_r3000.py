@@ -23,3 +23,4 @@ def endian():
 disassemble = disassembler([spec], iclass=instruction_r3000, endian=endian)
 
 cpu = CPU(env, asm, disassemble, pc_expr=env.pc, data_endian=-1)
+cpu.modname = __name__
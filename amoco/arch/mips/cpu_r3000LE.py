@@ -18,3 +18,4 @@ from amoco.arch.mips.r3000 import spec
 disassemble = disassembler([spec], iclass=instruction_r3000)
 
 cpu = CPU(env, asm, disassemble, pc_expr=env.pc)
+cpu.modname = __name__
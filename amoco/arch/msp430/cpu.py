@@ -19,3 +19,4 @@ disassemble = disassembler([spec_msp430], iclass=instruction_msp430)
 disassemble.maxlen = 6
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
@@ -138,4 +138,4 @@ def MSP430_synthetic(null, i, toks=False):
         del s[1:-1]
     if toks:
         return s
-    return View.engine.higlight(s)
+    return View.engine.highlight(s)
@@ -18,3 +18,4 @@ from amoco.arch.pic.F46K22 import spec_pic18
 disassemble = disassembler([spec_pic18], iclass=instruction_f46k22)
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
@@ -23,3 +23,4 @@ def endian():
 disassemble = disassembler([spec_vle], iclass=instruction_e200, endian=endian)
 
 cpu = CPU(env, asm, disassemble, env.pc, data_endian=-1)
+cpu.modname = __name__
@@ -18,3 +18,4 @@ from amoco.arch.riscv.rv32i import spec_rv32i
 disassemble = disassembler([spec_rv32i], iclass=instruction_riscv)
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
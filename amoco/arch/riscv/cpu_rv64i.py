@@ -18,3 +18,4 @@ from amoco.arch.riscv.rv64i import spec_rv64i
 disassemble = disassembler([spec_rv64i], iclass=instruction_riscv64)
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
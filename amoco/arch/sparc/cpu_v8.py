@@ -23,3 +23,4 @@ def endian():
 disassemble = disassembler([spec_v8], endian=endian, iclass=instruction_sparc)
 
 cpu = CPU(env, asm, disassemble, env.pc, data_endian=-1)
+cpu.modname = __name__
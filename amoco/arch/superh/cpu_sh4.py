@@ -23,3 +23,4 @@ def endian():
 disassemble = disassembler([spec_sh4], endian=endian, iclass=instruction_sh4)
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
@@ -18,3 +18,4 @@ from amoco.arch.tricore import spec
 disassemble = disassembler([spec], iclass=instruction_tricore)
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
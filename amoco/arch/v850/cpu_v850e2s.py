@@ -18,3 +18,4 @@ import amoco.arch.v850.spec_v850e2s as spec
 disassemble = disassembler([spec], iclass=instruction_v850)
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
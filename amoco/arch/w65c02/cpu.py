@@ -18,3 +18,4 @@ from amoco.arch.w65c02 import spec
 disassemble = disassembler([spec], iclass=instruction_w65c02)
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
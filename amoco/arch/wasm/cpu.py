@@ -25,3 +25,4 @@ disassemble = disassembler([spec], iclass=instruction_wasm)
 disassemble.maxlen = 16
 
 cpu = CPU(env, asm, disassemble, env.op_ptr)
+cpu.modname = __name__
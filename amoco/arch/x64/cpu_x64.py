@@ -28,6 +28,7 @@ class CPU_ia32e(CPU):
 
 
 cpu = CPU_ia32e(env, asm, disassemble)
+cpu.modname = __name__
 
 
 def configure(**kargs):
@@ -29,6 +29,7 @@ class CPU_ia32(CPU):
 
 
 cpu = CPU_ia32(env, asm, disassemble)
+cpu.modname = __name__
 cpu.hw = hw
 
 
@@ -18,3 +18,4 @@ from amoco.arch.z80 import spec_gb
 disassemble = disassembler([spec_gb], iclass=instruction_gb)
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
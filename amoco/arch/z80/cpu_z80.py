@@ -18,3 +18,4 @@ from amoco.arch.z80 import spec_mostek
 disassemble = disassembler([spec_mostek], iclass=instruction_z80)
 
 cpu = CPU(env, asm, disassemble, env.pc)
+cpu.modname = __name__
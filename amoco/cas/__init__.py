@@ -1 +1 @@
-__all__ = ["expressions", "mapper", "smt", "blobs"]
+__all__ = ["expressions", "mapper", "smt", "blobs", "batch"]
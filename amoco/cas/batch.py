@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+# This code is part of Amoco
+# Copyright (C) 2006-2011 Axel Tillequin (bdcht3@gmail.com)
+# published under GPLv2 license
+
+"""
+cas/batch.py
+============
+
+The batch module allows to evaluate an expression, or all expressions of a
+:class:`cas.mapper.mapper`, for many concrete input values at once.
+Expressions are translated into numpy vectorized operations over uint64
+arrays (one array per input location), so that a single pass computes the
+results of what would otherwise require N calls to eval.
+Expressions that involve sizes above 64 bits (or mix signed 64-bit values
+with unsigned ones) fall back to numpy arrays of python integers.
+"""
+
+from amoco.logger import Log
+
+logger = Log(__name__)
+logger.debug("loading module")
+
+from . import expressions as expr
+
+try:
+    import numpy as np
+except ImportError:
+    logger.verbose("numpy package not found => batch evaluation is not implemented")
+    has_numpy = False
+else:
+    logger.verbose("numpy package imported")
+    has_numpy = True
+    _U = np.uint64
+    _I = np.int64
+
+
+class _Fallback(Exception):
+    pass
+
+
+def _sx(u, n):
+    "signed (int64) view of the n-bit unsigned value(s) u"
+    s = np.asarray(u).astype(_I)
+    if n < 64:
+        b = _I(1 << (n - 1))
+        s = (s ^ b) - b
+    return s
+
+
+def _shl(x, c):
+    "left shift of uint64 x by uint64 count c (with count >= 64 giving 0)"
+    return np.where(c < _U(64), x << np.minimum(c, _U(63)), _U(0))
+
+
+def _shr(x, c):
+    "logical right shift of uint64 x by uint64 count c (with count >= 64 giving 0)"
+    return np.where(c < _U(64), x >> np.minimum(c, _U(63)), _U(0))
+
+
+def _sar(s, c):
+    "arithmetic right shift of int64 s by uint64 count c, as uint64"
+    return (s >> np.minimum(c, _U(63)).astype(_I)).astype(_U)
+
+
+# templates of binary operations, where l/r are the unsigned (uint64)
+# values of the operands, and vl/vr are their (possibly signed) values.
+_npops2 = {
+    expr.OP_ADD: "({l} + {r}) & {M}",
+    expr.OP_MIN: "({l} - {r}) & {M}",
+    expr.OP_MUL: "({l} * {r}) & {M}",
+    expr.OP_MUL2: "({vl} * {vr}).astype(_U) & {M}",
+    expr.OP_DIV: "({vl} // {vr}).astype(_U) & {M}",
+    expr.OP_MOD: "({vl} % {vr}).astype(_U) & {M}",
+    expr.OP_AND: "{l} & {r}",
+    expr.OP_OR: "{l} | {r}",
+    expr.OP_XOR: "{l} ^ {r}",
+    expr.OP_EQ: "({l} == {r}).astype(_U)",
+    expr.OP_NEQ: "({l} != {r}).astype(_U)",
+    expr.OP_LE: "({vl} <= {vr}).astype(_U)",
+    expr.OP_GE: "({vl} >= {vr}).astype(_U)",
+    expr.OP_LT: "({vl} < {vr}).astype(_U)",
+    expr.OP_GT: "({vl} > {vr}).astype(_U)",
+    # see expressions.ltu/geu: cst operands are compared as signed values.
+    expr.OP_LTU: "(_sx({l}, {n}) < _sx({r}, {n})).astype(_U)",
+    expr.OP_GEU: "(_sx({l}, {n}) >= _sx({r}, {n})).astype(_U)",
+    expr.OP_LSL: "_shl({l}, {r}) & {M}",
+    expr.OP_LSR: "_shr({l}, {r})",
+    expr.OP_ASR: "_sar(_sx({l}, {n}), {r}) & {M}",
+    expr.OP_ROR: "(_shr({l}, {r}) | _shl({l}, _U({n}) - {r})) & {M}",
+    expr.OP_ROL: "(_shl({l}, {r}) | _shr({l}, _U({n}) - {r})) & {M}",
+}
+
+# operations that rely on the values (vl, vr) of their operands:
+_npvalops = (
+    expr.OP_MUL2,
+    expr.OP_DIV,
+    expr.OP_MOD,
+    expr.OP_LE,
+    expr.OP_GE,
+    expr.OP_LT,
+    expr.OP_GT,
+)
+
+_npops1 = {
+    expr.OP_ADD: "{r}",
+    expr.OP_MIN: "(_U(0) - {r}) & {M}",
+    expr.OP_NOT: "(~{r}) & {M}",
+}
+
+
+def _value(t, x):
+    "returns the (code, type) tuple of the value of node x with unsigned code t"
+    if x.sf and not x._is_cmp:
+        return ("_sx(%s, %d)" % (t, x.size), "i")
+    if x.size < 64:
+        return ("(%s).astype(_I)" % t, "i")
+    return (t, "u")
+
+
+def _npcompile(e, inputs):
+    args = {}
+    code = []
+    for i, x in enumerate(inputs):
+        if x.size > 64:
+            raise _Fallback(x)
+        args.setdefault(x, "x%d" % i)
+
+    def isleaf(x):
+        if x._is_reg or x._is_mem or x._is_slc:
+            if x in args:
+                return True
+        return x._is_cst and isinstance(x, expr.cst)
+
+    consts = {}
+    # done maps id of translated nodes to a (name, value, type) tuple, see
+    # expressions.compile_expr for details.
+    done = {}
+    for x in expr.postorder(e, isleaf):
+        if x.size > 64:
+            raise _Fallback(x)
+        if x._is_cst and isinstance(x, expr.cst):
+            t = "c%d" % len(consts)
+            consts[t] = _U(x.v)
+            if x.value < (1 << 63):
+                consts["v" + t] = _I(x.value)
+                done[id(x)] = (t, "v" + t, "i")
+            else:
+                done[id(x)] = (t, t, "u")
+            continue
+        if (x._is_reg or x._is_mem or x._is_slc) and x in args:
+            t = args[x]
+            done[id(x)] = (t,) + _value(t, x)
+            continue
+        t = "t%d" % len(done)
+        M = "_U(%#x)" % x.mask
+        if x._is_slc:
+            c = "({} >> _U({})) & {}".format(done[id(x.x)][0], x.pos, M)
+        elif x._is_eqn:
+            r, vr, tr = done[id(x.r)]
+            if x.op.unary:
+                c = _npops1[x.op.symbol].format(r=r, M=M)
+            else:
+                l, vl, tl = done[id(x.l)]
+                if x.op.symbol in _npvalops:
+                    if tl is None or tl != tr:
+                        raise _Fallback(x)
+                    if x.op.symbol == expr.OP_MUL2 and x.l.size > 32:
+                        raise _Fallback(x)
+                c = _npops2[x.op.symbol].format(l=l, r=r, vl=vl, vr=vr, n=x.l.size, M=M)
+        elif x._is_tst:
+            tt = done[id(x.tst)][0]
+            l, vl, tl = done[id(x.l)]
+            r, vr, tr = done[id(x.r)]
+            c = "np.where(%s != 0, %s, %s)" % (tt, l, r)
+            if tl is None or tl != tr:
+                # the value of this node can only be used through its
+                # unsigned representation:
+                done[id(x)] = (t, None, None)
+            else:
+                v = "v%d" % len(done)
+                code.append("%s = np.where(%s != 0, %s, %s)" % (v, tt, vl, vr))
+                code.append("%s = %s" % (t, c))
+                done[id(x)] = (t, v, tl)
+                continue
+        else:
+            parts = x.parts.items()
+            c = " | ".join(
+                ["(%s << _U(%d))" % (done[id(p)][0], k[0]) for k, p in parts]
+            )
+        code.append("%s = %s" % (t, c))
+        if id(x) not in done:
+            done[id(x)] = (t,) + _value(t, x)
+    code.append("return %s" % done[id(e)][0])
+    src = "def f(%s):\n    " % (", ".join(["x%d" % i for i in range(len(inputs))]))
+    src += "\n    ".join(code)
+    ns = {"np": np, "_U": _U, "_I": _I, "_sx": _sx, "_shl": _shl, "_shr": _shr}
+    ns["_sar"] = _sar
+    ns.update(consts)
+    exec(src, ns)
+    return ns["f"]
+
+
+def compile_batch(e, inputs):
+    """
+    returns a function that computes the values of expression e for
+    numpy arrays of values of the given list of input locations.
+    The returned function takes one array per input location, with
+    all arrays of the same length N, and returns an array of N values.
+    Values are numpy uint64 unless e involves sizes above 64 bits, in
+    which case arrays of python integers are used (see expressions.compile_expr).
+
+    Note:
+        Contrarily to expressions.compile_expr, a division by zero is not an
+        error and results in 0.
+    """
+    if not has_numpy:
+        raise NotImplementedError("numpy package not found")
+    try:
+        f = _npcompile(e, inputs)
+    except _Fallback:
+        logger.verbose("batch compile: using python integers for %s" % e)
+        f = expr.compile_expr(e, inputs)
+        masks = [x.mask for x in inputs]
+
+        def fobj(*cols):
+            cols = [np.asarray(c, dtype=object) & m for (c, m) in zip(cols, masks)]
+            if len(cols) == 0:
+                return np.asarray(f(), dtype=object)
+            return np.frompyfunc(f, len(cols), 1)(*cols)
+
+        fobj.__doc__ = f.__doc__
+        return fobj
+
+    masks = [_U(x.mask) for x in inputs]
+
+    def fnp(*cols):
+        cols = [_column(c) & m for (c, m) in zip(cols, masks)]
+        with np.errstate(all="ignore"):
+            return np.asarray(f(*cols))
+
+    fnp.__doc__ = "batch compiled form of %s" % e
+    return fnp
+
+
+def _column(c):
+    "returns the uint64 array of (possibly negative) integers values in c"
+    if isinstance(c, np.ndarray) and c.dtype.kind in "iu":
+        return c.astype(_U)
+    return np.array([int(v) & 0xFFFFFFFFFFFFFFFF for v in c], dtype=_U)
+
+
+def evaluate(x, columns):
+    """
+    evaluates expression x (or all expressions of mapper x) for the input
+    values provided by columns, a dict associating every input location of
+    x to a sequence (list, numpy array, ...) of N integer values.
+
+    Returns the array of N values of x if x is an expression, or the list of
+    (location, array) tuples for every location of mapper x.
+    """
+    if isinstance(x, expr.exp):
+        return _evaluate(x, columns)
+    return [(loc, _evaluate(v, columns)) for (loc, v) in x]
+
+
+def _evaluate(e, columns):
+    inputs = []
+    for l in expr.locations_of(e):
+        if l not in columns and l._is_slc:
+            # sub-register location:
+            l = l.x
+        if l not in columns:
+            raise ValueError("no input values for %s" % l)
+        if l not in inputs:
+            inputs.append(l)
+    cols = [columns[l] for l in inputs]
+    N = len(cols[0]) if cols else len(next(iter(columns.values()), []))
+    res = compile_batch(e, inputs)(*cols)
+    if res.shape != (N,):
+        res = np.full(N, res[()], dtype=res.dtype)
+    return res
@@ -185,6 +185,7 @@ class blob_ptr(blob):
         if N < 0:
             N = -N
         self.dt.fields[0].count = N
+        self.dt.update_layout()
         self.variant = expr.et_vra
         return self
 
@@ -272,6 +273,7 @@ class blob_comp(blob):
         if N < 0:
             N = -N
         self.dt.fields[0].count = N
+        self.dt.update_layout()
         self.variant = expr.et_vra
         if N < float("Infinity"):
             if self.el._is_cst:
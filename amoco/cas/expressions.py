@@ -78,6 +78,22 @@ def _checkarg_slice(f):
     return checkarg_slice
 
 
+def _memoize_simplify(f):
+    def memoize_simplify(self, **kargs):
+        if kargs or conf.Cas.simplify_cache <= 0:
+            return f(self, **kargs)
+        k = scache.key(self)
+        if k is None:
+            return f(self)
+        r = scache.get(k)
+        if r is None:
+            r = f(self)
+            scache.put(k, r)
+        return r
+
+    return memoize_simplify
+
+
 # expression types:
 
 et_cst = 0x00001
@@ -357,14 +373,21 @@ class exp(object):
 
     # WARNING: comparison operators cmp returns a python bool
     # but any other operators always return an expression !
+    # note: interned expressions (see hashcons below) have their hash
+    # precomputed and stored in the hcons table.
     def __hash__(self):
-        return hash("%s" % self) + self.size
+        h = hcons.hashes.get(id(self))
+        if h is None:
+            h = hash("%s" % self) + self.size
+        return h
 
     # An expression defaults to False, and only bit1 will return True.
     def __bool__(self):
         return False
 
     def __eq__(self, n):
+        if self is n:
+            return bit1
         # we inline checkarg_numeric only here:
         if isinstance(n, int):
             n = cst(n, self.size)
@@ -376,7 +399,7 @@ class exp(object):
 
     @_checkarg_numeric
     def __ne__(self, n):
-        if hash(self) == hash(n):
+        if self is n or hash(self) == hash(n):
             return bit0
         return oper(OP_NEQ, self, n)
 
@@ -1194,6 +1217,7 @@ class comp(exp):
         res.sf = self.sf
         return res
 
+    @_memoize_simplify
     def simplify(self, **kargs):
         for nk, nv in iter(self.parts.items()):
             self.parts[nk] = nv.simplify(**kargs)
@@ -1581,7 +1605,10 @@ class slc(exp):
         return self.x.toks(**kargs) + subpart
 
     def __hash__(self):
-        return hash(self.raw())  # lgtm [py/equals-hash-mismatch]
+        h = hcons.hashes.get(id(self))
+        if h is None:
+            h = hash(self.raw())  # lgtm [py/equals-hash-mismatch]
+        return h
 
     def depth(self):
         return 2 * self.x.depth()
@@ -1716,7 +1743,10 @@ class tst(exp):
     # only rely on "syntaxic" features unless we have a solver.
     # see smt.py: tst_verify() for a SMT-based implementation.
     def verify(self, env):
-        flag = self.tst.eval(env)
+        if self.tst in hcons:
+            flag = _cached_of(hcons.evaluators, self.tst, evaluator)(env)
+        else:
+            flag = self.tst.eval(env)
         for c in env.conds:
             if c == flag:
                 flag = bit1
@@ -1826,6 +1856,7 @@ class op(exp):
         r.append((render.Token.Literal, ")"))
         return l + [(render.Token.Literal, self.op.symbol)] + r
 
+    @_memoize_simplify
     def simplify(self, **kargs):
         l = self.l.simplify(**kargs)
         r = self.r.simplify(**kargs)
@@ -1910,6 +1941,7 @@ class uop(exp):
         r.append((render.Token.Literal, ")"))
         return [(render.Token.Literal, "(%s" % self.op.symbol)] + r
 
+    @_memoize_simplify
     def simplify(self, **kargs):
         r = self.r.simplify(**kargs)
         if r._is_top:
@@ -2063,64 +2095,86 @@ class _operator(object):
 # ------------------
 
 
+def leaves_of(e, locations=False):
+    """
+    returns the list of all symbols (or locations if locations is True)
+    contained in expression e, in order of appearance and with repetitions.
+
+    Note:
+        The expression tree is walked iteratively (no recursion limit.)
+    """
+    res = []
+    stack = [e]
+    while stack:
+        e = stack.pop()
+        if e is None:
+            continue
+        if e._is_cst:
+            continue
+        if e._is_reg:
+            res.append(e)
+        elif e._is_mem:
+            if locations:
+                res.append(e)
+            else:
+                stack.append(e.a.base)
+        elif e._is_ptr:
+            if locations:
+                res.append(e)
+            else:
+                stack.append(e.base)
+        elif e._is_eqn:
+            stack.append(e.r)
+            stack.append(e.l)
+        elif e._is_tst:
+            stack.extend((e.r, e.l, e.tst))
+        elif e._is_slc:
+            stack.append(e.x)
+        elif e._is_cmp:
+            stack.extend(reversed(list(e.parts.values())))
+        elif e._is_vec:
+            stack.extend(reversed(e.l))
+        elif e._is_def:
+            raise ValueError(e)
+    return res
+
+
+def _cached_of(table, e, f):
+    # results are cached only for interned (immutable) expressions:
+    res = table.get(id(e), None)
+    if res is None:
+        res = f(e)
+        if id(e) in hcons.hashes:
+            table[id(e)] = res
+    return res
+
+
 def symbols_of(e):
-    "returns all symbols contained in expression e"
+    "returns the ordered set (as a list) of all symbols contained in expression e"
     if e is None:
         return []
-    if e._is_cst:
-        return []
-    if e._is_reg:
-        return [e]
-    if e._is_mem:
-        return symbols_of(e.a.base)
-    if e._is_ptr:
-        return symbols_of(e.base)
-    if e._is_eqn:
-        return symbols_of(e.l) + symbols_of(e.r)
-    if e._is_tst:
-        return sum([symbols_of(x) for x in (e.tst, e.l, e.r)], [])
-    if e._is_slc:
-        return symbols_of(e.x)
-    if e._is_cmp:
-        return sum([symbols_of(x) for x in e.parts.values()], [])
-    if e._is_vec:
-        return sum([symbols_of(x) for x in e.l], [])
-    if not e._is_def:
-        return []
-    raise ValueError(e)
+    res = _cached_of(hcons.symbols, e, lambda x: tuple(dict.fromkeys(leaves_of(x))))
+    return list(res)
 
 
 def locations_of(e):
-    "returns all locations contained in expression e"
+    "returns the ordered set (as a list) of all locations contained in expression e"
     if e is None:
         return []
-    if e._is_cst:
-        return []
-    if e._is_reg:
-        return [e]
-    if e._is_mem:
-        return [e]
-    if e._is_ptr:
-        return [e]
-    if e._is_eqn:
-        return locations_of(e.l) + locations_of(e.r)
-    if e._is_tst:
-        return sum([locations_of(x) for x in (e.tst, e.l, e.r)], [])
-    if e._is_slc:
-        return locations_of(e.x)
-    if e._is_cmp:
-        return sum([locations_of(x) for x in e.parts.values()], [])
-    if e._is_vec:
-        return sum([locations_of(x) for x in e.l], [])
-    if not e._is_def:
-        return []
-    raise ValueError(e)
+    res = _cached_of(
+        hcons.locations, e, lambda x: tuple(dict.fromkeys(leaves_of(x, True)))
+    )
+    return list(res)
 
 
 def complexity(e):
     "evaluate the complexity of expression e"
+    return _cached_of(hcons.complexity, e, _complexity)
+
+
+def _complexity(e):
     factor = e.prop if e._is_eqn else 1
-    return (e.depth() + len(symbols_of(e))) * factor
+    return (e.depth() + len(leaves_of(e))) * factor
 
 
 def eqn1_helpers(e, **kargs):
@@ -2468,3 +2522,436 @@ class vecw(top):
         sta, sto, stp = i.indices(self.size)
         l = [e[sta:sto] for e in self.l]
         return vecw(vec(l))
+
+
+# compiled evaluation:
+# --------------------
+
+
+def _sx(v, size):
+    "signed value of the size-bit unsigned integer v"
+    if v >> (size - 1):
+        return v - (1 << size)
+    return v
+
+
+_pyops2 = {
+    OP_ADD: "({l} + {r}) & {M}",
+    OP_MIN: "({l} - {r}) & {M}",
+    OP_MUL: "({l} * {r}) & {M}",
+    OP_MUL2: "({vl} * {vr}) & {M}",
+    OP_DIV: "({vl} // {vr}) & {M}",
+    OP_MOD: "({vl} % {vr}) & {M}",
+    OP_AND: "{l} & {r}",
+    OP_OR: "{l} | {r}",
+    OP_XOR: "{l} ^ {r}",
+    OP_EQ: "int({l} == {r})",
+    OP_NEQ: "int({l} != {r})",
+    OP_LE: "int({vl} <= {vr})",
+    OP_GE: "int({vl} >= {vr})",
+    OP_LT: "int({vl} < {vr})",
+    OP_GT: "int({vl} > {vr})",
+    # see ltu/geu: cst operands are compared as signed values.
+    OP_LTU: "int(_sx({l}, {n}) < _sx({r}, {n}))",
+    OP_GEU: "int(_sx({l}, {n}) >= _sx({r}, {n}))",
+    OP_LSL: "({l} << {vr}) & {M}",
+    OP_LSR: "({l} >> {vr}) & {M}",
+    OP_ASR: "(_sx({l}, {n}) >> {vr}) & {M}",
+    OP_ROR: "(({l} >> {vr}) | ({l} << ({n} - {vr}))) & {M}",
+    OP_ROL: "(({l} << {vr}) | ({l} >> ({n} - {vr}))) & {M}",
+}
+
+_pyops1 = {
+    OP_ADD: "{r}",
+    OP_MIN: "(-{r}) & {M}",
+    OP_NOT: "(~{r}) & {M}",
+}
+
+
+def subexps_of(e):
+    """
+    returns the list of (direct) sub-expressions of a slc, op, uop, tst or
+    comp expression e. Raises NotImplementedError for other expressions.
+    """
+    if e._is_slc:
+        return [e.x]
+    if e._is_eqn:
+        return [e.r] if e.op.unary else [e.l, e.r]
+    if e._is_tst:
+        return [e.tst, e.l, e.r]
+    if e._is_cmp:
+        return list(e.parts.values())
+    raise NotImplementedError("can't compile %s" % e)
+
+
+def postorder(e, isleaf):
+    """
+    iterates (without recursion) over all nodes of expression e
+    such that sub-expressions (see subexps_of) are always visited
+    before their parent node. Shared nodes are visited only once, and
+    nodes for which isleaf returns True are not walked into.
+    """
+    done = set()
+    stack = [(e, False)]
+    while stack:
+        x, ready = stack.pop()
+        if id(x) in done:
+            continue
+        if ready or isleaf(x):
+            done.add(id(x))
+            yield x
+            continue
+        stack.append((x, True))
+        stack.extend([(y, False) for y in subexps_of(x) if id(y) not in done])
+
+
+def compile_expr(e, inputs):
+    """
+    returns a python function that computes the value of expression e
+    (as an unsigned integer) from the integer values of the given list of
+    input locations. This function provides the same result as
+    e.eval(env).v with env mapping every input to a cst, but avoids
+    creating any expression.
+
+    Raises NotImplementedError if e depends on a location that is not
+    in inputs or on a non-concrete expression (top, vec, ext, ...)
+
+    Note:
+        Every node is translated to one local variable assignment,
+        so that nested or shared subtrees do not hit python's recursion
+        or nesting limits and are computed only once.
+    """
+    args = {}
+    code = []
+    for i, x in enumerate(inputs):
+        args.setdefault(x, "x%d" % i)
+        code.append("x%d &= %#x" % (i, x.mask))
+
+    def isleaf(x):
+        if x._is_reg or x._is_mem or x._is_slc:
+            if x in args:
+                return True
+        return x._is_cst and isinstance(x, cst)
+
+    # done maps id of translated nodes to a (name, value) tuple where
+    # name is the local holding the unsigned value of the node, and value
+    # is the python expression of the node's (possibly signed) value.
+    done = {}
+    for x in postorder(e, isleaf):
+        if x._is_cst and isinstance(x, cst):
+            done[id(x)] = ("%#x" % x.v, "%d" % x.value)
+            continue
+        if (x._is_reg or x._is_mem or x._is_slc) and x in args:
+            t = args[x]
+            done[id(x)] = (t, "_sx(%s, %d)" % (t, x.size) if x.sf else t)
+            continue
+        t = "t%d" % len(done)
+        v = None
+        if x._is_slc:
+            c = "({} >> {}) & {:#x}".format(done[id(x.x)][0], x.pos, x.mask)
+        elif x._is_eqn:
+            r, vr = done[id(x.r)]
+            if x.op.unary:
+                c = _pyops1[x.op.symbol].format(r=r, M="%#x" % x.mask)
+            else:
+                l, vl = done[id(x.l)]
+                c = _pyops2[x.op.symbol].format(
+                    l=l, r=r, vl=vl, vr=vr, n=x.l.size, M="%#x" % x.mask
+                )
+        elif x._is_tst:
+            tt = done[id(x.tst)][0]
+            l, vl = done[id(x.l)]
+            r, vr = done[id(x.r)]
+            c = "%s if %s else %s" % (l, tt, r)
+            v = "v%d" % len(done)
+            code.append("%s = %s if %s else %s" % (v, vl, tt, vr))
+        else:
+            c = " | ".join(
+                ["(%s << %d)" % (done[id(p)][0], k[0]) for k, p in x.parts.items()]
+            )
+        code.append("%s = %s" % (t, c))
+        if v is None:
+            v = "_sx(%s, %d)" % (t, x.size) if (x.sf and not x._is_cmp) else t
+        done[id(x)] = (t, v)
+    code.append("return %s" % done[id(e)][0])
+    src = "def f(%s):\n    " % (", ".join(["x%d" % i for i in range(len(inputs))]))
+    src += "\n    ".join(code)
+    ns = {"_sx": _sx}
+    exec(src, ns)
+    f = ns["f"]
+    f.__doc__ = "compiled form of %s" % e
+    return f
+
+
+def evaluator(e):
+    """
+    returns a function that evaluates expression e in a given mapper env,
+    using the compiled form of e when all its input locations are concrete
+    values in env (and e.eval(env) otherwise.)
+
+    Note:
+        Register inputs are read directly from the mapper, but memory inputs
+        are still evaluated as expressions and the result is returned as a
+        new cst. Use compile_expr to avoid creating any expression.
+    """
+    locs = locations_of(e)
+    try:
+        f = compile_expr(e, locs)
+    except NotImplementedError:
+        f = None
+    regs = [l._is_reg for l in locs]
+
+    def evaluate(env):
+        if f is not None:
+            vals = [env.R(l) if r else l.eval(env) for l, r in zip(locs, regs)]
+            if all((v._is_cst and isinstance(v, cst) for v in vals)):
+                return cst(f(*(v.v for v in vals)), e.size)
+        return e.eval(env)
+
+    return evaluate
+
+
+# simplification cache:
+# ----------------------
+
+
+class lrucache(object):
+    """
+    lrucache is a bounded (least recently used) cache for which the maximum
+    number of entries is given by the conf.Cas parameter named by size
+    (or by the parameter of another conf section if provided.)
+
+    Attributes:
+        size (str): name of the conf.Cas parameter that gives the cache size.
+        section: the conf section of the size parameter (defaults to conf.Cas.)
+        cache (dict): keys to cached values, from least to most recently used.
+        hits (int): number of values found in the cache.
+        misses (int): number of values not found in the cache.
+    """
+
+    def __init__(self, size, section=None):
+        self.size = size
+        self.section = section or conf.Cas
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.cache)
+
+    def clear(self):
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, k):
+        try:
+            v = self.cache.pop(k)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.cache[k] = v
+        return v
+
+    def put(self, k, v):
+        self.cache[k] = v
+        n = getattr(self.section, self.size)
+        while len(self.cache) > n:
+            del self.cache[next(iter(self.cache))]
+
+
+class simplifycache(lrucache):
+    """
+    simplifycache is the lrucache of simplified expressions used by
+    op, uop and comp simplify methods when conf.Cas.simplify_cache
+    (the cache size) is not 0.
+
+    Note:
+        The key of an expression is its hash-consing structural key (which
+        only relies on the identity of its interned child nodes) completed
+        with the current complexity threshold. Expressions with child nodes
+        that are not interned have no key (they can be updated in-place) and
+        are not cached.
+        Since a cached result is shared by all expressions with the same key,
+        comp results are returned as copies (to allow in-place updates) and
+        the sign flag of results is restored on every hit.
+    """
+
+    def key(self, e):
+        k = hcons.key(e)
+        if k is None:
+            return None
+        return (k, conf.Cas.complexity)
+
+    def get(self, k):
+        v = super().get(k)
+        if v is None:
+            return None
+        r, sf = v
+        r.sf = sf
+        if r._is_cmp:
+            r = r.copy()
+        return r
+
+    def put(self, k, r):
+        super().put(k, (r.copy() if r._is_cmp else r, r.sf))
+
+
+scache = simplifycache("simplify_cache")
+
+
+# hash-consing:
+# --------------
+
+
+class hashcons(object):
+    """
+    hashcons is an (opt-in) factory of interned expressions: structurally
+    equal cst, reg, mem, ptr, op, uop, slc, comp and tst nodes are reduced
+    to a single shared object, for which the hash value is computed only
+    once and for which equality is decided by identity.
+
+    Attributes:
+        nodes (dict): structural keys to interned nodes.
+        hashes (dict): id of interned nodes to their precomputed hash.
+        symbols (dict): id of interned nodes to their cached symbols_of.
+        locations (dict): id of interned nodes to their cached locations_of.
+        complexity (dict): id of interned nodes to their cached complexity.
+        evaluators (dict): id of interned nodes to their cached evaluator.
+        hits (int): number of intern requests that found an existing node.
+        misses (int): number of intern requests that added a new node.
+
+    Note:
+        Interned expressions are shared and thus must be treated as immutable.
+        Child nodes being interned first, the structural key of a node only
+        relies on the identity of its children so that interning a node
+        (lookup) does not require rendering or hashing its whole subtree.
+        The hcons instance below is used by mappers if conf.Cas.hashcons
+        is True.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.hashes = {}
+        self.symbols = {}
+        self.locations = {}
+        self.complexity = {}
+        self.evaluators = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, e):
+        return id(e) in self.hashes
+
+    def __call__(self, e):
+        return self.intern(e)
+
+    def clear(self):
+        "forget all interned nodes (nodes still in use remain valid expressions)"
+        self.nodes.clear()
+        self.hashes.clear()
+        self.symbols.clear()
+        self.locations.clear()
+        self.complexity.clear()
+        self.evaluators.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, e):
+        """
+        returns the structural key of expression e (with its child nodes
+        already interned) or None if e can't be interned.
+        """
+        t = type(e)
+        if t is cst:
+            return (t, e.v, e.size, e.sf)
+        if t is sym:
+            return (t, e.ref, e.v, e.size, e.sf)
+        if t is reg:
+            return (t, e.ref, e.size, e.etype)
+        if t is ptr:
+            if not isinstance(e.disp, int):
+                return None
+            for x in (e.base, e.seg):
+                if x is not None and id(x) not in self.hashes:
+                    return None
+            return (t, id(e.base), id(e.seg), e.disp)
+        if t is mem:
+            if e.mods or id(e.a) not in self.hashes:
+                return None
+            return (t, id(e.a), e.size, e.endian, e.sf)
+        if t is slc:
+            if id(e.x) not in self.hashes:
+                return None
+            return (t, id(e.x), e.pos, e.size, e.ref, e.sf)
+        if t is op:
+            if id(e.l) not in self.hashes or id(e.r) not in self.hashes:
+                return None
+            return (t, e.op.symbol, id(e.l), id(e.r), e.sf)
+        if t is uop:
+            if id(e.r) not in self.hashes:
+                return None
+            return (t, e.op.symbol, id(e.r), e.sf)
+        if t is tst:
+            for x in (e.tst, e.l, e.r):
+                if id(x) not in self.hashes:
+                    return None
+            return (t, id(e.tst), id(e.l), id(e.r), e.sf)
+        if t is comp:
+            parts = []
+            for k in sorted(e.parts.keys()):
+                p = e.parts[k]
+                if id(p) not in self.hashes:
+                    return None
+                parts.append((k, id(p)))
+            return (t, e.size, e.sf, tuple(parts))
+        return None
+
+    def intern(self, e):
+        """
+        returns the interned node structurally equal to e. Child nodes
+        of e are interned first and replaced in e by their interned
+        representative.
+        """
+        if id(e) in self.hashes:
+            return e
+        t = type(e)
+        if t is ptr:
+            e.base = self.intern(e.base)
+            if isinstance(e.seg, exp):
+                e.seg = self.intern(e.seg)
+        elif t is mem:
+            e.a = self.intern(e.a)
+        elif t is slc:
+            e.x = self.intern(e.x)
+        elif t is op:
+            e.l = self.intern(e.l)
+            e.r = self.intern(e.r)
+        elif t is uop:
+            e.r = self.intern(e.r)
+        elif t is tst:
+            e.tst = self.intern(e.tst)
+            e.l = self.intern(e.l)
+            e.r = self.intern(e.r)
+        elif t is comp:
+            for k, p in e.parts.items():
+                e.parts[k] = self.intern(p)
+        k = self.key(e)
+        if k is None:
+            return e
+        x = self.nodes.get(k, None)
+        if x is not None:
+            self.hits += 1
+            return x
+        self.misses += 1
+        h = hash(e)
+        self.nodes[k] = e
+        self.hashes[id(e)] = h
+        return e
+
+
+hcons = hashcons()
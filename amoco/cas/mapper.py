@@ -91,7 +91,8 @@ class mapper(object):
     def outputs(self):
         "list image locations (modified in the mapping)"
         L = []
-        for l in sum([expr.locations_of(e) for e in self.__map], []):
+        locs = (l for e in self.__map for l in expr.locations_of(e))
+        for l in locs:
             if l._is_reg and (l.etype & (regtype.PC | regtype.FLAGS)):
                 continue
             if l._is_ptr:
@@ -274,6 +275,8 @@ class mapper(object):
             oldr = self.__map.get(loc, None)
             if oldr is not None and oldr.size > r.size:
                 r = expr.composer([r, oldr[r.size : oldr.size]])
+            if conf.Cas.hashcons:
+                r = expr.hcons(r)
             if k._is_mem:
                 endian = k.endian
             else:
@@ -290,8 +293,13 @@ class mapper(object):
             if r._is_reg:
                 r = expr.comp(loc.size)
                 r[0 : loc.size] = loc
+            elif r._is_cmp and r in expr.hcons:
+                # interned nodes are shared, update a copy:
+                r = r.copy()
             pos = k.pos if k._is_slc else 0
             r[pos : pos + k.size] = v.simplify()
+            if conf.Cas.hashcons:
+                r = expr.hcons(r)
             self.__map[loc] = r
 
     def update(self, instr):
@@ -326,6 +334,22 @@ class mapper(object):
     def restruct(self):
         self.__Mem.restruct()
 
+    def fork(self):
+        """return a copy of the current mapper, sharing its memory with
+        the current mapper until written (see MemoryMap.copy)"""
+        m = mapper(cur=self.cur)
+        for loc, v in self.__map.items():
+            # composed registers' values are updated in-place by setitem:
+            dict.__setitem__(m.__map, loc, v.copy() if v._is_cmp else v)
+        m.__map.lastw = self.__map.lastw
+        m.__map.delayed = self.__map.delayed
+        if hasattr(self.__map, "hist"):
+            m.__map.hist = self.__map.hist
+        m.setmemory(self.__Mem.copy())
+        m.conds = list(self.conds)
+        m.meminit0 = self.meminit0
+        return m
+
     def eval(self, m):
         """return a new mapper instance where all input locations have
         been replaced by there corresponding values in m.
@@ -13,6 +13,9 @@ Currently, only z3 is supported. This module allows to translate
 any amoco expression into its z3 equivalent formula, as well as
 getting the z3 solver results back as :class:`cas.mapper.mapper`
 instances.
+
+Solver queries can also be cached in a persistent sqlite database
+(see :class:`querydb`) by setting the conf.Cas.smt_db filename.
 """
 
 from amoco.logger import Log
@@ -20,8 +23,13 @@ from amoco.logger import Log
 logger = Log(__name__)
 logger.debug("loading module")
 
+import sqlite3
+import hashlib
+import json
+
+from amoco.config import conf
 from . import expressions as expr
-from .mapper import model_to_mapper
+from .mapper import mapper, model_to_mapper
 
 try:
     import z3
@@ -47,52 +55,174 @@ else:
                              with a size of 1 bit.
             tactics (list, None): optional list of z3 tactics.
             timeout (int, None): optional timeout value for the z3 solver.
+
+        Note:
+            The get_model and get_mapper methods first drop the formulas that
+            are trivially true and return None if some formulas are trivially
+            false (see :func:`precheck`). The get_mapper method then solves
+            each independent group of formulas (see :func:`independent`)
+            separately, caching results of each group in gcache.
+            If conf.Cas.smt_db is set, the check method and the solving of
+            each group first look for the results in the persistent queries
+            cache.
         """
 
         def __init__(self, eqns=None, tactics=None, timeout=None):
             self.eqns = []
+            self.formulas = []
             self.locs = []
-            if tactics:
-                s = z3.TryFor(z3.Then(*tactics), 1000).solver()
+            self.scopes = []
+            self._ctr = 0
+            self.tactics = tactics
+            self.timeout = timeout
+            self.solver = self.new_solver()
+            if eqns:
+                self.add(eqns)
+
+        def new_solver(self):
+            "returns a new z3 solver with the tactics and timeout of this solver"
+            if self.tactics:
+                s = z3.TryFor(z3.Then(*self.tactics), 1000).solver()
             else:
                 s = z3.Solver()
-            if timeout:
+            if self.timeout:
                 s.set(timeout=1000)
-            self.solver = s
-            if eqns:
-                self.add(eqns)
-            self._ctr = 0
+            return s
 
         def add(self, eqns):
             "add input list of 'op' expressions to the solver"
             for e in eqns:
+                z = cast_z3_bool(e, self)
                 self.eqns.append(e)
-                self.solver.add(cast_z3_bool(e, self))
+                self.formulas.append(z)
+                self.solver.add(z)
                 self.locs.extend(expr.locations_of(e))
 
+        def push(self):
+            "open a new scope: formulas added from now on are removed by pop()"
+            self.solver.push()
+            self.scopes.append((len(self.eqns), len(self.locs)))
+
+        def pop(self):
+            "remove all formulas added since the last push()"
+            if not self.scopes:
+                raise ValueError("pop without push")
+            n, nl = self.scopes.pop()
+            self.solver.pop()
+            del self.eqns[n:]
+            del self.formulas[n:]
+            del self.locs[nl:]
+
         def check(self):
             "check for satisfiability of current formulas"
+            db = querydb.current()
+            if db is not None:
+                return self.query(db)[0]
             logger.verbose("z3 check...")
             return self.solver.check()
 
-        def get_model(self, eqns=None):
-            "If satisfiable, returns a z3 *model* for the solver (with added eqns)"
+        def groups(self, query=None):
+            """
+            returns the list of independent groups of indices of the solver's
+            formulas, or None if the formulas are trivially not satisfiable.
+            If a list of query expressions is provided, these are added to
+            the solver and only the groups that involve the query are returned.
+            """
+            n = len(self.eqns)
+            if query is not None:
+                self.add(query)
+            eqns = precheck(self.eqns)
+            if eqns is None:
+                return None
+            index = {id(e): i for i, e in enumerate(self.eqns)}
+            G = [[index[id(e)] for e in g] for g in independent(eqns)]
+            if query is not None:
+                G = [g for g in G if g[-1] >= n]
+            return G
+
+        def get_model(self, eqns=None, query=None):
+            """
+            If satisfiable, returns a z3 *model* for the solver (with added eqns).
+            If a list of query expressions is provided, the model only satisfies
+            the query and the solver's formulas that are relevant to the query
+            (the query is added to the solver.)
+            """
             if eqns is not None:
                 self.add(eqns)
-            if self.check() == z3.sat:
-                r = self.solver.model()
+            G = self.groups(query)
+            if G is None:
+                return None
+            s = self.solver
+            if query is not None:
+                s = self.new_solver()
+                s.add(*[self.formulas[i] for g in G for i in sorted(g)])
+            logger.verbose("z3 check...")
+            if s.check() == z3.sat:
+                r = s.model()
                 return r
             return None
 
-        def get_mapper(self, eqns=None):
+        def get_mapper(self, eqns=None, query=None):
             """
             If satisfiable,
-            returns an amoco mapper for the current solver (with added eqns)
+            returns an amoco mapper for the current solver (with added eqns).
+            If a list of query expressions is provided, the mapper only
+            satisfies the query and the solver's formulas that are relevant
+            to the query (the query is added to the solver.) The solver's
+            formulas are otherwise assumed to be satisfiable (as is the case
+            for a mapper's path conditions) and their locations are not
+            part of the returned mapper.
             """
-            r = self.get_model(eqns)
-            if r is not None:
-                return model_to_mapper(r, self.locs)
-            return None
+            if eqns is not None:
+                self.add(eqns)
+            G = self.groups(query)
+            if G is None:
+                return None
+            db = querydb.current()
+            m = mapper()
+            for g in G:
+                locs, r = self.get_group(g, db)
+                if r is None:
+                    return None
+                for l in sorted(locs, key=lambda l: l._is_mem):
+                    v = r(l)
+                    if v._is_cst:
+                        m[l] = v
+            return m
+
+        def get_group(self, g, db=None):
+            """
+            returns the locations of the group g of formulas' indices and the
+            mapper that satisfies these formulas (or None if not satisfiable),
+            from gcache if possible, from the querydb db if provided or from
+            z3 otherwise.
+            """
+            fs = [self.formulas[i] for i in g]
+            # z3 formulas are hash-consed: their ids are structural keys
+            # (as long as formulas are kept alive, here by gcache.)
+            k = tuple([f.get_id() for f in fs])
+            if conf.Cas.smt_group_cache > 0:
+                r = gcache.get(k)
+                if r is not None:
+                    return r[1:]
+            locs = []
+            for i in g:
+                locs.extend(expr.locations_of(self.eqns[i]))
+            locs = list(dict.fromkeys(locs))
+            s = self.new_solver()
+            s.add(*fs)
+            m = _query(s, locs, db)[1]
+            if conf.Cas.smt_group_cache > 0:
+                gcache.put(k, (fs, locs, m))
+            return (locs, m)
+
+        def query(self, db):
+            """
+            returns the (z3 check result, mapper) tuple for current formulas,
+            from the querydb cache if possible or from z3 otherwise (in which
+            case the sat/unsat result is stored in the cache.)
+            """
+            return _query(self.solver, list(dict.fromkeys(self.locs)), db)
 
         @property
         def ctr(self):
@@ -104,8 +234,350 @@ else:
     has_solver = True
 
 
+class z3cache(expr.lrucache):
+    """
+    z3cache is the lrucache of z3 translations of expressions, shared by
+    all solvers and all calls to to_smtlib when conf.Cas.smt_cache
+    (the cache size) is not 0.
+
+    Attributes:
+        fresh (int): number of translations that introduced new z3 variables.
+
+    Note:
+        Only translations of interned expressions (see expressions.hashcons)
+        are cached, keyed by their structural hash-consing key (the cache
+        keeps a reference to the expression). Expressions that are not
+        interned can be updated in-place and thus are never cached, nor are
+        comp expressions and translations that rely on new z3 variables
+        (top or vec expressions.)
+    """
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.fresh = 0
+
+
+zcache = z3cache("smt_cache")
+
+
+def _cached_z3(f):
+    def cached_z3(e, slv=None):
+        if conf.Cas.smt_cache <= 0 or e._is_cmp or e not in expr.hcons:
+            return f(e, slv)
+        k = expr.hcons.key(e)
+        v = zcache.get(k)
+        if v is not None:
+            return v[1]
+        fresh = zcache.fresh
+        res = f(e, slv)
+        if zcache.fresh == fresh:
+            zcache.put(k, (e, res))
+        return res
+
+    cached_z3.__doc__ = f.__doc__
+    return cached_z3
+
+
+class querydb(object):
+    """
+    querydb is a persistent cache of solver queries, stored in a sqlite
+    database. Queries are keyed by the canonical serialization of the z3
+    formulas of the solver (see :func:`canonical`) and are associated to
+    their sat/unsat result and, if sat, to their model (the values of the
+    solver's locations, as a mapper.)
+
+    Arguments:
+        filename (str): the sqlite database filename.
+        size (int): max number of queries kept in the database. When this
+                    size is exceeded, least recently used queries are removed.
+
+    Attributes:
+        hits (int): number of queries found in the database.
+        misses (int): number of queries not found in the database.
+    """
+
+    _current = None
+
+    def __init__(self, filename, size=100000):
+        self.filename = filename
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(filename)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS queries "
+            "(key TEXT PRIMARY KEY, sat INTEGER, model TEXT, used INTEGER)"
+        )
+        self.db.commit()
+        self.tick = self.db.execute("SELECT MAX(used) FROM queries").fetchone()[0] or 0
+        self.count = self.db.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+
+    @classmethod
+    def current(cls):
+        "returns the querydb instance associated to conf.Cas.smt_db (or None)"
+        filename = conf.Cas.smt_db
+        if not filename:
+            return None
+        db = cls._current
+        if db is None or db.filename != filename:
+            db = cls._current = cls(filename)
+        db.size = conf.Cas.smt_db_size
+        return db
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def hitrate(self):
+        "ratio of queries found in the database"
+        n = self.hits + self.misses
+        return self.hits / n if n > 0 else 0.0
+
+    def get(self, key):
+        """
+        returns the (sat, model) tuple for the given query key or None.
+        (The update of the query's last use is committed by the next put.)
+        """
+        r = self.db.execute("SELECT sat, model FROM queries WHERE key=?", (key,))
+        r = r.fetchone()
+        if r is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.tick += 1
+        self.db.execute("UPDATE queries SET used=? WHERE key=?", (self.tick, key))
+        return (bool(r[0]), json.loads(r[1]) if r[1] else None)
+
+    def put(self, key, sat, model):
+        "stores the sat result and model (dict) of the given query key"
+        self.tick += 1
+        row = (int(sat), json.dumps(model) if model else None, self.tick, key)
+        r = self.db.execute("UPDATE queries SET sat=?, model=?, used=? WHERE key=?", row)
+        if r.rowcount == 0:
+            self.db.execute(
+                "INSERT INTO queries (sat, model, used, key) VALUES (?,?,?,?)", row
+            )
+            self.count += 1
+        n = self.count - self.size
+        if n > 0:
+            r = self.db.execute(
+                "DELETE FROM queries WHERE key IN "
+                "(SELECT key FROM queries ORDER BY used LIMIT ?)",
+                (n,),
+            )
+            self.count -= r.rowcount
+        self.db.commit()
+
+    def clear(self):
+        "removes all queries from the database and resets counters"
+        self.db.execute("DELETE FROM queries")
+        self.db.commit()
+        self.count = 0
+        self.hits = self.misses = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+        if querydb._current is self:
+            querydb._current = None
+
+
+def _query(s, locs, db=None):
+    """
+    returns the (z3 check result, mapper of locs) tuple for the formulas of
+    z3 solver s, from the querydb db if provided and possible or from z3
+    otherwise (in which case the sat/unsat result is stored in db.)
+    """
+    if db is not None:
+        key, subst = canonical(s.assertions())
+        q = db.get(key)
+        if q is not None:
+            sat, model = q
+            if not sat:
+                return (z3.unsat, None)
+            return (z3.sat, _model_load(model, locs, subst))
+    logger.verbose("z3 check...")
+    r = s.check()
+    m = None
+    if r == z3.sat:
+        zm = s.model()
+        m = model_to_mapper(zm, locs)
+        if db is not None:
+            db.put(key, True, _model_dump(zm, locs, subst))
+    elif r == z3.unsat and db is not None:
+        db.put(key, False, None)
+    return (r, m)
+
+
+def canonical(formulas):
+    """
+    returns the canonical key of the given list of z3 formulas, where all
+    uninterpreted constants are renamed in order of first appearance, and
+    the list of (constant, renamed) z3 substitutions.
+    """
+    seen = set()
+    subst = []
+    for f in formulas:
+        todo = [f]
+        while todo:
+            x = todo.pop()
+            if x.get_id() in seen:
+                continue
+            seen.add(x.get_id())
+            if z3.is_const(x) and x.decl().kind() == z3.Z3_OP_UNINTERPRETED:
+                subst.append((x, z3.Const("_v%d" % len(subst), x.sort())))
+            else:
+                todo.extend(reversed(x.children()))
+    h = hashlib.sha256()
+    for f in formulas:
+        h.update(z3.substitute(f, *subst).sexpr().encode())
+        h.update(b"\n")
+    return (h.hexdigest(), subst)
+
+
+def _model_dump(r, locs, subst):
+    "returns the dict of canonical locations' values in z3 model r"
+    model = {}
+    for l in locs:
+        z = l.to_smtlib()
+        x = r.eval(z)
+        if z3.is_bv_value(x):
+            model[z3.substitute(z, *subst).sexpr()] = x.as_long()
+    return model
+
+
+def _model_load(model, locs, subst):
+    "returns the mapper of given locs with their values in canonical model"
+    m = mapper()
+    for l in sorted(locs, key=lambda l: l._is_mem):
+        v = model.get(z3.substitute(l.to_smtlib(), *subst).sexpr())
+        if v is not None:
+            m[l] = expr.cst(v, l.size)
+    return m
+
+
+def vars_of(e):
+    """
+    returns the set of names of the z3 variables involved in the translation
+    of expression e, where all memory expressions depend on the z3 memory
+    array "M" (and on the symbols of their addresses.)
+    """
+    res = {r.ref for r in expr.symbols_of(e)}
+    if any(l._is_mem for l in expr.locations_of(e)):
+        res.add("M")
+    return res
+
+
+def independent(eqns):
+    """
+    returns the list of independent groups (lists) of expressions in eqns,
+    such that expressions of different groups share no z3 variable.
+    Groups are ordered by first appearance and keep the order of eqns.
+    """
+    groups = []
+    for i, e in enumerate(eqns):
+        v = vars_of(e)
+        g = [v, [i]]
+        rest = []
+        for gg in groups:
+            if gg[0] & v:
+                g[0] |= gg[0]
+                g[1].extend(gg[1])
+            else:
+                rest.append(gg)
+        rest.append(g)
+        groups = rest
+    groups = [sorted(g[1]) for g in groups]
+    groups.sort()
+    return [[eqns[i] for i in g] for g in groups]
+
+
+def relevant(eqns, query):
+    """
+    returns the list of expressions of eqns that belong to the independent
+    groups of the query expressions (ie. the list of eqns that can possibly
+    constrain the variables of the query.)
+    """
+    v = set()
+    for q in query:
+        v |= vars_of(q)
+    for g in independent(list(eqns)):
+        gv = set()
+        for e in g:
+            gv |= vars_of(e)
+        if gv & v:
+            v |= gv
+    return [e for e in eqns if vars_of(e) & v]
+
+
+_precheck_ops = (
+    expr.OP_EQ,
+    expr.OP_NEQ,
+    expr.OP_LT,
+    expr.OP_LE,
+    expr.OP_GT,
+    expr.OP_GE,
+)
+
+
+def precheck(eqns):
+    """
+    cheap pre-solver check of conjunctions of expressions: returns the list of
+    eqns without its constant true expressions, or None if eqns are trivially
+    not satisfiable, ie. if some expression is the constant 0 or if conditions
+    of the form (x op cst) lead to an empty (signed) interval of values for x,
+    where x is a register or a slice of a register.
+    """
+    res = []
+    dom = {}
+    for e in eqns:
+        if e._is_cst:
+            if e.v == 0:
+                return None
+            continue
+        res.append(e)
+        if not (e._is_eqn and e.op.symbol in _precheck_ops):
+            continue
+        if e.l is None or not e.r._is_cst:
+            continue
+        # intervals are keyed structurally (expressions' equality relies on
+        # their rendering, which is ambiguous for memory locations):
+        x = e.l
+        if x._is_reg:
+            k = (x.ref, x.size)
+        elif x._is_slc and x.x._is_reg:
+            k = (x.x.ref, x.x.size, x.pos, x.size)
+        else:
+            continue
+        n = e.r.size
+        c = e.r.v
+        if c >> (n - 1):
+            c -= 1 << n
+        d = dom.setdefault(k, [-(1 << (n - 1)), (1 << (n - 1)) - 1, set()])
+        op = e.op.symbol
+        if op == expr.OP_EQ:
+            d[0], d[1] = max(d[0], c), min(d[1], c)
+        elif op == expr.OP_NEQ:
+            d[2].add(c)
+        elif op == expr.OP_LT:
+            d[1] = min(d[1], c - 1)
+        elif op == expr.OP_LE:
+            d[1] = min(d[1], c)
+        elif op == expr.OP_GT:
+            d[0] = max(d[0], c + 1)
+        elif op == expr.OP_GE:
+            d[0] = max(d[0], c)
+        if d[0] > d[1] or (d[0] == d[1] and d[0] in d[2]):
+            return None
+    return res
+
+
+gcache = expr.lrucache("smt_group_cache")
+
+
 def newvar(pfx, e, slv):
     "return a new z3 BitVec of size e.size, with name prefixed by slv argument"
+    zcache.fresh += 1
     s = "" if slv is None else "%d" % slv.ctr
     return z3.BitVec("%s%s" % (pfx, s), e.size)
 
@@ -200,14 +672,15 @@ def tst_verify(e, env):
     t = e.tst.eval(env).simplify()
     s = solver(tactics=["simplify", "elim-term-ite", "solve-eqs", "smt"])
     zt = cast_z3_bool(t, s)
-    for c in env.conds:
+    # only path conditions that share variables with t are relevant:
+    for c in relevant(env.conds, [t]):
         s.solver.add(cast_z3_bool(c, s))
-    s.solver.push()
+    s.push()
     s.solver.add(zt)
-    rtrue = s.solver.check()
-    s.solver.pop()
+    rtrue = s.check()
+    s.pop()
     s.solver.add(z3.Not(zt))
-    rfalse = s.solver.check()
+    rfalse = s.check()
     if rtrue == z3.sat and rfalse == z3.unsat:
         return expr.bit1
     if rtrue == z3.unsat and rfalse == z3.sat:
@@ -266,6 +739,8 @@ def vec_to_z3(e, slv=None):
     "translate vec expression into z3 Or form"
     # flatten vec:
     e.simplify()
+    # vec translations depend on the solver, don't cache them:
+    zcache.fresh += 1
     # translate vec list to z3:
     beqs = []
     for x in e.l:
@@ -297,17 +772,17 @@ def _bool2bv1(z):
 
 if has_solver:
     expr.top.to_smtlib = top_to_z3
-    expr.cst.to_smtlib = cst_to_z3
-    expr.cfp.to_smtlib = cfp_to_z3
-    expr.reg.to_smtlib = reg_to_z3
+    expr.cst.to_smtlib = _cached_z3(cst_to_z3)
+    expr.cfp.to_smtlib = _cached_z3(cfp_to_z3)
+    expr.reg.to_smtlib = _cached_z3(reg_to_z3)
     expr.comp.to_smtlib = comp_to_z3
-    expr.slc.to_smtlib = slc_to_z3
-    expr.ptr.to_smtlib = ptr_to_z3
-    expr.mem.to_smtlib = mem_to_z3
-    expr.tst.to_smtlib = tst_to_z3
+    expr.slc.to_smtlib = _cached_z3(slc_to_z3)
+    expr.ptr.to_smtlib = _cached_z3(ptr_to_z3)
+    expr.mem.to_smtlib = _cached_z3(mem_to_z3)
+    expr.tst.to_smtlib = _cached_z3(tst_to_z3)
     expr.tst.verify = tst_verify
-    expr.op.to_smtlib = op_to_z3
-    expr.uop.to_smtlib = uop_to_z3
+    expr.op.to_smtlib = _cached_z3(op_to_z3)
+    expr.uop.to_smtlib = _cached_z3(uop_to_z3)
     expr.vec.to_smtlib = vec_to_z3
     expr.vecw.to_smtlib = top_to_z3
 
@@ -260,6 +260,16 @@ class graph(Graph):
         self.overlay = None
         super(graph, self).__init__(*args, **kargs)
 
+    def __add_vertex(self, v):
+        # Graph.add_vertex looks for v in all components, but nodes are
+        # hashed by identity and a node with no component is not in the graph:
+        if v.c is None:
+            g = self.component_class(directed=self.directed)
+            v = g.add_single_vertex(v)
+            self.C.append(g)
+            return v
+        return super(graph, self).add_vertex(v)
+
     def __cut_add_vertex(self, v, mz, vaddr, mo):
         oldnode = mo.data.val
         if oldnode == v:
@@ -270,14 +280,14 @@ class graph(Graph):
         if not cutdone:
             if mz is self.overlay:
                 logger.warning("double overlay block at %s" % vaddr)
-                v = super(graph, self).add_vertex(v)
+                v = self.__add_vertex(v)
                 v.misc["double-overlay"] = 1
                 return v
             overlay = self.overlay or MemoryZone()
             return self.add_vertex(v, support=overlay)
         else:
             oldnode.misc["cut"] = cutdone
-            v = super(graph, self).add_vertex(v)  # ! avoid recursion for add_edge
+            v = self.__add_vertex(v)  # ! avoid recursion for add_edge
             mz.write(vaddr, v)
             self.add_edge(link(oldnode, v))
             for n in oldnode.N(+1):
@@ -287,7 +297,7 @@ class graph(Graph):
 
     def add_vertex(self, v, support=None):
         if v.data._is_func:
-            return super(graph, self).add_vertex(v)
+            return self.__add_vertex(v)
         # insert block:
         vaddr = v.data.address
         if support is None:
@@ -319,11 +329,11 @@ class graph(Graph):
                             if support is self.overlay:
                                 # we already are in overlay...
                                 logger.warning("double overlay block at %s" % vaddr)
-                                v = super(graph, self).add_vertex(v)
+                                v = self.__add_vertex(v)
                                 v.misc["double-overlay"] = 1
                                 return v
                             support = self.overlay or MemoryZone()
-        v = super(graph, self).add_vertex(v)  # before support write !!
+        v = self.__add_vertex(v)  # before support write !!
         support.write(vaddr, v)
         return v
 
@@ -28,6 +28,12 @@ Attributes:
             - 'complexity' threshold for expressions (default 100). See `cas.expressions` for details.
             - 'memtrace' store memory writes as mapper items if True (default).
             - 'unicode' will use math unicode symbols for expressions operators if True (default False).
+            - 'hashcons' will intern mapper's expressions (see `cas.expressions.hashcons`) if True (default False).
+            - 'simplify_cache' size of the simplified expressions cache (default 0, ie. no cache).
+            - 'smt_cache' size of the z3 translations cache of interned expressions (default 4096). See `cas.smt` for details.
+            - 'smt_group_cache' size of the solved groups of constraints cache (default 1024).
+            - 'smt_db' filename of the persistent solver queries cache (default "", ie. no cache).
+            - 'smt_db_size' max number of queries kept in the smt_db cache (default 100000).
 
         - 'DB' which deals with database backend options:
 
@@ -65,6 +71,8 @@ Attributes:
             - 'assemble' (unused)
             - 'format_x86' one of 'Intel' (default), 'ATT'
             - 'format_x64' one of 'Intel' (default), 'ATT'
+            - 'codegen' will use generated python decoders in disassemblers if True (default False).
+            - 'cachedir' directory of generated files (default "", ie. no cache).
 """
 
 import os
@@ -124,12 +132,53 @@ class Cas(Configurable):
         noaliasing (Bool): If True (default), then assume that symbolic memory
                            expressions (pointers) are **never** aliased.
         memtrace (Bool): keep memory writes in mapper in addition to MemoryMap (default).
+        hashcons (Bool): intern expressions stored in mappers if True (defaults to False.)
+        simplify_cache (int): max number of simplified expressions kept in cache.
+                              Defaults to 0, ie. no cache. The cache and its hits/misses
+                              counters are available as `cas.expressions.scache`.
+        smt_cache (int): max number of z3 translations of interned expressions kept in cache.
+                         Defaults to 4096. The cache and its hits/misses counters
+                         are available as `cas.smt.zcache`.
+        smt_group_cache (int): max number of solved independent groups of constraints
+                               kept in cache. Defaults to 1024. The cache and its
+                               hits/misses counters are available as `cas.smt.gcache`.
+        smt_db (str): filename of the sqlite database of cached solver queries.
+                      Defaults to "", ie. no persistent cache (see `cas.smt.querydb`.)
+        smt_db_size (int): max number of queries kept in the smt_db database
+                           (least recently used queries are removed first.)
     """
 
     complexity = Integer(0, config=True)
     unicode = Bool(False, config=True)
     noaliasing = Bool(True, config=True)
     memtrace = Bool(True, config=True)
+    hashcons = Bool(False, config=True)
+    simplify_cache = Integer(0, config=True)
+
+    @observe("simplify_cache")
+    def _simplify_cache_changed(self, change):
+        from amoco.cas.expressions import scache
+
+        scache.clear()
+
+    smt_cache = Integer(4096, config=True)
+
+    @observe("smt_cache")
+    def _smt_cache_changed(self, change):
+        from amoco.cas.smt import zcache
+
+        zcache.clear()
+
+    smt_group_cache = Integer(1024, config=True)
+
+    @observe("smt_group_cache")
+    def _smt_group_cache_changed(self, change):
+        from amoco.cas.smt import gcache
+
+        gcache.clear()
+
+    smt_db = Unicode("", config=True)
+    smt_db_size = Integer(100000, config=True)
 
 
 class Log(Configurable):
@@ -199,9 +248,14 @@ class Arch(Configurable):
         assemble (Bool): unused yet.
         format_x86 (str): select disassembly flavor: Intel (default) vs. AT&T (att).
         format_x64 (str): select disassembly flavor: Intel (default) vs. AT&T (att).
+        codegen (Bool): use generated decoders (see arch.codegen) if True.
+        cachedir (str): directory where generated decoders and parsed ispecs
+                        are cached (default "", ie. no cache.)
     """
 
     assemble = Bool(False, config=True)
+    codegen = Bool(False, config=True)
+    cachedir = Unicode("", config=True)
     format_x86 = Unicode("Intel", config=True)
 
     @observe("format_x86")
@@ -242,12 +296,19 @@ class System(Configurable):
 
     Attributes:
         pagesize (int): provides the default memory page size in bytes.
+        pagedmem (Bool): if True, linux tasks' concrete memory is stored in
+                         pages (see system.memory.PagedMemoryZone). Defaults
+                         to False.
+        icache (int): maximum number of decoded instructions kept by each
+                      task (see system.core.icache), 0 disables the cache.
         aslr (Bool): simulates ASLR if True. (not supported yet.)
         nx (Bool): unused.
         romfile (Unicode): path to ROM file.
     """
 
     pagesize = Integer(4096, config=True)
+    pagedmem = Bool(False, config=True)
+    icache = Integer(16384, config=True)
     aslr = Bool(False, config=True)
     nx = Bool(False, config=True)
     romfile = Unicode("apple2.rom", config=True)
@@ -16,6 +16,7 @@ The emu module of amoco implements the emulator class :class:`emul`.
 from collections import deque
 
 from amoco.config import conf
+from amoco.cas.expressions import evaluator
 from amoco.arch.core import DecodeError
 from amoco.system.memory import MemoryMapError
 from amoco.sa.lsweep import lsweep
@@ -200,7 +201,8 @@ class emul(object):
             x = self.task.cpu.cst(x, self.pc.size)
         if x._is_cst:
             x = self.pc == x
-        f = lambda e, prev, expr=x: bool(e.task.state(expr))
+        fx = evaluator(x)
+        f = lambda e, prev, expr=x: bool(fx(e.task.state))
         f.__doc__ = "breakpoint: %s" % x
         self.hooks.append(f)
         return x
@@ -225,7 +227,8 @@ class emul(object):
         if x._is_cst:
             x = self.task.cpu.mem(x, 8)
         self.watch[x] = self.task.state(x)
-        f = lambda e, prev, expr=x: bool(e.task.state(expr) != e.watch[expr])
+        fx = evaluator(x)
+        f = lambda e, prev, expr=x: bool(fx(e.task.state) != e.watch[expr])
         f.__doc__ = "watchpoint: %s" % x
         self.hooks.append(f)
         return x
@@ -322,9 +325,11 @@ class emul(object):
 
             file = tempfile.mkstemp(prefix="amoco-trace-%s.dump" % x, suffix=".dump")
 
+        fx = evaluator(x)
+
         def tp(e, prev, expr=x, act=act, f=file):
             "tracepoint:"
-            if bool(e.task.state(expr)):
+            if bool(fx(e.task.state)):
                 if act is None:
                     print(e.task.state, file=f)
                 else:
@@ -15,12 +15,24 @@ the result is incorrect.
 Still, it provides - at almost no cost - an overapproximation of the set of all
 *basic blocks* for architectures with strict fixed-length instruction alignment.
 
+The :meth:`lsweep.psweep` method sweeps all executable sections of a program by
+splitting them in chunks that are decoded in parallel by a pool of processes.
+Every chunk is decoded a bit beyond its end so that the resulting sequences
+of instructions can be stitched where they re-synchronize, and
+bytes that can't be decoded are skipped one at a time. Processes only return
+compact (offset, length, mnemonic, flow) records of the decoded instructions
+from which blocks are built (see :class:`sweepblock`), and instruction objects
+are decoded again only when the instructions of a block are accessed.
 """
 
 # This code is part of Amoco
 # Copyright (C) 2006-2014 Axel Tillequin (bdcht3@gmail.com)
 # published under GPLv2 license
 
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+
+from amoco.config import conf
 from amoco.logger import Log
 
 logger = Log(__name__)
@@ -29,7 +41,12 @@ logger.debug("loading module")
 from amoco import cfg
 from amoco import code
 from amoco.signals import SIG_NODE, SIG_EDGE, SIG_BLCK
-from amoco.arch.core import type_control_flow
+from amoco.arch.core import type_control_flow, InstructionError
+
+# size of the chunks of bytes decoded by parallel jobs:
+CHUNKSIZE = 0x40000
+# number of bytes decoded beyond the end of a chunk:
+OVERLAP = 0x400
 
 
 # -----------------------------------------------------------------------------
@@ -106,34 +123,161 @@ class lsweep(object):
             linear sweeped blocks of instructions from given address,
             until :meth:`sequence` stops.
         """
-        l = []
         if not self.prog.cpu:
             logger.error("no cpu has been assigned to prog.")
             return
         if isinstance(loc, int):
             loc = self.prog.cpu.cst(loc, self.prog.cpu.getPC().size)
-        seq = self.sequence(loc)
-        is_delay_slot = False
-        for i in seq:
-            # add branching instruction inside block:
-            l.append(i)
-            if i.misc.get("delayed", False):
-                is_delay_slot = True
-            elif i.type == type_control_flow or is_delay_slot:
-                # check if branch is delayed (e.g. sparc)
-                # create block instance:
-                b = code.block(l)
-                l = []
-                is_delay_slot = False
-                SIG_BLCK.emit(args=b)
-                yield b
-        if len(l) > 0:
-            if is_delay_slot:
-                logger.warning("no instruction in delay slot")
+        yield from self.blocks(self.sequence(loc))
+
+    def blocks(self, seq):
+        """Iterator over basic blocks of the given sequence of instructions,
+        where a None item indicates a gap in the sequence.
+        """
+        for l in runs(seq, flow):
             b = code.block(l)
             SIG_BLCK.emit(args=b)
             yield b
 
+    def psweep(self, ranges=None, workers=None, chunksize=CHUNKSIZE):
+        """Iterator over basic blocks of the given address ranges, decoded
+        in parallel by chunks of bytes. Contrarily to :meth:`iterblocks`,
+        the sweep does not stop at bytes that can't be decoded but proceeds
+        with the next byte. Blocks are yielded in address order and added
+        to the cfg graph :attr:`G` as new nodes.
+
+        Arguments:
+            ranges (Optional[list]): the (start, end) address ranges to sweep
+                (defaults to the program's executable sections, or to its
+                entire concrete memory.)
+            workers (Optional[int]): the number of processes of the pool
+                (defaults to the number of cpus, 1 means no pool.) No pool is
+                used if the cpu doesn't provide its module name (cpu.modname.)
+            chunksize (int): the number of bytes of each parallel job.
+
+        Yields:
+            linear sweeped blocks of instructions from given ranges.
+        """
+        p = self.prog
+        if not p.cpu:
+            logger.error("no cpu has been assigned to prog.")
+            return
+        if ranges is None:
+            ranges = self.code_ranges()
+        modname = getattr(p.cpu, "modname", None)
+        if modname is None:
+            logger.verbose("cpu module name not found, sweeping without pool")
+            workers = 1
+        job = (modname, dict(getattr(p.cpu, "internals", {})))
+        pool = None
+        if workers != 1:
+            pool = ProcessPoolExecutor(workers)
+        try:
+            for start, end in sorted(ranges):
+                addr = start
+                for x in p.state.mmap.read(start, end - start):
+                    if isinstance(x, (bytes, bytearray, memoryview)):
+                        data = bytes(x)
+                        seq = self._stitch(job, addr, data, pool, chunksize)
+                        for l in runs(seq, lambda r: r[1][2]):
+                            if all(i is not None for (_, _, i) in l):
+                                b = code.block([i for (_, _, i) in l])
+                            else:
+                                b = sweepblock(p.cpu, addr, data, l)
+                            SIG_BLCK.emit(args=b)
+                            self.G.add_vertex(cfg.node(b))
+                            yield b
+                        addr += len(x)
+                    else:
+                        addr += x.length
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    def code_ranges(self):
+        """returns the list of (start, end) address ranges of the program's
+        executable sections (or of its entire concrete memory.)
+        """
+        R = []
+        b = getattr(self.prog, "bin", None)
+        if b is not None:
+            R = [(start, end) for (start, end, _) in b.code_ranges()]
+        if not R:
+            z = self.prog.state.mmap._zones.get(None, None)
+            if z is not None and len(z._map) > 0:
+                R = [z.range()]
+        return R
+
+    def _stitch(self, job, base, data, pool, chunksize):
+        # yields the (offset, record, instruction) items (or None for a
+        # skipped byte) of the linear sweep of data at address base, where
+        # record is the (length, mnemonic, flow) tuple of the instruction.
+        # Parallel jobs only return records so that the instruction is None
+        # unless it has been decoded here (see sweepblock.)
+        cpu = self.prog.cpu
+        n = len(data)
+        maxlen = cpu.disassemble.maxlen
+        J = []
+        for s in range(0, n, chunksize):
+            e = min(n, s + chunksize + OVERLAP)
+            J.append(job + (base + s, data[s : e + maxlen], e - s))
+        if pool is None or len(J) == 1:
+            R = (sweep(cpu, *j[2:]) for j in J)
+        else:
+            R = pool.map(sweep_job, J)
+        # records of all chunks are indexed by their offset in data, and
+        # the sweep just follows these records (decoding instructions only
+        # when chunks are not yet re-synchronized):
+        records = {}
+        off = 0
+        for k, (offsets, instrs) in enumerate(R):
+            s = k * chunksize
+            records.update(zip((s + o for o in offsets), instrs))
+            stop = min(n, s + chunksize)
+            while off < stop:
+                i = records.pop(off, False)
+                if i is False:
+                    i = decode(cpu, base + off, data[off : off + maxlen])
+                if i is None:
+                    off += 1
+                    yield None
+                    continue
+                if isinstance(i, tuple):
+                    r, i = i, None
+                else:
+                    r = record(i)
+                yield (off, r, i)
+                off += r[0]
+            for o in [o for o in records if o < off]:
+                del records[o]
+
+    def listing(self, loc=None):
+        """Iterator over the lines of an objdump-like listing of the
+        instructions of :meth:`sequence`. Lines are formatted one instruction
+        at a time (without highlighting and without building any table) so
+        that the listing of a whole program can be streamed to a file.
+
+        Arguments:
+            loc (Optional[cst]): the address to start disassembling
+                (defaults to the program's entrypoint).
+
+        Yields:
+            the text lines (without newline) of instructions from given address.
+        """
+        for i in self.sequence(loc):
+            yield listing_line(i)
+
+    def dump(self, out, loc=None):
+        """Writes the :meth:`listing` from given address into the
+        (text) file object out, and returns the number of written lines.
+        """
+        n = 0
+        for l in self.listing(loc):
+            out.write(l)
+            out.write("\n")
+            n += 1
+        return n
+
     def getblock(self, val):
         """getblock is just a wrapper of iterblocks to
         return the first block located at given (int) address.
@@ -172,3 +316,163 @@ class lsweep(object):
         """
         sig = self.signature(func)
         return len(sig)
+
+
+# -----------------------------------------------------------------------------
+
+
+def listing_line(i):
+    "returns the objdump-like text line of instruction i"
+    t = i.toks()
+    if not isinstance(t, str):
+        t = "".join(v for (_, v) in t)
+    if conf.Code.bytecode:
+        try:
+            b = " ".join(["%02x" % x for x in bytes(i.bytes)])
+        except TypeError:
+            b = " ".join(["--"] * i.length)
+        return "%s:\t%-20s\t%s" % (i.address, b, t.rstrip())
+    return "%s:\t%s" % (i.address, t.rstrip())
+
+
+class sweepblock(code.block):
+    """A sweepblock is a block of the parallel linear sweep of bytes data
+    at address base, made of the (offset, record, instruction) items of its
+    instructions, where instructions that have been swept by other processes
+    are None until the instr list of the block is accessed.
+    """
+
+    __slots__ = ["items"]
+
+    def __init__(self, cpu, base, data, items):
+        self.items = (cpu, base, data, items)
+        code.block.__init__(self, None)
+
+    @property
+    def instr(self):
+        I = _block_instr.__get__(self)
+        if I is None:
+            cpu, base, data, items = self.items
+            maxlen = cpu.disassemble.maxlen
+            I = []
+            for off, r, i in items:
+                if i is None:
+                    i = decode(cpu, base + off, data[off : off + maxlen])
+                    if i is None or (i.length, i.mnemonic) != r[:2]:
+                        logger.warning("sweep mismatch at %#x" % (base + off))
+                        if i is None:
+                            continue
+                I.append(i)
+            self.instr = I
+        return I
+
+    @instr.setter
+    def instr(self, I):
+        _block_instr.__set__(self, I)
+        if I is not None:
+            self.items = None
+
+    @property
+    def address(self):
+        if self.items is None:
+            return code.block.address.__get__(self)
+        cpu, base, _, items = self.items
+        return cpu.cst(base + items[0][0], cpu.getPC().size)
+
+    @property
+    def length(self):
+        if self.items is None:
+            return code.block.length.__get__(self)
+        return sum([r[0] for (_, r, _) in self.items[3]], 0)
+
+    def __reduce__(self):
+        return (code.block, (self.instr,))
+
+
+# the instr slot of blocks (see sweepblock.instr):
+_block_instr = code.block.__dict__["instr"]
+
+
+def runs(seq, flow):
+    """yields the lists of items of seq that form basic blocks, where a None
+    item indicates a gap in the sequence and flow(item) is 2 for delayed
+    branches (e.g. sparc), 1 for other control flow items or 0 otherwise.
+    """
+    l = []
+    is_delay_slot = False
+    for i in seq:
+        if i is None:
+            if len(l) > 0:
+                if is_delay_slot:
+                    logger.warning("no instruction in delay slot")
+                yield l
+                l = []
+                is_delay_slot = False
+            continue
+        # add branching instruction inside block:
+        l.append(i)
+        f = flow(i)
+        if f == 2:
+            is_delay_slot = True
+        elif f == 1 or is_delay_slot:
+            yield l
+            l = []
+            is_delay_slot = False
+    if len(l) > 0:
+        if is_delay_slot:
+            logger.warning("no instruction in delay slot")
+        yield l
+
+
+def flow(i):
+    "returns the flow of instruction i in a block (see runs)"
+    if i.misc.get("delayed", False):
+        return 2
+    return 1 if i.type == type_control_flow else 0
+
+
+def record(i):
+    "returns the compact (length, mnemonic, flow) record of instruction i"
+    return (i.length, i.mnemonic, flow(i))
+
+
+def decode(cpu, address, istr):
+    "returns the instruction decoded from istr at address (or None)"
+    try:
+        i = cpu.disassemble(istr)
+    except (InstructionError, MemoryError) as e:
+        logger.verbose("decoding error at %#x: %s" % (address, e))
+        return None
+    if i is not None:
+        i.address = cpu.cst(address, cpu.getPC().size)
+    return i
+
+
+def sweep(cpu, base, data, stop):
+    """returns the lists of offsets and instructions decoded by linear sweep
+    of bytes data at address base, until offset stop (see :meth:`lsweep.psweep`.)
+    A None instruction indicates that the byte at this offset is skipped.
+    """
+    maxlen = cpu.disassemble.maxlen
+    offsets = []
+    instrs = []
+    off = 0
+    while off < stop:
+        i = decode(cpu, base + off, data[off : off + maxlen])
+        offsets.append(off)
+        instrs.append(i)
+        off += 1 if i is None else i.length
+    return offsets, instrs
+
+
+def sweep_job(job):
+    """process pool entry for sweeping (cpu module, internals, base, data, stop)
+    which returns the lists of offsets and (length, mnemonic, flow) records of
+    decoded instructions (or None for skipped bytes.)
+    """
+    cpu = importlib.import_module(job[0]).cpu
+    internals = getattr(cpu, "internals", None)
+    if internals is not None:
+        internals.update(job[1])
+    offsets, instrs = sweep(cpu, *job[2:])
+    return offsets, [i if i is None else record(i) for i in instrs]
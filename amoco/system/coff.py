@@ -60,6 +60,11 @@ class COFF(BinFormat):
 
     is_COFF = True
 
+    @staticmethod
+    def probe(data):
+        magic = int.from_bytes(data[:2], "little")
+        return len(data) > 2 and magic in Consts.All["FILEHDR.f_magic"]
+
     @property
     def entrypoints(self):
         return [self.OptHdr.entry]
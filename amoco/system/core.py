@@ -14,8 +14,17 @@ the :mod:`amoco.system` package.
 
 """
 
+import mmap
+import importlib
+from bisect import bisect_right
+from collections import defaultdict
+from copy import copy
+
 from amoco.arch.core import Bits, DecodeError, InstructionError
 from amoco.system.memory import MemoryMapError
+from amoco.system.structs import StructureError
+from amoco.cas.expressions import lrucache
+from amoco.config import conf
 from amoco.ui.views import execView, dataView
 from amoco.logger import Log
 
@@ -51,9 +60,11 @@ class CoreExec(object):
              of the executable program, including mapping of registers as well
              as the :class:`MemoryMap` instance that represents the virtual
              memory of the program.
+
+        icache: the :class:`icache` of instructions decoded by read_instruction.
     """
 
-    __slots__ = ["bin", "cpu", "OS", "state", "view"]
+    __slots__ = ["bin", "cpu", "OS", "state", "view", "icache"]
 
     def __init__(self, p, cpu=None):
         self.bin = p
@@ -61,6 +72,7 @@ class CoreExec(object):
         self.OS = None
         self.state = self.initstate()
         self.view = execView(of=self)
+        self.icache = icache()
 
     def __repr__(self):
         c = self.__class__.__name__
@@ -114,6 +126,15 @@ class CoreExec(object):
             return vaddr
         else:
             addr = vaddr
+        key = None
+        if conf.System.icache and mmap is self.state.mmap:
+            key = self.icache.key(self.cpu, addr, **kargs)
+            if key is not None:
+                if self.icache.mmap is not mmap:
+                    self.icache.attach(mmap, maxlen)
+                i = self.icache.get(key)
+                if i is not None:
+                    return self.icache.icopy(i)
         try:
             istr = mmap.read(vaddr, maxlen)
         except MemoryMapError as e:
@@ -139,6 +160,8 @@ class CoreExec(object):
         else:
             if i.address is None:
                 i.address = kargs.get("label", addr)
+            if key is not None:
+                self.icache.put(key, self.icache.icopy(i))
             return i
 
     def symbol_for(self, address, abi=None):
@@ -170,6 +193,19 @@ class CoreExec(object):
             info = "#%s" % D(info)
         return info or ""
 
+    def symbol_near(self, address):
+        """
+        returns the symbol string of the function or variable that contains
+        address, with "+offset" appended if address is not its start address.
+        """
+        if isinstance(address, self.cpu.cst):
+            address = address.v
+        name, offset = self.bin.symindex.nearest(address)
+        info = self.symbol_for(address - offset)
+        if info and offset:
+            info = "%s+%#x" % (info, offset)
+        return info
+
     def segment_for(self, address, stype=None):
         s = self.bin.getinfo(address)[0]
         return s.name if hasattr(s, "name") else ""
@@ -302,6 +338,112 @@ class DefineStub(object):
 # ------------------------------------------------------------------------------
 
 
+class icache(lrucache):
+    """
+    icache is the lrucache of instructions decoded by a task from its
+    current state memory map, with maximum size conf.System.icache.
+    Instructions are cached by address, label and decoding mode (the
+    disassembler's instruction set and endianness, and cpu internals)
+    and are removed as soon as the memory map is written at any of their
+    bytes. Cached instructions are never returned directly but as copies
+    so that callers can freely annotate them.
+
+    Attributes:
+        mmap (MemoryMap): the memory map watched by the cache.
+        maxlen (int): the maximum length of instructions.
+        pages (dict): the set of keys of instructions in each memory page.
+    """
+
+    PAGE = 4096
+
+    def __init__(self):
+        super().__init__("icache", conf.System)
+        self.mmap = None
+        self.maxlen = 0
+        self.pages = defaultdict(set)
+
+    def clear(self):
+        super().clear()
+        self.pages.clear()
+
+    def attach(self, mmap, maxlen):
+        "clear the cache and watch writes in the given memory map"
+        if self.mmap is not None and self.invalidate in self.mmap.watchers:
+            self.mmap.watchers.remove(self.invalidate)
+        self.clear()
+        self.mmap = mmap
+        self.maxlen = maxlen
+        mmap.watchers.append(self.invalidate)
+
+    @staticmethod
+    def key(cpu, addr, **kargs):
+        "returns the cache key for decoding at addr, or None if not cacheable"
+        label = kargs.pop("label", None)
+        kargs.pop("mmap", None)
+        if kargs or not addr._is_cst:
+            return None
+        if label is not None:
+            if not label._is_cst:
+                return None
+            label = label.v
+        d = cpu.disassemble
+        internals = getattr(getattr(cpu, "env", None), "internals", {})
+        mode = (d.iset(), d.endian(), tuple(sorted(internals.items())))
+        try:
+            hash(mode)
+        except TypeError:
+            return None
+        return (addr.v, label, mode)
+
+    @staticmethod
+    def icopy(i):
+        "returns a copy of instruction i that does not share its misc dict"
+        c = copy(i)
+        c.misc = copy(i.misc)
+        c.operands = list(i.operands)
+        return c
+
+    def _pages(self, k, v):
+        return range(k[0] // self.PAGE, (k[0] + v.length - 1) // self.PAGE + 1)
+
+    def put(self, k, v):
+        self.cache[k] = v
+        for p in self._pages(k, v):
+            self.pages[p].add(k)
+        n = conf.System.icache
+        while len(self.cache) > n:
+            ko = next(iter(self.cache))
+            for p in self._pages(ko, self.cache.pop(ko)):
+                self.pages[p].discard(ko)
+
+    def invalidate(self, address, l):
+        "remove instructions with bytes in the l bytes at address"
+        if not self.cache:
+            return
+        if address is None:
+            self.clear()
+            return
+        sta = address - self.maxlen + 1
+        sto = address + l
+        P = range(sta // self.PAGE, (sto - 1) // self.PAGE + 1)
+        if len(P) > len(self.pages):
+            P = [p for p in self.pages if p in P]
+        for p in P:
+            keys = self.pages.get(p, None)
+            if not keys:
+                continue
+            for k in list(keys):
+                i = self.cache.get(k, None)
+                if i is None:
+                    keys.discard(k)
+                elif k[0] < sto and address < k[0] + i.length:
+                    del self.cache[k]
+                    keys.discard(k)
+
+
+# ------------------------------------------------------------------------------
+
+
 class BinFormat(object):
     """
     Base class for binary format API, just to define default attributes
@@ -321,6 +463,8 @@ class BinFormat(object):
     reltab = None
     functions = {}
     variables = {}
+    _secindex = None
+    _symindex = None
 
     @property
     def entrypoints(self):
@@ -334,9 +478,169 @@ class BinFormat(object):
         raise NotImplementedError
 
     def getinfo(self, target):
+        """
+        target is either an address provided as str or int,
+        or a symbol str searched in the functions/variables dictionaries.
+
+        Returns a triplet with the section/segment that contains the target,
+        the offset into this section/segment and its base virtual address,
+        or (None, 0, 0) if target is not found.
+        """
+        addr = None
+        if isinstance(target, str):
+            try:
+                addr = int(target, 16)
+            except ValueError:
+                addr = self.symindex.address_of(target)
+        elif isinstance(target, int):
+            addr = target
+        if addr is None:
+            return (None, 0, 0)
+        return self.secindex.find(addr)
+
+    def ranges(self):
+        """
+        yields the (start, end, obj) address ranges of sections/segments
+        by decreasing order of precedence (see AddressIndex.)
+        """
+        return iter(())
+
+    def code_ranges(self):
+        "yields the (start, end, obj) address ranges of executable sections/segments"
+        return iter(())
+
+    @property
+    def secindex(self):
+        "the AddressIndex of all sections/segments ranges"
+        if self._secindex is None:
+            self._secindex = AddressIndex(self.ranges())
+        return self._secindex
+
+    @property
+    def symindex(self):
+        "the SymbolIndex of functions and variables (see update_symbols)"
+        if self._symindex is None:
+            self._symindex = SymbolIndex(self.functions, self.variables)
+        return self._symindex
+
+    def update_symbols(self):
+        "drops the SymbolIndex, must be called when functions or variables are modified"
+        self._symindex = None
+
+    @staticmethod
+    def probe(data):
+        "returns True if the given first bytes of a file may be of this format"
+        return False
+
+
+class AddressIndex(object):
+    """
+    Sorted index of address ranges, used to find the section or segment
+    that contains a given address in O(log(n)).
+    Ranges are provided as (start, end, obj) tuples and, since sections
+    and segments can overlap, a range added first takes precedence over
+    any other range added later: only the parts of a new range that
+    are not already covered are indexed.
+
+    Attributes:
+        starts (list): sorted start addresses of disjoint indexed parts.
+        parts (list): the (end, obj, base) tuple associated to each start,
+                      where base is the start address of the original range.
+    """
+
+    def __init__(self, ranges=None):
+        self.starts = []
+        self.parts = []
+        for r in ranges or []:
+            self.add(*r)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, end, obj):
+        "add obj for addresses in [start, end[ not already indexed"
+        base = start
+        i = bisect_right(self.starts, start)
+        if i > 0 and start < self.parts[i - 1][0]:
+            start = self.parts[i - 1][0]
+        while start < end:
+            if i < len(self.starts):
+                nxt = self.starts[i]
+                if nxt <= start:
+                    start = self.parts[i][0]
+                    i += 1
+                    continue
+            else:
+                nxt = end
+            sto = min(nxt, end)
+            self.starts.insert(i, start)
+            self.parts.insert(i, (sto, obj, base))
+            start = self.parts[i][0]
+            i += 1
+
+    def find(self, address):
+        "returns (obj, offset into obj, base address of obj) or (None, 0, 0)"
+        i = bisect_right(self.starts, address) - 1
+        if i >= 0:
+            end, obj, base = self.parts[i]
+            if address < end:
+                return (obj, address - base, base)
         return (None, 0, 0)
 
 
+class SymbolIndex(object):
+    """
+    Sorted index of symbols, used to find the symbol at or nearest below
+    a given address in O(log(n)).
+    Symbols are taken from a BinFormat functions and variables dictionaries
+    which associate an address to either a name str or a tuple starting
+    with (name, size, ...).
+
+    Attributes:
+        addrs (list): sorted addresses of symbols.
+        syms (list): the (name, size) tuple associated to each address.
+        names (dict): the address associated to every symbol name.
+    """
+
+    def __init__(self, functions, variables):
+        D = {}
+        self.names = {}
+        for d in (variables, functions):
+            for a, info in d.items():
+                if isinstance(info, tuple):
+                    name, size = info[0], info[1]
+                else:
+                    name, size = info, 0
+                D[a] = (name, size or 0)
+        for d in (functions, variables):
+            for a, info in d.items():
+                name = info[0] if isinstance(info, tuple) else info
+                self.names.setdefault(name, a)
+        self.addrs = sorted(D)
+        self.syms = [D[a] for a in self.addrs]
+
+    def __len__(self):
+        return len(self.addrs)
+
+    def address_of(self, name):
+        "returns the address of given symbol name, or None if not found"
+        return self.names.get(name, None)
+
+    def nearest(self, address):
+        """
+        returns the (name, offset) tuple of the symbol that contains address,
+        or (None, 0). A symbol with unknown (null) size only contains
+        its own address.
+        """
+        i = bisect_right(self.addrs, address) - 1
+        if i >= 0:
+            name, size = self.syms[i]
+            offset = address - self.addrs[i]
+            if offset == 0 or offset < size:
+                return (name, offset)
+        return (None, 0)
+
+
 class shellcode(BinFormat):
     """
     This is the most basic file format for executable binary code. It
@@ -365,15 +669,26 @@ class DataIO(object):
     This class simply wraps a binary file or a bytes string and implements
     both the file and bytes interface. It allows an input to be provided as
     files of bytes and manipulated indifferently as a file or a bytes object.
+
+    When the wrapped object is a real file, its content is also mapped
+    in memory (read-only) so that slices don't require any seek/read, and
+    the memview method provides memoryview slices of the file that are
+    not copied in memory.
     """
 
     def __init__(self, f):
+        self.m = None
         if isinstance(f, bytes):
             from io import BytesIO
 
             self.f = BytesIO(f)
         else:
             self.f = f
+            try:
+                self.m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (AttributeError, OSError, ValueError):
+                # not a real file, or an empty file:
+                self.m = None
         self.view = dataView(dataio=self)
 
     def __getitem__(self, i):
@@ -381,6 +696,8 @@ class DataIO(object):
         sta = i.start
         if sta is None:
             sta = stay
+        if self.m is not None:
+            return self.m[sta : i.stop]
         self.f.seek(sta, 0)
         if i.stop is None:
             data = self.f.read()
@@ -389,6 +706,15 @@ class DataIO(object):
         self.f.seek(stay, 0)
         return data
 
+    def memview(self, sta, sto=None):
+        """
+        returns a (read-only) memoryview of data bytes [sta:sto],
+        which is not a copy if the data is a file mapped in memory.
+        """
+        if self.m is not None:
+            return memoryview(self.m)[sta:sto]
+        return memoryview(self[sta:sto])
+
     def size(self):
         stay = self.f.tell()
         self.f.seek(0, 2)
@@ -436,6 +762,12 @@ class DataIO(object):
         return self.f.truncate(size)
 
     def close(self):
+        if self.m is not None:
+            try:
+                self.m.close()
+            except BufferError:
+                # some memoryviews of the file are still in use.
+                pass
         return self.f.close()
 
     @property
@@ -474,6 +806,22 @@ class DataIO(object):
 
 
 # ------------------------------------------------------------------------------
+# formats identified by read_program, in probing order. Each entry provides the
+# format name, and the module, BinFormat class and error class names of its
+# parser. The parser is used only if its class probe method accepts the first
+# PROBESIZE bytes of the file.
+FORMATS = [
+    ("ELF", "amoco.system.elf", "Elf", "ElfError"),
+    ("PE", "amoco.system.pe", "PE", "PEError"),
+    ("Mach-O", "amoco.system.macho", "MachO", "MachOError"),
+    ("COFF", "amoco.system.coff", "COFF", "COFFError"),
+    ("HEX", "amoco.system.structs.HEX", "HEX", "HEXError"),
+    ("SREC", "amoco.system.structs.SREC", "SREC", "SRECError"),
+]
+
+PROBESIZE = 4096
+
+
 def read_program(filename):
     """
     Identifies the program header and returns an ELF, PE, Mach-O, COFF
@@ -493,72 +841,21 @@ def read_program(filename):
         data = bytes(filename)
 
     f = DataIO(data)
-
-    try:
-        from amoco.system import elf
-
-        # open file as a ELF object:
-        p = elf.Elf(f)
-        logger.info("ELF format detected")
-        return p
-    except (elf.StructureError, elf.ElfError):
-        f.seek(0)
-        logger.debug("ElfError raised for %s" % f.name)
-
-    try:
-        from amoco.system import pe
-
-        # open file as a PE object:
-        p = pe.PE(f)
-        logger.info("PE format detected")
-        return p
-    except (pe.StructureError, pe.PEError):
-        f.seek(0)
-        logger.debug("PEError raised for %s" % f.name)
-
-    try:
-        from amoco.system import macho
-
-        # open file as a Mach-O object:
-        p = macho.MachO(f)
-        logger.info("Mach-O format detected")
-        return p
-    except (macho.StructureError, macho.MachOError):
-        f.seek(0)
-        logger.debug("MachOError raised for %s" % f.name)
-
-    try:
-        from amoco.system import coff
-
-        # open file as a COFF object:
-        p = coff.COFF(f)
-        logger.info("COFF format detected")
-        return p
-    except (coff.StructureError, coff.COFFError):
-        f.seek(0)
-        logger.debug("COFFError raised for %s" % f.name)
-
-    try:
-        from amoco.system.structs.HEX import HEX, HEXError
-
-        # open file as a HEX object:
-        p = HEX(f)
-        logger.info("HEX format detected")
-        return p
-    except HEXError:
-        f.seek(0)
-        logger.debug(" HEX FormatError raised for %s" % f.name)
-
-    try:
-        from amoco.system.structs.SREC import SREC, SRECError
-
-        # open file as a SREC object:
-        p = SREC(f)
-        logger.info("SREC format detected")
-        return p
-    except SRECError:
-        f.seek(0)
-        logger.debug(" SREC FormatError raised for %s" % f.name)
+    # only the first bytes are needed to identify the format:
+    head = f[0:PROBESIZE]
+
+    for name, mod, cls, err in FORMATS:
+        mod = importlib.import_module(mod)
+        F = getattr(mod, cls)
+        if not F.probe(head):
+            continue
+        try:
+            p = F(f)
+            logger.info("%s format detected" % name)
+            return p
+        except (StructureError, getattr(mod, err)):
+            f.seek(0)
+            logger.debug("%s format error raised for %s" % (name, f.name))
 
     logger.warning("unknown format")
     return shellcode(f)
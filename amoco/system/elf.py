@@ -54,10 +54,19 @@ class Elf(BinFormat):
         functions (list): a list of function names gathered from internal
                           definitions (if not stripped) and import names.
         variables (list): a list of global variables' names (if found.)
+
+    Note:
+        Symbols and relocations tables are parsed only when functions,
+        variables or symtab/strtab/reltab attributes are first accessed,
+        and are decoded as StructArray tables of Sym/Rel(a) entries.
     """
 
     is_ELF = True
 
+    @staticmethod
+    def probe(data):
+        return data[:4] == b"\x7fELF"
+
     @property
     def entrypoints(self):
         return [self.Ehdr.e_entry]
@@ -134,42 +143,60 @@ class Elf(BinFormat):
                     s.name = decode(name)
 
         self.__sections = {}
-        self.functions = self.__functions()
-        self.variables = self.__variables()
-        self.strtab = self.__sections.get(".strtab", self.strtab)
-        self.symtab = self.__sections.get(".symtab", self.symtab)
-        self.reltab = self.__sections.get(".reltab", self.reltab)
+        self._functions = None
+        self._variables = None
+
+    @property
+    def functions(self):
+        if self._functions is None:
+            self._functions = self.__functions()
+        return self._functions
+
+    @functions.setter
+    def functions(self, D):
+        self._functions = D
+        self.update_symbols()
+
+    @property
+    def variables(self):
+        if self._variables is None:
+            self._variables = self.__variables()
+        return self._variables
+
+    @variables.setter
+    def variables(self, D):
+        self._variables = D
+        self.update_symbols()
+
+    @property
+    def strtab(self):
+        return self.__optsection(".strtab")
+
+    @property
+    def symtab(self):
+        return self.__optsection(".symtab")
+
+    @property
+    def reltab(self):
+        return self.__optsection(".reltab")
+
+    def __optsection(self, name):
+        "returns the given section decoded data if present, or None."
+        for S in self.Shdr:
+            if S.name == name:
+                return self.readsection(S)
+        return None
 
     def getsize(self):
         "total file size of all the Program headers"
         total = sum([s.p_filesz for s in self.Phdr])
         return total
 
-    def getinfo(self, target):
+    def ranges(self):
         """
-        target is either an address provided as str or int,
-        or a symbol str searched in the functions dictionary.
-
-        Returns a triplet with:
-            - section index (0 is error, -1 is a dynamic call)
-            - offset into section  (idem)
-            - base virtual address (0 for dynamic calls)
+        yields address ranges of sections (or segments if no section is
+        defined) by decreasing order of precedence.
         """
-        addr = None
-        if isinstance(target, str):
-            try:
-                addr = int(target, 16)
-            except ValueError:
-                for a, f in iter(self.functions.items()):
-                    if f[0] == target:
-                        addr = int(a, 16)
-                        break
-        elif isinstance(target, int):
-            addr = target
-        if addr is None:
-            # target is propably a symbol not found in functions
-            return None, 0, 0
-        # now we have addr so we can see in which section/segment it is...
         # sections are smaller than segments so we try first with Shdr
         # but this may lead to errors because what really matters are segments
         # loaded by the kernel binfmt_elf.c loader.
@@ -177,15 +204,23 @@ class Elf(BinFormat):
             for s in reversed(self.Shdr):
                 if s.sh_type != SHT_PROGBITS:
                     continue
-                if s.sh_addr <= addr < s.sh_addr + s.sh_size:
-                    return s, addr - s.sh_addr, s.sh_addr
+                yield (s.sh_addr, s.sh_addr + s.sh_size, s)
         elif self.Phdr:
             for s in reversed(self.Phdr):
                 if s.p_type != PT_LOAD:
                     continue
-                if s.p_vaddr <= addr < s.p_vaddr + s.p_filesz:
-                    return s, addr - s.p_vaddr, s.p_vaddr
-        return None, 0, 0
+                yield (s.p_vaddr, s.p_vaddr + s.p_filesz, s)
+
+    def code_ranges(self):
+        "yields address ranges of executable sections (or segments)"
+        if self.Shdr:
+            for s in self.Shdr:
+                if s.sh_type == SHT_PROGBITS and s.sh_flags & SHF_EXECINSTR:
+                    yield (s.sh_addr, s.sh_addr + s.sh_size, s)
+        elif self.Phdr:
+            for s in self.Phdr:
+                if s.p_type == PT_LOAD and s.p_flags & PF_X:
+                    yield (s.p_vaddr, s.p_vaddr + s.p_filesz, s)
 
     def data(self, target, size):
         "returns 'size' bytes located at target virtual address"
@@ -226,7 +261,8 @@ class Elf(BinFormat):
         """
         If S is of type PT_LOAD, returns a dict {base: bytes}
         indicating that segment data bytes (extended to pagesize boundary)
-        need to be mapped at virtual base address.
+        need to be mapped at virtual base address. (Data bytes are provided
+        as a memoryview of the file if possible, see DataIO.memview.)
         (Returns None if not a PT_LOAD segment.)
         """
 
@@ -248,9 +284,13 @@ class Elf(BinFormat):
             off = S.p_offset - ELF_PAGEOFFSET(S.p_vaddr)
             addr = ELF_PAGESTART(S.p_vaddr)
             size = ELF_PAGEALIGN(size)
-            self.__file.seek(off)
             base = addr
-            bytes_ = self.__file.read(size)
+            if hasattr(self.__file, "memview"):
+                # file-backed data (not copied until written):
+                bytes_ = self.__file.memview(off, off + size)
+            else:
+                self.__file.seek(off)
+                bytes_ = self.__file.read(size)
             return {base: bytes_}
         else:
             logger.error("segment not a PT_LOAD [%08x/%0d]" % (S.p_vaddr, S.p_align))
@@ -296,18 +336,12 @@ class Elf(BinFormat):
         # read the section:
         self.__file.seek(section.sh_offset)
         data = self.__file.read(section.sh_size)
-        # and parse it into Sym objects:
+        # and parse it into a table of Sym entries:
         l = section.sh_entsize
         if (section.sh_size % l) != 0:
             raise ElfError("symbol table size mismatch")
-        else:
-            n = section.sh_size // l
-        symtab = []
-        offset = 0
-        for i in range(n):
-            symtab.append(Sym(data, offset, lbe, x64))
-            offset += l
-        return symtab
+        n = section.sh_size // l
+        return Sym(None, 0, lbe, x64).unpack_array(data, 0, n, stride=l)
 
     def __read_strtab(self, section):
         if section.sh_type != SHT_STRTAB:
@@ -329,20 +363,15 @@ class Elf(BinFormat):
             raise ElfError("relocation table size mismatch")
         else:
             n = section.sh_size // l
-        reltab = []
         x64 = self.Ehdr.e_ident.EI_CLASS == ELFCLASS64
         lbe = ">" if (self.Ehdr.e_ident.EI_DATA == ELFDATA2MSB) else None
-        offset = 0
         if section.sh_type == SHT_REL:
             rcls = Rel
         elif section.sh_type == SHT_RELA:
             rcls = Rela
         else:
             raise ElfError("bad relocation type")
-        for i in range(n):
-            reltab.append(rcls(data, offset, lbe, x64))
-            offset += l
-        return reltab
+        return rcls(None, 0, lbe, x64).unpack_array(data, 0, n, stride=l)
 
     def __read_dynamic(self, section):
         if section.sh_type != SHT_DYNAMIC:
@@ -399,16 +428,21 @@ class Elf(BinFormat):
 
     def __symbols(self, t):
         D = {}
-        symtab = self.readsection(".symtab") or []
+        symtab = self.readsection(".symtab")
         strtab = self.readsection(".strtab")
-        if strtab:
-            for sym in symtab:
-                if sym.st_type == t and sym.st_value:
-                    D[sym.st_value] = (
-                        str(strtab[sym.st_name].decode()),
-                        sym.st_size,
-                        sym.st_info,
-                        sym.st_shndx,
+        if symtab and strtab:
+            st_name = symtab.values("st_name")
+            st_value = symtab.values("st_value")
+            st_size = symtab.values("st_size")
+            st_info = symtab.values("st_info")
+            st_shndx = symtab.values("st_shndx")
+            for i in range(len(symtab)):
+                if (st_info[i] & 0xF) == t and st_value[i]:
+                    D[st_value[i]] = (
+                        str(strtab[st_name[i]].decode()),
+                        st_size[i],
+                        st_info[i],
+                        st_shndx[i],
                     )
         return D
 
@@ -419,12 +453,17 @@ class Elf(BinFormat):
         dynsym = self.readsection(".dynsym") or []
         dynstr = self.readsection(".dynstr")
         if dynstr:
+            st_name = dynsym.values("st_name") if dynsym else []
+            shift = 32 if self.Ehdr.e_ident.EI_CLASS == ELFCLASS64 else 8
             for s in self.Shdr:
                 if s.sh_type in (SHT_REL, SHT_RELA):
-                    for r in self.readsection(s):
-                        if r.r_offset and r.r_sym:
-                            sym = dynsym[r.r_sym]
-                            D[r.r_offset] = str(dynstr[sym.st_name].decode())
+                    reltab = self.readsection(s)
+                    r_info = reltab.values("r_info")
+                    for i, r_offset in enumerate(reltab.values("r_offset")):
+                        r_sym = r_info[i] >> shift
+                        if r_offset and r_sym:
+                            name = dynstr[st_name[r_sym]]
+                            D[r_offset] = str(name.decode())
         return D
 
     def checksec(self):
@@ -578,11 +617,13 @@ class Ehdr(StructFormatter):
         if self._v.e_ident.EI_DATA == ELFDATA2MSB:
             for f in self.fields[1:]:
                 f.order = ">"
+            self.update_layout()
         # change pointers format if necessary:
         if self._v.e_ident.EI_CLASS == ELFCLASS64:
             self.fields[4].typename = "Q"
             self.fields[5].typename = "Q"
             self.fields[6].typename = "Q"
+            self.update_layout()
         for f in self.fields[1:]:
             setattr(self._v, f.name, f.unpack(data, offset))
             offset += f.size()
@@ -729,9 +770,11 @@ class Shdr(StructFormatter):
         if order:
             for f in self.fields:
                 f.order = order
+            self.update_layout()
         if x64:
             for i in (2, 3, 4, 5, 8, 9):
                 self.fields[i].typename = "Q"
+            self.update_layout()
         self.name_formatter("sh_name", "sh_type")
         self.address_formatter("sh_addr")
         self.flag_formatter("sh_flags")
@@ -831,12 +874,14 @@ class Sym(StructFormatter):
         if order:
             for f in self.fields:
                 f.order = order
+            self.update_layout()
         if x64:  # need to reorder fields...
             fvalue = self.fields.pop(1)
             fsize = self.fields.pop(1)
             fvalue.typename = fsize.typename = "Q"
             self.fields.append(fvalue)
             self.fields.append(fsize)
+            self.update_layout()
         self.name_formatter("st_bind", "st_type", "st_visibility")
         if data:
             self.unpack(data, offset)
@@ -919,9 +964,11 @@ class Rel(StructFormatter):
         if order:
             for f in self.fields:
                 f.order = order
+            self.update_layout()
         if x64:
             for f in self.fields:
                 f.typename = "Q"
+            self.update_layout()
         self.name_formatter("r_type")
         self.func_formatter(r_sym=token_address_fmt)
         if data:
@@ -968,9 +1015,11 @@ class Rela(Rel):
         if order:
             for f in self.fields:
                 f.order = order
+            self.update_layout()
         if x64:
             for f in self.fields:
                 f.typename = "Q"
+            self.update_layout()
         if data:
             self.unpack(data, offset)
 
@@ -992,11 +1041,13 @@ class Phdr(StructFormatter):
         if order:
             for f in self.fields:
                 f.order = order
+            self.update_layout()
         if x64:
             pflags = self.fields.pop(6)
             self.fields.insert(1, pflags)
             for f in self.fields[2:]:
                 f.typename = "Q"
+            self.update_layout()
         self.name_formatter("p_type")
         self.address_formatter("p_vaddr", "p_paddr")
         self.flag_formatter("p_flags")
@@ -1052,9 +1103,11 @@ class Note(StructFormatter):
         if order:
             for f in self.fields:
                 f.order = order
+            self.update_layout()
         if x64:
             for f in self.fields:
                 f.typename = "Q"
+            self.update_layout()
         self.name_formatter("n_type")
         if data:
             self.unpack(data, offset)
@@ -1099,9 +1152,11 @@ class Dyn(StructFormatter):
         if order:
             for f in self.fields:
                 f.order = order
+            self.update_layout()
         if x64:
             for f in self.fields:
                 f.typename = "Q"
+            self.update_layout()
         self.name_formatter("d_tag")
         self.address_formatter("d_un")
         if data:
@@ -1218,6 +1273,7 @@ class Lib(StructFormatter):
         if order:
             for f in self.fields:
                 f.order = order
+            self.update_layout()
         self.flag_formatter("l_flags")
         if data:
             self.unpack(data, offset)
@@ -362,6 +362,7 @@ class fsd(StructFormatter):
             sz += f.size
         f = self.fields[-1]
         f.count = self.fsd_size - sz
+        self.update_layout()
         setattr(self, f.name, f.unpack(data, offset + sz, self.order))
         return self
 
@@ -404,6 +405,7 @@ class direct(StructFormatter):
         f = self.fields[-1]
         assert self.d_namlen < (MAXNAMLEN + 1)
         f.count = self.d_namlen
+        self.update_layout()
         setattr(self, f.name, f.unpack(data, offset + sz, self.order))
         return self
 
@@ -447,6 +449,7 @@ class extent_block(StructFormatter):
             sz += f.size
         f = self.fields[-1]
         f.count = self.nextents
+        self.update_layout()
         setattr(self, f.name, f.unpack(data, offset + sz, self.order))
         return self
 
@@ -6,6 +6,7 @@
 
 from amoco.system import elf
 from amoco.system.structs import Consts
+from amoco.system.memory import MemoryMap
 from amoco.system.core import CoreExec, DefineStub
 from amoco.cas.expressions import top
 from amoco.arch.core import Bits
@@ -191,6 +192,7 @@ class OS(object):
         self.PAGESIZE = conf.pagesize
         self.ASLR = conf.aslr
         self.NX = conf.nx
+        self.PAGEDMEM = conf.pagedmem
         self.abi = None
         self.tasks = []
         self.symbols = {}
@@ -203,6 +205,8 @@ class OS(object):
         "load the program into virtual memory (populate the mmap dict)"
         p = Task(bprm, cpu)
         p.OS = self
+        if self.PAGEDMEM:
+            p.state.mmap = MemoryMap(self.PAGESIZE)
         # create text and data segments according to elf header:
         for s in bprm.Phdr:
             if s.p_type == elf.PT_INTERP:
@@ -274,6 +278,7 @@ class OS(object):
                         p.bin.functions[thunk] = target.ref
                 pltco = pltco[i.length :]
                 address += i.length
+            p.bin.update_symbols()
             # restore mode:
             p.cpu.internals["isetstate"] = mode
 
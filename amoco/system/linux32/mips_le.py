@@ -6,6 +6,7 @@
 
 from amoco.cas.expressions import top
 from amoco.system import elf
+from amoco.system.memory import MemoryMap
 from amoco.system.core import CoreExec, DefineStub
 from amoco.arch.mips.cpu_r3000LE import cpu
 
@@ -30,6 +31,7 @@ class OS(object):
         self.PAGESIZE = conf.pagesize
         self.ASLR = conf.aslr
         self.NX = conf.nx
+        self.PAGEDMEM = conf.pagedmem
         from .abi import cdecl
 
         self.abi = cdecl
@@ -44,6 +46,8 @@ class OS(object):
         "load the program into virtual memory (populate the mmap dict)"
         p = Task(bprm, cpu)
         p.OS = self
+        if self.PAGEDMEM:
+            p.state.mmap = MemoryMap(self.PAGESIZE)
         # create text and data segments according to elf header:
         for s in bprm.Phdr:
             if s.p_type == elf.PT_INTERP:
@@ -106,6 +110,7 @@ class OS(object):
                         p.bin.functions[address] = p.bin.functions[target]
                 pltco = pltco[i.length :]
                 address += i.length
+            p.bin.update_symbols()
 
     def stub(self, refname):
         return self.stubs.get(refname, self.default_stub)
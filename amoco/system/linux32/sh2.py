@@ -6,6 +6,7 @@
 
 from amoco.system import elf
 from amoco.system.structs import Consts
+from amoco.system.memory import MemoryMap
 from amoco.system.core import CoreExec
 from amoco.arch.superh.cpu_sh2 import cpu
 
@@ -96,6 +97,7 @@ class OS(object):
         self.PAGESIZE = conf.pagesize
         self.ASLR = conf.aslr
         self.NX = conf.nx
+        self.PAGEDMEM = conf.pagedmem
         self.tasks = []
 
     @classmethod
@@ -106,6 +108,8 @@ class OS(object):
         "load the program into virtual memory (populate the mmap dict)"
         p = Task(bprm, cpu)
         p.OS = self
+        if self.PAGEDMEM:
+            p.state.mmap = MemoryMap(self.PAGESIZE)
         self.tasks.append(p)
         # create text and data segments according to elf header:
         for s in bprm.Phdr:
@@ -5,6 +5,7 @@
 # published under GPLv2 license
 
 from amoco.system import elf
+from amoco.system.memory import MemoryMap
 from amoco.system.core import CoreExec, DefineStub
 from amoco.system.structs import Consts
 from amoco.code import callstack
@@ -73,6 +74,7 @@ class OS(object):
         self.PAGESIZE = conf.pagesize
         self.ASLR = conf.aslr
         self.NX = conf.nx
+        self.PAGEDMEM = conf.pagedmem
         from . import abi
 
         self.abi = abi
@@ -87,6 +89,8 @@ class OS(object):
         "load the program into virtual memory (populate the mmap dict)"
         p = Task(bprm, cpu)
         p.OS = self
+        if self.PAGEDMEM:
+            p.state.mmap = MemoryMap(self.PAGESIZE)
         # create text and data segments according to elf header:
         for s in bprm.Phdr:
             if s.p_type == elf.PT_INTERP:
@@ -153,6 +157,7 @@ class OS(object):
                         p.bin.functions[address] = p.bin.functions[target]
                 pltco = pltco[i.length :]
                 address += i.length
+            p.bin.update_symbols()
 
     def stub(self, refname):
         return self.stubs.get(refname, self.default_stub)
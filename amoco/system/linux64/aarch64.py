@@ -7,6 +7,7 @@
 from amoco.cas.expressions import cst, top
 from amoco.system import elf
 from amoco.system.structs import Consts
+from amoco.system.memory import MemoryMap
 from amoco.system.core import CoreExec
 from amoco.arch.arm.cpu_armv8 import cpu
 
@@ -166,6 +167,7 @@ class OS(object):
         self.PAGESIZE = conf.pagesize
         self.ASLR = conf.aslr
         self.NX = conf.nx
+        self.PAGEDMEM = conf.pagedmem
         self.tasks = []
         self.abi = None
 
@@ -177,6 +179,8 @@ class OS(object):
         "load the program into virtual memory (populate the mmap dict)"
         p = Task(bprm, cpu)
         p.OS = self
+        if self.PAGEDMEM:
+            p.state.mmap = MemoryMap(self.PAGESIZE)
         self.tasks.append(p)
         # create text and data segments according to elf header:
         for s in bprm.Phdr:
@@ -69,6 +69,11 @@ class MachO(BinFormat):
 
     is_MachO = True
 
+    @staticmethod
+    def probe(data):
+        magic = int.from_bytes(data[:4], "little")
+        return magic in (MH_MAGIC, MH_MAGIC_64, FAT_CIGAM)
+
     @property
     def entrypoints(self):
         if self.__entry:
@@ -169,25 +174,28 @@ class MachO(BinFormat):
                 total += c.vmsize
         return total
 
-    def getinfo(self, target):
-        """getinfo return a triplet (s,off,vaddr) with segment, offset
-        into segment, and segment virtual base address that contains the
-        target argument.
+    def ranges(self):
+        """
+        yields address ranges of sections and then of segments, so that
+        getinfo returns the section that contains the target if any, or
+        otherwise its segment.
         """
-        res = (None, 0, 0)
+        segs = [c for c in self.cmds if c.cmd in (LC_SEGMENT, LC_SEGMENT_64)]
+        for c in segs:
+            for s in c.sections:
+                yield (s.addr, s.addr + s.size_, s)
+        for c in segs:
+            yield (c.vmaddr, c.vmaddr + c.vmsize, c)
+
+    def code_ranges(self):
+        "yields address ranges of sections that contain instructions"
+        m = S_ATTR_PURE_INSTRUCTIONS | S_ATTR_SOME_INSTRUCTIONS
         for c in self.cmds:
-            if c.cmd in (
-                LC_SEGMENT,
-                LC_SEGMENT_64,
-            ):
-                if c.vmaddr <= target < (c.vmaddr + c.vmsize):
-                    res = (c, (target - c.vmaddr), c.vmaddr)
-                    for s in c.sections:
-                        if s.addr <= target < s.addr + s.size_:
-                            res = (s, (target - s.addr), s.addr)
-                            break
-                    break
-        return res
+            if c.cmd in (LC_SEGMENT, LC_SEGMENT_64):
+                for s in c.sections:
+                    a = s.flags.attr
+                    if ((a[0] | (a[1] << 8) | (a[2] << 16)) << 8) & m:
+                        yield (s.addr, s.addr + s.size_, s)
 
     def checksec(self):
         "check for usual OSX security features."
@@ -285,9 +293,8 @@ class MachO(BinFormat):
             self.__file.seek(off)
             if sz == 0:
                 sz = elt.size()
-            for n in range(count):
-                data = self.__file.read(sz)
-                tab.append(elt(data))
+            data = self.__file.read(sz * count)
+            tab = elt().unpack_array(data, 0, count, stride=sz)
         return tab
 
     def __read_symtab(self, s):
@@ -36,6 +36,9 @@ In amoco's Memory model, a MemoryZone holds an ordered list of memory
 objects (see class :class:`mo`) and provides method to locate objects
 within an address range, or insert new objects at a given offset,
 thus allowing the "read" or "write" of expressions of those "values".
+The zone also maintains the sorted list of its objects' offsets, so that
+locating an object is a binary search, and writing only updates the slice
+of objects that are overwritten.
 """
 
 from amoco.logger import Log
@@ -57,6 +60,11 @@ class MemoryMap(object):
 
     Attributes:
         _zones : dictionary of zones, keys are the related address expressions.
+        _shared : set of keys of zones that are shared with other MemoryMaps.
+        watchers : list of functions called with (address, length) arguments
+            whenever concrete addresses are written (with address None if
+            the whole map may have changed.) Watchers are neither copied
+            nor pickled.
 
     Methods:
         newzone(label): creates a new memory zone with the given label related
@@ -76,6 +84,10 @@ class MemoryMap(object):
             given (possibly symbolic) address. Default endianness is 'little'.
             Use endian=-1 to indicate big endian convention.
 
+        memview(address,l): returns a memoryview of the l bytes at address if
+            these bytes are all concrete bytes of a :class:`PagedMemoryZone`,
+            or None otherwise.
+
         restruct(): optimize all zones to merge contiguous raw bytes into single
             mo objects.
 
@@ -84,14 +96,45 @@ class MemoryMap(object):
 
         merge(other): update this MemoryMap with a new MemoryMap, merging
             overlapping zones with values from the new map.
+
+        changed(address,l): calls all watchers with given arguments.
+
+        copy(): returns a copy-on-write copy of this MemoryMap: zones are
+            shared by both maps until the first write into a zone, which
+            then copies it (or only copies the written pages of a
+            :class:`PagedMemoryZone`.)
+
+        shared(): returns the number of bytes currently shared with other maps.
+
+    Args:
+        pagesize (int): if not 0, the default zone is a :class:`PagedMemoryZone`
+            with pages of this size (defaults to 0.)
     """
 
-    __slots__ = ["_zones", "misc", "view"]
+    __slots__ = ["_zones", "_shared", "misc", "view", "watchers"]
 
-    def __init__(self):
-        self._zones = {None: MemoryZone()}
+    def __init__(self, pagesize=0):
+        if pagesize > 0:
+            self._zones = {None: PagedMemoryZone(pagesize)}
+        else:
+            self._zones = {None: MemoryZone()}
+        self._shared = set()
         self.misc = {}
         self.view = mmapView(self)
+        self.watchers = []
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.__slots__ if k != "watchers"}
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+        self.watchers = []
+
+    def changed(self, address, l):
+        "notify watchers that l bytes at concrete address have been modified"
+        for w in self.watchers:
+            w(address, l)
 
     def newzone(self, label):
         z = MemoryZone()
@@ -129,6 +172,13 @@ class MemoryMap(object):
         else:
             raise MemoryMapError(address)
 
+    def memview(self, address, l):
+        r, o = self.reference(address)
+        z = self._zones.get(r, None)
+        if z is not None and hasattr(z, "memview"):
+            return z.memview(o, l)
+        return None
+
     def write(self, address, expr, endian=1):
         r, o = self.reference(address)
         if r is not None and not r._is_def:
@@ -137,8 +187,22 @@ class MemoryMap(object):
         if r not in self._zones:
             z = self.newzone(r)
         else:
-            z = self._zones[r]
+            z = self._own(r)
         z.write(o, expr, endian)
+        if self.watchers and r is None:
+            if isinstance(expr, (bytes, bytearray, memoryview)):
+                l = len(expr)
+            else:
+                l = expr.length
+            self.changed(o, l)
+
+    def _own(self, r):
+        # get zone r for writing, copying it first if it is shared:
+        z = self._zones[r]
+        if r in self._shared:
+            z = self._zones[r] = z.copy()
+            self._shared.discard(r)
+        return z
 
     def __getitem__(self, i):
         sta, sto = self._zones[None].range()
@@ -164,17 +228,33 @@ class MemoryMap(object):
 
     def copy(self):
         mm = self.__class__()
-        for k, z in self._zones.items():
-            mm._zones[k] = z.copy()
+        mm._zones = dict(self._zones)
+        mm._shared = set(self._zones)
+        self._shared.update(self._zones)
         return mm
 
+    def shared(self):
+        res = 0
+        for r, z in self._zones.items():
+            if r in self._shared:
+                sta, sto = z.range()
+                res += sto - sta
+            elif hasattr(z, "shared"):
+                res += z.shared()
+        return res
+
     def merge(self, other):
+        if self.watchers:
+            self.changed(None, 0)
         for r, z in other._zones.items():
             if r in self._zones:
+                z0 = self._own(r)
                 for o in z._map:
-                    self._zones[r].addtomap(o)
+                    z0.addtomap(o)
             else:
                 self._zones[r] = z
+                self._shared.add(r)
+                other._shared.add(r)
 
 
 # ------------------------------------------------------------------------------
@@ -247,9 +327,9 @@ class MemoryZone(object):
 
     def locate(self, vaddr):
         p = self.__cache
-        if vaddr in p:
-            return p.index(vaddr)
         i = bisect_left(p, vaddr)
+        if i < len(p) and p[i] == vaddr:
+            return i
         if i == 0:
             return None
         else:
@@ -314,25 +394,22 @@ class MemoryZone(object):
     def write(self, vaddr, data, endian=1):
         self.addtomap(mo(vaddr, data, endian))
 
+    def __splice(self, i, j, Z):
+        # replace mo objects _map[i:j] by those in list Z, and update
+        # the cache accordingly (rather than rebuilding it.)
+        self._map[i:j] = Z
+        self.__cache[i:j] = [o.vaddr for o in Z]
+
     def addtomap(self, z):
         i = self.locate(z.vaddr)
         j = self.locate(z.end)
-        # h = []
         if j is None:
             assert i is None or i == 0
-            self._map.insert(0, z)
-            self.__update_cache()
+            self.__splice(0, 0, [z])
             return
         if j == i:
-            ii = self._map[i].copy()
-            ii.trim(z.vaddr)
-            # h.insert(0,ii)
             Z = self._map[i].write(z.vaddr, z.data.val, z.data.endian)
-            i += 1
-            for newz in Z:
-                self._map.insert(i, newz)
-                i += 1
-            self.__update_cache()
+            self.__splice(i + 1, i + 1, Z)
             return
         # i!=j cases:
         if i is not None:
@@ -340,37 +417,36 @@ class MemoryZone(object):
         # delete & update every overwritten zones
         # by adjusting [i,j]:
         if z.end in self._map[j]:
-            jj = self._map[j].copy()
-            jj.setlen(z.end - z.vaddr)
-            # h.insert(0,jj)
             self._map[j].trim(z.end)
+            self.__cache[j] = self._map[j].vaddr
         else:
             j += 1
         Z = [z]
         if i is None:
             i = -1
         elif z.vaddr <= self._map[i].end:
-            ii = self._map[i].copy()
-            ii.trim(z.vaddr)
-            # h.insert(0,ii)
             # overright data:
             Z = self._map[i].write(z.vaddr, z.data.val, z.data.endian)
         i += 1
-        # h = self._map[i:j]+h
-        del self._map[i:j]
-        # insert new zones:
-        for newz in Z:
-            self._map.insert(i, newz)
-            i += 1
-        # if len(h)>0: self.__hist.insert(0,h)
-        self.__update_cache()
+        # delete overwritten zones and insert new zones:
+        self.__splice(i, j, Z)
+
+    def erase(self, vaddr, l):
+        """
+        removes the l bytes starting at vaddr from the zone, ie. these bytes
+        become unmapped (only applies to zones without raw mo objects around
+        the erased area, as is the case for overlays of PagedMemoryZone.)
+        """
+        self.write(vaddr, b"\0" * l)
+        i = self.locate(vaddr)
+        self.__splice(i, i + 1, [])
 
     def restruct(self):
         if len(self._map) == 0:
             return
         m = [self._map.pop(0)]
         for z in self._map:
-            rawtype = z.data._is_raw & m[-1].data._is_raw
+            rawtype = _mergeable(z.data, m[-1].data)
             if rawtype and (z.vaddr == m[-1].end):
                 try:
                     m[-1].data.val += z.data.val
@@ -394,8 +470,9 @@ class MemoryZone(object):
         for z in self._map:
             if z.data._is_raw:
                 off = 0
-                for s in g.findall(z.data.val):
-                    off = z.data.val.index(s, off)
+                val = bytes(z.data.val)
+                for s in g.findall(val):
+                    off = val.index(s, off)
                     res.append(z.vaddr + off)
                     off += len(s)
         return res
@@ -417,6 +494,226 @@ class MemoryZone(object):
         return b"".join(dump)
 
 
+# ------------------------------------------------------------------------------
+class PagedMemoryZone(object):
+    """A PagedMemoryZone is an alternative to the default (rel=None) MemoryZone
+    of a MemoryMap, where concrete bytes are stored in fixed-size bytearray
+    pages. Only symbolic values (expressions or blobs) are stored as mo objects,
+    in an *overlay* MemoryZone. Every byte is thus either a concrete byte of a
+    page, or a byte of the overlay (possibly unmapped.)
+
+    Args:
+        pagesize (int): size of pages in bytes, defaults to 4096.
+
+    Attributes:
+        rel : always None.
+        pagesize : the size of pages.
+        pages : dict of allocated pages, keys are page numbers and values are
+            (data, mask) bytearrays where mask bytes indicate which data bytes
+            are mapped concrete bytes.
+        _shared : set of page numbers shared with other zones or with a
+            file mapped in memory (pages are copied on write, see copy.)
+        overlay : the :class:`MemoryZone` that holds symbolic mo objects.
+        _map : the (computed) ordered list of mo objects of this zone.
+
+    Methods:
+        memview(vaddr,l): returns a memoryview of the l concrete bytes at
+            vaddr, or None if these bytes are not all concrete or not located
+            within a single page. Note that the memoryview is not a copy.
+
+        copy(): returns a copy of the zone that shares all its pages with
+            the current zone until they are written.
+
+        shared(): returns the number of bytes of pages shared with other zones.
+
+    Other methods are those of :class:`MemoryZone`.
+    """
+
+    __slots__ = ["rel", "pagesize", "pages", "overlay", "_shared"]
+
+    def __init__(self, pagesize=4096):
+        self.rel = None
+        self.pagesize = pagesize
+        self.pages = {}
+        self.overlay = MemoryZone()
+        self._shared = set()
+
+    def __runs(self):
+        # yields concrete runs (vaddr, bytes) in order:
+        ps = self.pagesize
+        cur = None
+        for p in sorted(self.pages):
+            data, mask = self.pages[p]
+            o = mask.find(1)
+            while o >= 0:
+                e = mask.find(0, o)
+                if e < 0:
+                    e = ps
+                v = p * ps + o
+                if cur is not None and cur[0] + len(cur[1]) == v:
+                    cur[1].extend(data[o:e])
+                else:
+                    if cur is not None:
+                        yield (cur[0], bytes(cur[1]))
+                    cur = (v, bytearray(data[o:e]))
+                o = mask.find(1, e)
+        if cur is not None:
+            yield (cur[0], bytes(cur[1]))
+
+    @property
+    def _map(self):
+        m = [mo(v, b) for (v, b) in self.__runs()]
+        m.extend(self.overlay._map)
+        m.sort(key=lambda o: o.vaddr)
+        return m
+
+    def range(self):
+        r = list(self.__runs())
+        sta, sto = self.overlay.range()
+        if len(r) == 0:
+            return (sta, sto)
+        rsta, rsto = r[0][0], r[-1][0] + len(r[-1][1])
+        if sta == sto:
+            return (rsta, rsto)
+        return (min(sta, rsta), max(sto, rsto))
+
+    def __str__(self):
+        return MemoryZone.__str__(self)
+
+    def copy(self):
+        z = PagedMemoryZone(self.pagesize)
+        z.pages = dict(self.pages)
+        z._shared = set(self.pages)
+        self._shared.update(self.pages)
+        z.overlay = self.overlay.copy()
+        return z
+
+    def shared(self):
+        return len(self._shared) * self.pagesize
+
+    def __page(self, p):
+        # get page p for writing, allocating it or copying it if shared:
+        if p in self._shared:
+            data, mask = self.pages[p]
+            self.pages[p] = (bytearray(data), bytearray(mask))
+            self._shared.discard(p)
+        elif p not in self.pages:
+            self.pages[p] = (bytearray(self.pagesize), bytearray(self.pagesize))
+        return self.pages[p]
+
+    def memview(self, vaddr, l):
+        p, o = divmod(vaddr, self.pagesize)
+        if o + l > self.pagesize or p not in self.pages:
+            return None
+        data, mask = self.pages[p]
+        if mask.find(0, o, o + l) >= 0:
+            return None
+        return memoryview(data)[o : o + l]
+
+    def read(self, vaddr, l):
+        ps = self.pagesize
+        # fast path for concrete bytes within a single page:
+        p, o = divmod(vaddr, ps)
+        if o + l <= ps and p in self.pages:
+            data, mask = self.pages[p]
+            if mask.find(0, o, o + l) < 0:
+                return [bytes(data[o : o + l])]
+        # otherwise split [vaddr,vaddr+l[ into concrete and overlay runs:
+        runs = []
+        end = vaddr + l
+        while vaddr < end:
+            p, o = divmod(vaddr, ps)
+            n = min(end - vaddr, ps - o)
+            if p in self.pages:
+                data, mask = self.pages[p]
+                k = o
+                while k < o + n:
+                    c = mask[k]
+                    e = mask.find(1 - c, k, o + n)
+                    if e < 0:
+                        e = o + n
+                    if runs and runs[-1][0] == c:
+                        runs[-1][2] += e - k
+                    else:
+                        runs.append([c, p * ps + k, e - k])
+                    k = e
+            elif runs and runs[-1][0] == 0:
+                runs[-1][2] += n
+            else:
+                runs.append([0, vaddr, n])
+            vaddr += n
+        res = []
+        for c, v, n in runs:
+            if c:
+                res.append(self.__getbytes(v, n))
+            else:
+                res.extend(self.overlay.read(v, n))
+        return res
+
+    def __getbytes(self, vaddr, l):
+        b = []
+        while l > 0:
+            p, o = divmod(vaddr, self.pagesize)
+            n = min(l, self.pagesize - o)
+            b.append(self.pages[p][0][o : o + n])
+            vaddr += n
+            l -= n
+        return bytes(b"".join(b))
+
+    def write(self, vaddr, data, endian=1):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return self.__setbytes(vaddr, data)
+        if data._is_cst and not isinstance(data, blob):
+            return self.__setbytes(vaddr, data.to_bytes(endian))
+        z = mo(vaddr, data, endian)
+        self.overlay.addtomap(z)
+        # these bytes are not concrete anymore:
+        ps = self.pagesize
+        sta, sto = z.vaddr, z.end
+        for p in [p for p in self.pages if sta < (p + 1) * ps and p * ps < sto]:
+            mask = self.__page(p)[1]
+            o = max(sta - p * ps, 0)
+            e = min(sto - p * ps, ps)
+            mask[o:e] = bytes(e - o)
+
+    def __setbytes(self, vaddr, b):
+        l = len(b)
+        if len(self.overlay._map) > 0:
+            # the overlay might define some of these bytes: we write these
+            # bytes to the overlay and then remove the resulting raw mo.
+            self.overlay.erase(vaddr, l)
+        ps = self.pagesize
+        full = None
+        i = 0
+        while i < l:
+            p, o = divmod(vaddr + i, ps)
+            n = min(l - i, ps - o)
+            if n == ps and isinstance(b, memoryview) and b.readonly:
+                # file-backed page is shared until written:
+                if full is None:
+                    full = b"\x01" * ps
+                self.pages[p] = (b[i : i + n], full)
+                self._shared.add(p)
+            else:
+                data, mask = self.__page(p)
+                data[o : o + n] = b[i : i + n]
+                mask[o : o + n] = b"\x01" * n
+            i += n
+
+    def addtomap(self, z):
+        self.write(z.vaddr, z.data.val, z.data.endian)
+
+    def restruct(self):
+        self.overlay.restruct()
+
+    def shift(self, offset):
+        raise MemoryMapError("can't shift a paged memory zone")
+
+    grep = MemoryZone.grep
+    is_raw = MemoryZone.is_raw
+    dump = MemoryZone.dump
+
+
 # ------------------------------------------------------------------------------
 class mo(object):
     """A mo object essentially associates a datadiv with a memory offset, and
@@ -556,14 +853,19 @@ class datadiv(object):
         return len(self.val)
 
     def __repr__(self):
-        s = repr(self.val)
+        v = self.val
+        if isinstance(v, memoryview):
+            v = bytes(v[:32])
+        s = repr(v)
         if len(s) > 32:
             s = s[:32] + "..."
-            if isinstance(self.val, bytes):
+            if isinstance(v, bytes):
                 s += "'"
         return "<datadiv:%s>" % s
 
     def __str__(self):
+        if isinstance(self.val, memoryview):
+            return repr(bytes(self.val[:32]))
         return repr(self.val) if self._is_raw else str(self.val)
 
     def cut(self, l):
@@ -591,10 +893,13 @@ class datadiv(object):
             lv = len(self)
         except TypeError:
             lv = self.val.length
-        if o == 0 and l == lv:
+        if o == 0 and l == lv and not isinstance(self.val, memoryview):
             return (self.val, 0)
         if self._is_raw:
             res = self.val[o : o + l]
+            if isinstance(res, memoryview):
+                # file-backed data is copied only when read:
+                res = res.tobytes()
             return (res, l - len(res))
         if o >= lv:
             return (None, l)
@@ -606,6 +911,13 @@ class datadiv(object):
         P = [datadiv(data, endian)]
         olv = o + len(data)
         endl = len(self) - olv
+        if isinstance(self.val, memoryview):
+            # keep file-backed parts without copying:
+            if endl > 0:
+                P.append(datadiv(self.val[olv:], self.endian))
+            if o > 0:
+                P.insert(0, datadiv(self.val[:o], self.endian))
+            return mergeparts(P)
         if endl > 0:
             P.append(datadiv(self.getpart(olv, endl)[0], self.endian))
         if o > 0:
@@ -629,7 +941,7 @@ def mergeparts(P):
     parts = [P.pop(0)]
     while len(P) > 0:
         p = P.pop(0)
-        if parts[-1]._is_raw and p._is_raw:
+        if _mergeable(parts[-1], p):
             try:
                 parts[-1].val += p.val
             except TypeError:
@@ -639,5 +951,13 @@ def mergeparts(P):
     return parts
 
 
+def _mergeable(d1, d2):
+    "returns True if raw datadiv objects d1 and d2 can be merged"
+    if d1._is_raw and d2._is_raw:
+        # memoryviews (file-backed data) are not merged to avoid copies:
+        return not (isinstance(d1.val, memoryview) or isinstance(d2.val, memoryview))
+    return False
+
+
 class MemoryMapError(Exception):
     pass
@@ -62,6 +62,10 @@ class PE(BinFormat):
 
     is_PE = True
 
+    @staticmethod
+    def probe(data):
+        return data[:2] == b"MZ"
+
     @property
     def entrypoints(self):
         l = [self.Opt.AddressOfEntryPoint + self.basemap]
@@ -96,12 +100,10 @@ class PE(BinFormat):
         if self.NT.SizeOfOptionalHeader != len(self.Opt):
             logger.warning("Optional header size mismatch")
         # read Sections:
-        self.sections = []
         offset = self.DOS.e_lfanew + len(self.NT) + self.NT.SizeOfOptionalHeader
-        for i in range(self.NT.NumberOfSections):
-            s = SectionHdr(data, offset)
-            self.sections.append(s)
-            offset += len(s)
+        n = self.NT.NumberOfSections
+        shdrs = data[offset : offset + n * SectionHdr.size()]
+        self.sections = list(SectionHdr().unpack_array(shdrs, 0, n))
         self.functions = self.__functions()
         self.variables = self.__variables()
         self.tls = self.__tls()
@@ -147,19 +149,28 @@ class PE(BinFormat):
         """
         if absolute:
             addr = addr - self.basemap
-        # now we have addr so we can see in which section/segment it is...
-        # sections are smaller than segments so we try first with Shdr
-        # but this may lead to errors because what really matters are segments
-        # loaded by the kernel binfmt_elf.c loader.
-        for s in self.sections:
-            if s.Characteristics == IMAGE_SCN_LNK_REMOVE:
-                continue
-            if s.RVA <= addr < s.RVA + s.VirtualSize:
-                return s, addr - s.RVA
+        # now we have addr so we can see in which section it is...
+        s, offset, _ = self.secindex.find(addr + self.basemap)
+        if s is not None:
+            return s, offset
         if 0 <= addr < self.Opt.SizeOfImage:
             return 0, addr
         return None, 0
 
+    def ranges(self):
+        "yields the absolute address ranges of all loaded sections"
+        for s in self.sections:
+            if s.Characteristics == IMAGE_SCN_LNK_REMOVE:
+                continue
+            start = self.basemap + s.RVA
+            yield (start, start + s.VirtualSize, s)
+
+    def code_ranges(self):
+        "yields the absolute address ranges of executable sections"
+        for start, end, s in self.ranges():
+            if s.Characteristics & (IMAGE_SCN_CNT_CODE | IMAGE_SCN_MEM_EXECUTE):
+                yield (start, end, s)
+
     def getdata(self, addr, absolute=False):
         "get section bytes from given virtual address to end of mapped section."
         s, offset = self.locate(addr, absolute)
@@ -478,6 +489,7 @@ class OptionalHdr(StructFormatter):
             f.pop(8)
             for x in (8, 23, 24, 25, 26):
                 f[x].typename = "Q"
+            self.update_layout()
         elif magic == b"\x07\x01":
             logger.info("ROM Magic found (unsupported)")
         else:
@@ -1055,8 +1067,8 @@ class ImportLookupTable(object):
     def readimports(self, data):
         self.imports = []
         fshift = (self.elsize * 8) - 1
-        while len(data) >= self.elsize:
-            v = struct.unpack(self.fmt, data[: self.elsize])[0]
+        data = data[: len(data) - (len(data) % self.elsize)]
+        for (v,) in struct.iter_unpack(self.fmt, data):
             if v == 0:
                 return
             flag = v >> fshift
@@ -1064,7 +1076,6 @@ class ImportLookupTable(object):
                 self.imports.append([flag, v & 0xFFFF])
             elif flag == 0:
                 self.imports.append([flag, v & 0x7FFFFFFF])
-            data = data[self.elsize :]
 
 
 class NameTableEntry(object):
@@ -1096,6 +1107,7 @@ class TLSTable(StructFormatter):
         if magic == 0x20B:
             for f in self.fields:
                 f.typename = "Q"
+            self.update_layout()
         if data:
             self.unpack(data)
 
@@ -1188,6 +1200,7 @@ class LoadConfigTable(StructFormatter):
                 29,
             ):
                 self.fields[i].typename = "Q"
+            self.update_layout()
         self.flag_formatter(
             "Characteristics",
             "ProcessHeapFlags",
@@ -1317,6 +1330,7 @@ class ResourceDirectoryEntry(StructFormatter):
 class ResourceDirectoryTypeEntry(ResourceDirectoryEntry):
     def __init__(self, data, offset=0):
         self.fields[0].name = "ResourceType"
+        self.update_layout()
         self.name_formatter("ResourceType")
         super().__init__(data, offset)
 
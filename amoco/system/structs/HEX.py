@@ -42,6 +42,10 @@ with Consts("HEXcode"):
 class HEX(BinFormat):
     is_HEX = True
 
+    @staticmethod
+    def probe(data):
+        return data.lstrip()[:1] == b":"
+
     def __init__(self, f, offset=0):
         self.L = []
         self._filename = f.name
@@ -47,6 +47,11 @@ with Consts("SREC"):
 class SREC(BinFormat):
     is_SREC = True
 
+    @staticmethod
+    def probe(data):
+        data = data.lstrip()
+        return data[:1] == b"S" and data[1:2].isdigit()
+
     def __init__(self, f, offset=0):
         self.L = []
         self._entrypoint = 0
@@ -4,14 +4,29 @@
 # Copyright (C) 2016 Axel Tillequin (bdcht3@gmail.com)
 # published under GPLv2 license
 
+import struct
+
 from amoco.logger import Log
 
 logger = Log(__name__)
 logger.debug("loading module")
 
+try:
+    import numpy as np
+except ImportError:
+    logger.verbose("numpy package not found => no bulk unpacking of structures")
+    has_numpy = False
+else:
+    logger.verbose("numpy package imported")
+    has_numpy = True
+
 # ------------------------------------------------------------------------------
 
 
+class container(object):
+    "generic holder of the unpacked values of a structure instance"
+
+
 class StructCore(object):
     """
     A StructCore child class represents a C struct or union declaration. It is
@@ -51,8 +66,7 @@ class StructCore(object):
     def __new__(cls, *args, **kargs):
         obj = super(StructCore, cls).__new__(cls)
         obj.fields = [f.copy(obj) for f in cls.fields]
-        t = type("container", (object,), {})
-        obj._v = t()
+        obj._v = container()
         return obj
 
     def __getitem__(self, fname):
@@ -92,6 +106,9 @@ class StructCore(object):
         value is infinite if any of these field is a VarField.
         """
         psize = {32: 4, 64: 8}.get(psize, psize)
+        fields, sz = _sizes.get((cls, psize), (None, 0))
+        if fields is cls.fields:
+            return sz
         A = cls.align_value(psize) or 1
         sz = 0
         for f in cls.fields:
@@ -105,8 +122,43 @@ class StructCore(object):
         r = sz % A
         if (not cls.packed) and r > 0:
             sz += A - r
+        if sz < float("Infinity"):
+            _sizes[(cls, psize)] = (cls.fields, sz)
         return sz
 
+    def update_layout(self):
+        """
+        must be called when the fields of this instance are modified (byte
+        ordering, types, counts or names) so that it does not use the
+        StructCodec of its class anymore (see codec).
+        """
+        self.__dict__["_custom_layout"] = True
+
+    def codec(self, psize=0):
+        """
+        returns the (cached) StructCodec associated to the fields of this
+        instance, or None if some field has no fixed-layout encoding.
+        The codec is cached on the class unless the fields of this instance
+        have been modified (see update_layout), in which case it is cached
+        for the actual fields' types, counts and byte ordering.
+        """
+        cls = self.__class__
+        if "_custom_layout" not in self.__dict__ and len(self.fields) == len(cls.fields):
+            fields, c = _codecs.get((cls, psize), (None, None))
+            if fields is cls.fields:
+                return c
+            c = StructCodec.compile(cls, psize)
+            _watch(cls.fields)
+            _codecs[(cls, psize)] = (cls.fields, c)
+            return c
+        key = [(f.typename, f.count, f.order, f.name) for f in self.fields]
+        key = (cls, psize, tuple(key))
+        try:
+            return _layouts[key]
+        except KeyError:
+            c = _layouts[key] = StructCodec.compile(self, psize)
+            return c
+
     def __len__(self):
         """
         This is an instance method that computes the
@@ -153,6 +205,18 @@ class StructCore(object):
         return max([f.align_value(psize) for f in cls.fields])
 
     def unpack(self, data, offset=0, psize=0):
+        c = self.codec(psize)
+        if c is not None and offset % c.align == 0:
+            try:
+                D = c.unpack(data, offset)
+            except (struct.error, TypeError):
+                # let the generic path below report the error:
+                pass
+            else:
+                if self.typedef:
+                    return D[self.fields[0].name]
+                self._v.__dict__.update(D)
+                return self
         for f in self.fields:
             if self.union is False and not self.packed:
                 offset = f.align(offset, psize)
@@ -178,7 +242,73 @@ class StructCore(object):
                 offset += f.size(psize)
         return self
 
+    def dtype(self, psize=0, itemsize=0):
+        """
+        returns the numpy dtype of this structure based on its (instance)
+        fields, taking into account padding rules, fields endianness and
+        psize, or None if numpy is not available or if some field has no
+        fixed-layout numpy type (bitfields, variable-length fields, etc).
+        The itemsize argument allows to extend the size of the structure
+        (when it is stored in a table of larger entries.)
+        """
+        if not has_numpy or self.typedef:
+            return None
+        names, formats, offsets = [], [], []
+        o = 0
+        A = 1
+        for f in self.fields:
+            t = f.dtype(psize)
+            if t is None or not f.name:
+                return None
+            if self.union is False and not self.packed:
+                o = f.align(o, psize)
+            names.append(f.name)
+            formats.append(t)
+            offsets.append(o if self.union is False else 0)
+            A = max(A, f.align_value(psize) or 1)
+            if self.union is False:
+                o += f.size(psize)
+            else:
+                o = max(o, f.size(psize))
+        r = o % A
+        if (not self.packed) and r > 0:
+            o += A - r
+        D = {"names": names, "formats": formats, "offsets": offsets}
+        D["itemsize"] = max(o, itemsize)
+        return np.dtype(D)
+
+    def unpack_array(self, data, offset=0, count=None, psize=0, stride=0):
+        """
+        unpacks count consecutive structures (or as many as possible if
+        count is None) from data at given offset, with an optional stride
+        for entries larger than the structure.
+        The layout of entries is given by the fields of this instance and
+        the resulting StructArray decodes all entries at once into a numpy
+        structured array whenever possible.
+        """
+        dt = self.dtype(psize, stride)
+        sz = len(self) if dt is None else self.dtype(psize).itemsize
+        stride = stride or sz
+        if count is None:
+            count = max(0, (len(data) - offset - sz) // stride + 1)
+        if stride < sz or len(data) < offset + (count - 1) * stride + sz:
+            if count > 0:
+                raise StructureError(self.__class__.__name__)
+        return StructArray(self, data, offset, count, psize, stride, dt)
+
     def pack(self, data=None, psize=0):
+        c = self.codec(psize)
+        if c is not None and c.packer is not None and not self.union:
+            if data is None:
+                data = [getattr(self._v, f.name) for f in self.fields]
+            try:
+                res = c.packer.pack(*data)
+            except struct.error:
+                pass
+            else:
+                if not self.packed:
+                    res = res.ljust(self.size(psize), b"\0")
+                return res
         if data is None:
             data = []
             for f in self.fields:
@@ -242,6 +372,200 @@ class StructCore(object):
 # ------------------------------------------------------------------------------
 
 
+class StructCodec(object):
+    """
+    A StructCodec is the compiled form of the unpack logic of a structure
+    with fixed layout (ie. without variable-length fields.) Fields are
+    grouped in struct.Struct objects (one per run of fields with the same
+    byte ordering) with explicit padding, so that unpacking the structure
+    requires a single unpack_from call in most cases.
+    StructCodecs are cached by StructCore.codec for each class and psize,
+    or for each modified instance's fields' types, counts and byte ordering.
+
+    Attributes:
+        groups (list): the (offset, struct.Struct) tuples of field groups.
+        items (list): the (name, n, conv) tuple for each field, where n is
+                      the number of struct items of the field and conv the
+                      function that returns its value from these items.
+        span (int): the number of bytes covered by all fields.
+        align (int): the codec can only unpack data at offsets that are
+                     multiple of align.
+        packer (struct.Struct): a single Struct that packs all fields' values
+                      (or None if fields are not contiguous or if some field's
+                      value is not a single struct item.)
+    """
+
+    def __init__(self):
+        self.groups = []
+        self.items = []
+        self.names = None
+        self.span = 0
+        self.align = 1
+        self.packer = None
+
+    @classmethod
+    def compile(cls, obj, psize=0):
+        "returns the StructCodec of structure instance obj, or None"
+        c = cls()
+        packed = obj.packed or (obj.union is not False)
+        if not obj.packed:
+            # field alignment rules apply to offsets in data, so that the
+            # codec layout is valid only for offsets multiple of:
+            c.align = max([f.align_value(psize) or 1 for f in obj.fields])
+        offset = 0
+        groups = []
+        pad = 0
+        for f in obj.fields:
+            spec = f.codec(psize)
+            if spec is None:
+                return None
+            order, fmt, n, conv = spec
+            if not packed:
+                offset = f.align(offset, psize)
+            sz = f.size(psize)
+            if struct.calcsize(order + fmt) != sz:
+                return None
+            if groups and groups[-1][0] == order and offset >= groups[-1][3]:
+                g = groups[-1]
+                pad += offset - g[3]
+                g[2] += "%dx%s" % (offset - g[3], fmt)
+                g[3] = offset + sz
+            else:
+                groups.append([order, offset, fmt, offset + sz])
+            c.items.append((f.name, n, conv))
+            c.span = max(c.span, offset + sz)
+            if obj.union is False:
+                offset += sz
+        c.groups = [(o, struct.Struct(x + F)) for (x, o, F, _) in groups]
+        if all((conv is None) for (_, _, conv) in c.items):
+            c.names = [name for (name, _, _) in c.items]
+            if len(groups) == 1 and pad == 0:
+                c.packer = c.groups[0][1]
+        return c
+
+    def unpack(self, data, offset=0):
+        "returns the dict of fields' values unpacked from data at offset"
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = data[offset : offset + self.span]
+            offset = 0
+        if len(self.groups) == 1:
+            o, S = self.groups[0]
+            vals = S.unpack_from(data, offset + o)
+        else:
+            vals = []
+            for o, S in self.groups:
+                vals.extend(S.unpack_from(data, offset + o))
+        if self.names is not None:
+            return dict(zip(self.names, vals))
+        D = {}
+        i = 0
+        for name, n, conv in self.items:
+            if conv is None:
+                v = vals[i]
+            else:
+                v = conv(vals[i : i + n])
+            i += n
+            if name:
+                D[name] = v
+            else:
+                # bitfield subnames/subvalues:
+                D.update(v)
+        return D
+
+
+class StructArray(object):
+    """
+    A StructArray represents count consecutive structures of the same
+    type (a table of ELF symbols, PE sections, etc) decoded on demand.
+    When numpy is available and the structure has a fixed layout (see
+    StructCore.dtype), all entries are decoded at once as a numpy structured
+    array. Otherwise, entries are unpacked from the data buffer only when
+    accessed. In both cases, StructCore instances are created only when an
+    entry is accessed and are then kept so that they can be updated.
+
+    Attributes:
+        array (ndarray): the numpy structured array of all entries, or None.
+        names (list): the names of fields.
+    """
+
+    def __init__(self, template, data, offset, count, psize, stride, dt=None):
+        self.template = template
+        self.psize = psize
+        self.count = count
+        self.names = [f.name for f in template.fields]
+        self.array = None
+        self.__data = data
+        self.__offset = offset
+        self.__stride = stride
+        self.__objs = {}
+        if dt is not None:
+            self.array = np.frombuffer(data, dtype=dt, count=count, offset=offset)
+            self.__bytes = [n for n in dt.names if dt.fields[n][0].kind == "S"]
+
+    def new(self):
+        "returns a new (empty) structure with the same fields as template"
+        obj = self.template.__class__()
+        obj.fields = [f.copy(obj) for f in self.template.fields]
+        if "_custom_layout" in self.template.__dict__:
+            obj.update_layout()
+        return obj
+
+    def __len__(self):
+        return self.count
+
+    def column(self, name):
+        "returns the sequence of values of field name for all entries"
+        if self.array is not None:
+            return self.array[name]
+        c = self.template.codec(self.psize)
+        if c is None or (self.__offset % c.align) or (self.__stride % c.align):
+            return [self[i][name] for i in range(self.count)]
+        o, s = self.__offset, self.__stride
+        return [c.unpack(self.__data, o + i * s)[name] for i in range(self.count)]
+
+    def values(self, name):
+        "returns the list of (python) values of field name for all entries"
+        if self.array is not None:
+            return self.array[name].tolist()
+        return self.column(name)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        obj = self.__objs.get(i)
+        if obj is not None:
+            return obj
+        obj = self.new()
+        if self.array is None:
+            offset = self.__offset + i * self.__stride
+            obj = obj.unpack(self.__data, offset, self.psize)
+        else:
+            row = self.array[i]
+            for f in obj.fields:
+                v = row[f.name]
+                if f.name in self.__bytes:
+                    # numpy strips trailing null bytes:
+                    v = v.ljust(f.size(self.psize), b"\0")
+                elif isinstance(v, np.ndarray):
+                    v = tuple(v.tolist())
+                else:
+                    v = v.item()
+                setattr(obj._v, f.name, v)
+        self.__objs[i] = obj
+        return obj
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+
+# ------------------------------------------------------------------------------
+
+
 # our data structures exception handler:
 class StructureError(Exception):
     def __init__(self, message):
@@ -255,3 +579,43 @@ class StructureError(Exception):
 
 
 Alltypes = {}
+
+# cache of structure classes StructCodec objects (see StructCore.codec):
+_codecs = {}
+
+# cache of StructCodec objects of modified structure instances:
+_layouts = {}
+
+# cache of structure classes sizes (see StructCore.size):
+_sizes = {}
+
+# Field attributes that define the layout of a structure:
+_layout_attrs = ("typename", "count", "order", "name")
+
+# watched subclasses of Field classes (see _watch):
+_watched = {}
+
+
+def _watch(fields):
+    """
+    changes the class of the given fields of a structure class into a
+    subclass that clears the cache of classes StructCodec objects when
+    the layout of any of these fields is updated. (Copies of these fields
+    in structure instances have their original class.)
+    """
+    for f in fields:
+        T = f.__class__
+        if "_fieldclass" in T.__dict__:
+            continue
+        W = _watched.get(T)
+        if W is None:
+            D = {"__setattr__": _watched_setattr, "_fieldclass": T}
+            D["__module__"] = T.__module__
+            W = _watched[T] = type(T.__name__, (T,), D)
+        f.__class__ = W
+
+
+def _watched_setattr(self, attr, value):
+    object.__setattr__(self, attr, value)
+    if attr in _layout_attrs:
+        _codecs.clear()
@@ -170,13 +170,36 @@ class Field(object):
     def get(self, data, offset=0, psize=0):
         return (self.name, self.unpack(data, offset, psize))
 
+    def dtype(self, psize=0):
+        """
+        returns the numpy type string of this field, or None if the field
+        can not be decoded as a fixed-layout numpy type.
+        """
+        T = self.type
+        if T is not None and T.typedef and self.count == 0:
+            return T.fields[0].dtype(psize)
+        return None
+
+    def codec(self, psize=0):
+        """
+        returns a tuple (order, format, n, conv) that allows to unpack this
+        field with the struct package as n items of given order and format,
+        where conv(items) returns the field's value (or conv is None if the
+        value is the single item), or None if the field has no such
+        fixed-layout encoding.
+        """
+        T = self.type
+        if T is not None and T.typedef and self.count == 0:
+            return T.fields[0].codec(psize)
+        return None
+
     def pack(self, value, psize=0):
         if self.count > 0:
             return b"".join([self.type().pack(v, psize) for v in value])
         return self.type.pack(value, psize)
 
     def copy(self, obj=None):
-        cls = self.__class__
+        cls = getattr(self, "_fieldclass", self.__class__)
         newf = cls(
             self.typename,
             self.count,
@@ -239,6 +262,36 @@ class RawField(Field):
             sz = sz * self.count
         return sz
 
+    def codec(self, psize=0):
+        tn = self.typename
+        if tn in ("P", "L", "l"):
+            if not psize:
+                return None
+            tn = {4: "I", 8: "Q", 32: "I", 64: "Q"}.get(psize, tn)
+        if self.order not in "<>!=" or (tn not in _dtypes and tn not in "sc"):
+            return None
+        if tn == "s":
+            return (self.order, "%ds" % (self.count or 1), 1, None)
+        if self.count == 0:
+            return (self.order, tn, 1, None)
+        conv = _join if tn == "c" else tuple
+        return (self.order, "%d%s" % (self.count, tn), self.count, conv)
+
+    def dtype(self, psize=0):
+        tn = self.typename
+        if tn in ("P", "L", "l"):
+            if not psize:
+                return None
+            tn = {4: "I", 8: "Q", 32: "I", 64: "Q"}.get(psize, tn)
+        if tn in ("s", "c"):
+            return "S%d" % (self.count or 1)
+        if tn not in _dtypes:
+            return None
+        order = {"!": ">", "@": "="}.get(self.order, self.order)
+        if self.count > 0:
+            return (order + _dtypes[tn], (self.count,))
+        return order + _dtypes[tn]
+
     def unpack(self, data, offset=0, psize=0):
         pfx = "%d" % self.count if self.count > 0 else ""
         tn = self.typename
@@ -276,6 +329,25 @@ class RawField(Field):
 # ------------------------------------------------------------------------------
 
 
+_join = b"".join
+
+# numpy types of RawField typenames:
+_dtypes = {
+    "b": "i1",
+    "B": "u1",
+    "?": "b1",
+    "h": "i2",
+    "H": "u2",
+    "i": "i4",
+    "I": "u4",
+    "q": "i8",
+    "Q": "u8",
+    "e": "f2",
+    "f": "f4",
+    "d": "f8",
+}
+
+
 class BitField(RawField):
     """
     A BitField is a 0-count RawField with additional subnames and subsizes to allow
@@ -301,6 +373,25 @@ class BitField(RawField):
         self.subnames = fname or []
         # other attributes are as usual...
 
+    def dtype(self, psize=0):
+        return None
+
+    def codec(self, psize=0):
+        c = super().codec()
+        if c is None:
+            return None
+        parts = []
+        l = 0
+        for name, sz in zip(self.subnames, self.subsizes):
+            parts.append((name, l, (1 << sz) - 1))
+            l += sz
+
+        def conv(items):
+            value = items[0]
+            return {name: (value >> l) & mask for (name, l, mask) in parts}
+
+        return (c[0], c[1], 1, conv)
+
     def unpack(self, data, offset=0, psize=0):
         value = super().unpack(data, offset)
         D = {}
@@ -322,7 +413,7 @@ class BitField(RawField):
         return super().pack(value, psize)
 
     def copy(self, obj=None):
-        cls = self.__class__
+        cls = getattr(self, "_fieldclass", self.__class__)
         newf = cls(
             self.typename,
             self.subsizes,
@@ -365,6 +456,9 @@ class BitFieldEx(Field):
         self.subnames = fname or []
         # other attributes are as usual...
 
+    def codec(self, psize=0):
+        return None
+
     def unpack(self, data, offset=0, psize=0):
         value = super().unpack(data, offset)
         D = {}
@@ -386,7 +480,7 @@ class BitFieldEx(Field):
         return super().pack(value, psize)
 
     def copy(self, obj=None):
-        cls = self.__class__
+        cls = getattr(self, "_fieldclass", self.__class__)
         newf = cls(
             self.typename,
             self.subsizes,
@@ -418,6 +512,12 @@ class VarField(RawField):
     The default terminate condition is to match the null byte.
     """
 
+    def dtype(self, psize=0):
+        return None
+
+    def codec(self, psize=0):
+        return None
+
     def format(self, psize=0):
         fmt = self.typename
         cnt = self.count if hasattr(self, "_sz") else "#"
@@ -544,6 +644,12 @@ class CntField(RawField):
     that define its value."
     """
 
+    def dtype(self, psize=0):
+        return None
+
+    def codec(self, psize=0):
+        return None
+
     def format(self, psize=0):
         fmt = self.typename
         if psize and fmt == "P":
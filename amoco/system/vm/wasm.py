@@ -677,6 +677,7 @@ class Elem(StructFormatter):
 
     def reset(self):
         self.fields = self.fields[0:1]
+        self.update_layout()
         t = type("container", (object,), {})
         self._v = t()
 
@@ -795,6 +796,7 @@ class Code(StructFormatter):
 
     def reset(self):
         self.fields = self.fields[0:1]
+        self.update_layout()
         t = type("container", (object,), {})
         self._v = t()
 
@@ -874,6 +876,7 @@ class Data(StructFormatter):
 
     def reset(self):
         self.fields = self.fields[0:1]
+        self.update_layout()
         t = type("container", (object,), {})
         self._v = t()
 
@@ -54,6 +54,7 @@ class CompoundDocumentHeader(StructFormatter):
             # FF FE: Big-Endian
             for f in self.fields:
                 f.order = ">"
+            self.update_layout()
         # unpack the rest with correct endianness:
         for f in self.fields[5:]:
             self[f.name] = f.unpack(data, offset)
@@ -245,3 +246,4 @@ class DirectoryEntry(StructFormatter):
     def set_order(self, order):
         for f in self.fields:
             f.order = order
+        self.update_layout()
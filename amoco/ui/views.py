@@ -590,7 +590,8 @@ class execView(View):
     def code(self, blk):
         """
         Enhance a code block with info from the task/OS.
-        This allows any symbol associated with an address/constant to
+        This allows any symbol associated with an address/constant (or
+        the symbol+offset of the function or variable that contains it) to
         be displayed as comment, optionally adds the segment name
         (ie ELF section name) to the location if found.
         """
@@ -599,10 +600,10 @@ class execView(View):
         else:
             T = blk
         for i, r in enumerate(T.rows):
+            address = int(r.cols[0][0][1], 0)
+            if name := self.of.symbol_for(address):
+                r.label = (Token.Name, name)
             for c in r.cols[2:]:  # skip address and bytecode columns
-                address = int(r.cols[0][0][1], 0)
-                if name := self.of.symbol_for(address):
-                    r.label = (Token.Name, name)
                 for i in range(len(c) - 1, -1, -1):
                     tn, tv = c[i]
                     # we take 1st level token id. For example,
@@ -620,7 +621,7 @@ class execView(View):
                     if tn in (Token.Address, Token.Constant):
                         try:
                             v = int(tv, 0)
-                            tv = self.of.symbol_for(v)
+                            tv = self.of.symbol_near(v)
                         except ValueError:
                             tv = None
                         if tv:
@@ -76,6 +76,9 @@ setup(
             "textual",
             "prompt_toolkit>=3.0.28",
         ],
+        "numpy": [
+            "numpy",
+        ],
     },
     package_data={
         "amoco.ui.graphics.qt_": ["*.qml", "*.qss"],
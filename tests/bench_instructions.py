@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""
+bench_instructions.py
+=====================
+
+Reports the memory footprint of instructions decoded by linear sweep of
+the code ranges of programs in tests/samples (see sa.lsweep.sweep), and the
+share of instructions that have allocated a misc dict.
+
+usage: python tests/bench_instructions.py [samples...]
+"""
+
+import os
+import sys
+import gc
+import tracemalloc
+
+SAMPLES = [
+    "x86/puttygen.exe",
+    "x86/CoST.exe",
+    "x86/test_full.elf",
+    "x86/libhello_pic.so",
+    "x64/test_full.elf64",
+    "x64/cxx.elf64",
+    "sparc/solaris-sed.elf",
+]
+
+
+def footprint(filename, limit=0x40000):
+    """returns the number of instructions decoded in the code ranges of
+    program filename (up to limit bytes), their traced memory size in bytes
+    and the number of instructions with a misc dict.
+    """
+    import amoco
+    from amoco.sa.lsweep import lsweep, sweep
+
+    p = amoco.load_program(filename)
+    z = lsweep(p)
+    D = []
+    for start, end in z.code_ranges():
+        addr = start
+        for x in p.state.mmap.read(start, min(end - start, limit)):
+            if isinstance(x, (bytes, bytearray, memoryview)):
+                D.append((addr, bytes(x)))
+                addr += len(x)
+            else:
+                addr += x.length
+        limit -= addr - start
+        if limit <= 0:
+            break
+    if not D:
+        return 0, 0, 0
+    # warm up the decoder (specs, formatters, ...) outside of traced memory:
+    sweep(p.cpu, D[0][0], D[0][1][:0x100], min(0x100, len(D[0][1])))
+    gc.collect()
+    tracemalloc.start()
+    try:
+        m0 = tracemalloc.get_traced_memory()[0]
+        I = []
+        for addr, data in D:
+            I.extend(i for i in sweep(p.cpu, addr, data, len(data))[1] if i)
+        gc.collect()
+        m1 = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return len(I), m1 - m0, sum(1 for i in I if i._misc is not None)
+
+
+def main(samples):
+    print("%-28s %8s %10s %8s" % ("sample", "instrs", "bytes/ins", "misc"))
+    total = [0, 0]
+    for f in samples:
+        n, size, misc = footprint(f)
+        if n == 0:
+            continue
+        total[0] += n
+        total[1] += size
+        print(
+            "%-28s %8d %10.1f %7.1f%%"
+            % (os.path.basename(f), n, size / n, 100.0 * misc / n)
+        )
+    if total[0]:
+        print("%-28s %8d %10.1f" % ("total", total[0], total[1] / total[0]))
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if len(sys.argv) > 1:
+        main(sys.argv[1:])
+    else:
+        d = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+        main([os.path.join(d, f) for f in SAMPLES])
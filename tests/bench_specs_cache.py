@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""
+bench_specs_cache.py
+====================
+
+Compares the import time of all cpu modules without and with the cached
+ispecs layouts and specs trees (see arch.core.SpecsCache).
+
+usage: python tests/bench_specs_cache.py [cachedir]
+"""
+
+import os
+import sys
+import json
+import subprocess
+import tempfile
+
+IMPORTS = r"""
+import sys, os, glob, time, json, importlib
+from amoco.config import conf
+
+conf.Arch.cachedir = sys.argv[1]
+import amoco.arch
+
+R = {}
+for f in sorted(glob.glob(os.path.join(os.path.dirname(amoco.arch.__file__), "*", "cpu*.py"))):
+    name = "amoco.arch.%s.%s" % (os.path.basename(os.path.dirname(f)), os.path.basename(f)[:-3])
+    t = time.perf_counter()
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        continue
+    R[name] = time.perf_counter() - t
+print(json.dumps(R))
+"""
+
+
+def imports(cachedir):
+    "returns the import times of all cpu modules (in a new process)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    r = subprocess.run(
+        [sys.executable, "-c", IMPORTS, cachedir],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(r.stdout.splitlines()[-1])
+
+
+def main(cachedir):
+    cold = imports(cachedir)
+    warm = imports(cachedir)
+    print("%-36s %8s %8s" % ("import time", "cold", "cached"))
+    for name in cold:
+        print("%-36s %7.3fs %7.3fs" % (name, cold[name], warm[name]))
+    print("%-36s %7.3fs %7.3fs" % ("total", sum(cold.values()), sum(warm.values())))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(sys.argv[1])
+    else:
+        with tempfile.TemporaryDirectory() as d:
+            main(d)
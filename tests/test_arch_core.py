@@ -0,0 +1,249 @@
+import pytest
+from crysp.bits import Bits
+from amoco.arch.core import ispec, DecodeError
+
+
+def test_ispec_decode():
+    def hook(obj, b, c, _k):
+        obj.b, obj.c, obj.k = b, c, _k
+
+    s = ispec("16<[ 1010 ~b(4) #c(4) .d(4) ]", mnemonic="X", _k=lambda b: b[0:4].ival)
+    s.hook = hook
+    assert s.ifix == 0xA000 and s.imask == 0xF000 and s.bits
+    i = s.decode(b"\x5c\xa3")
+    assert i.mnemonic == "X" and i.d == 0xC and i.k == 0xC
+    assert isinstance(i.b, Bits) and i.b.ival == 3
+    assert i.c == "0101"
+    i = s.decode(b"\xa3\x5c", endian=-1)
+    assert i.d == 0xC and i.c == "0101"
+    with pytest.raises(DecodeError):
+        s.decode(b"\x5c\xb3")
+    s = ispec("*>[ {0f} x(4) y(*) ]")
+    s.hook = lambda obj, **kargs: obj.__dict__.update(kargs)
+    assert not s.bits and s.size == 0
+    i = s.decode(b"\x0f\x21\x43")
+    assert i.x == 1 and i.y == 0x432
+
+
+def test_ispec_pickle():
+    import pickle
+    from amoco.arch.x86 import cpu_x86
+
+    i = cpu_x86.disassemble(b"\x89\xc8")
+    assert pickle.loads(pickle.dumps(i.spec)) is i.spec
+    s = ispec("16<[ 1010 ~b(4) #c(4) .d(4) ]", mnemonic="X", _k=3)
+    t = pickle.loads(pickle.dumps(s))
+    assert t.hook is None and (t.ifix, t.imask) == (s.ifix, s.imask)
+    assert t.iattr == s.iattr and t.fargs == s.fargs
+
+
+def cpu_modules():
+    import os
+    from glob import glob
+
+    archdir = os.path.join(os.path.dirname(__file__), "..", "amoco", "arch")
+    for f in sorted(glob(os.path.join(archdir, "*", "cpu*.py"))):
+        yield "%s.%s" % (os.path.basename(os.path.dirname(f)), os.path.basename(f)[:-3])
+
+
+@pytest.mark.parametrize("cpu", list(cpu_modules()))
+def test_codegen(cpu, tmp_path, monkeypatch):
+    import random
+    import importlib
+    from amoco.config import conf
+
+    monkeypatch.setattr(conf.Arch, "cachedir", str(tmp_path))
+    # some cpu modules are incomplete (ppc32 e200, riscv 64, superh, w65c02):
+    try:
+        m = importlib.import_module("amoco.arch.%s" % cpu)
+    except ImportError as e:
+        pytest.skip("%s can not be imported (%s)" % (cpu, e))
+    d = m.cpu.disassemble
+    rnd = random.Random(0)
+    bss = [bytes(rnd.getrandbits(8) for _ in range(d.maxlen)) for _ in range(500)]
+    ref = [decode(d, bs) for bs in bss]
+    try:
+        d.compile()
+        assert len(list(tmp_path.glob("*.py"))) == 1
+        d.compile()
+        res = [decode(d, bs) for bs in bss]
+    finally:
+        d.compiled = None
+    for i, j in zip(ref, res):
+        if i is None or isinstance(i, type):
+            assert j == i
+        else:
+            assert j.spec is i.spec and j.bytes == i.bytes
+            assert show(j) == show(i)
+
+
+# some random instructions can not be decoded or formatted:
+def decode(d, bs):
+    try:
+        return d(bs)
+    except Exception as e:
+        return type(e)
+
+
+def show(i):
+    try:
+        return str(i)
+    except Exception as e:
+        return type(e)
+
+
+def test_disassembler_threads():
+    import sys
+    from threading import Thread
+    from amoco.arch.x64 import cpu_x64
+
+    d = cpu_x64.disassemble
+    codes = [
+        b"\x66\x48\x0f\x7e\xc0",
+        b"\xf3\x48\xa5",
+        b"\x66\x67\x89\x04\x24",
+        b"\xf0\x48\x0f\xc1\x02",
+        b"\x48\x8b\x04\x24",
+    ]
+    ref = [str(d(c)) for c in codes]
+    errors = []
+
+    def job(k):
+        for n in range(300):
+            c = codes[(n + k) % len(codes)]
+            s = str(d(c))
+            if s != ref[(n + k) % len(codes)]:
+                errors.append(s)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        T = [Thread(target=job, args=(k,)) for k in range(4)]
+        for t in T:
+            t.start()
+        for t in T:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+
+
+def test_instruction_misc():
+    from pickle import dumps, loads
+    from amoco.arch.x86 import cpu_x86
+
+    d = cpu_x86.disassemble
+    i = d(b"\x89\xc8")
+    assert not hasattr(i, "__dict__") or i.__dict__ == {}
+    assert i.misc["opdsz"] is None and i.misc.get("opdsz", 32) == 32
+    assert len(i.misc) == 0 and i._misc is None
+    m = i.misc
+    m["tag"] = 1
+    assert m["tag"] == 1 and i.misc == {"tag": 1} and i._misc is not None
+    j = loads(dumps(i))
+    assert j.misc == {"tag": 1} and j.misc["x"] is None
+    assert str(j) == str(i) and j.spec is i.spec
+    i = d(b"\x66\x89\xc8")
+    assert i.misc["opdsz"] == 16
+    assert "opdsz" not in d(b"\x89\xc8").misc
+
+
+def test_instruction_footprint(samples):
+    import amoco
+    from amoco.sa.lsweep import lsweep, sweep
+
+    p = amoco.load_program([s for s in samples if s.endswith("puttygen.exe")][0])
+    start, end = lsweep(p).code_ranges()[0]
+    data = p.state.mmap.read(start, 0x4000)[0]
+    I = [i for i in sweep(p.cpu, start, data, len(data))[1] if i is not None]
+    assert sum(1 for i in I if i._misc is not None) < len(I) // 4
+    # plain (single byte, thus without prefix) instructions have no
+    # misc dict and no instance attribute:
+    plain = [i for i in I if i.length == 1]
+    assert len(plain) > 0
+    for i in plain:
+        assert i._misc is None
+        assert not i.__dict__
+
+
+def test_instruction_toks():
+    from amoco.arch.x86 import cpu_x86
+
+    i = cpu_x86.disassemble(b"\xe8\x10\x00\x00\x00")
+    t = i.toks()
+    c = i._toks
+    assert i.toks() == t and i._toks is c and c[1] is not t
+    assert str(i).split() == ["call", ".+16"]
+    i.address = cpu_x86.cpu.cst(0x1000, 32)
+    assert str(i).split() == ["call", "0x1015"]
+    i = cpu_x86.disassemble(b"\x68\x30\x86\x04\x08")
+    assert str(i).split() == ["push", "0x8048630"]
+    i.misc["imm_ref"] = "main"
+    assert str(i).split() == ["push", "main"]
+    i.misc["imm_ref"] = "start"
+    assert str(i).split() == ["push", "start"]
+    i = cpu_x86.disassemble(b"\x83\xc0\x01")
+    assert str(i).split() == ["add", "eax,", "0x1"]
+    i.operands[1] = cpu_x86.cpu.cst(5, 32)
+    assert str(i).split() == ["add", "eax,", "0x5"]
+    c = i._toks
+    try:
+        cpu_x86.env.internals["keep_order"] = True
+        assert str(i).split() == ["add", "eax,", "0x5"]
+        assert i._toks is not c
+    finally:
+        del cpu_x86.env.internals["keep_order"]
+    i = cpu_x86.disassemble(b"\x89\xc8")
+    assert str(i).split() == ["mov", "eax,", "ecx"]
+    try:
+        cpu_x86.configure(format="att")
+        assert str(i).split() == ["mov", "%ecx,", "%eax"]
+    finally:
+        cpu_x86.configure(format="intel")
+    assert str(i).split() == ["mov", "eax,", "ecx"]
+
+
+SPECS_IMPORTS = r"""
+import sys, os, glob, json, importlib
+from amoco.config import conf
+
+conf.Arch.cachedir = sys.argv[1]
+import amoco.arch
+from amoco.arch import codegen
+
+R = {}
+for f in sorted(glob.glob(os.path.join(os.path.dirname(amoco.arch.__file__), "*", "cpu*.py"))):
+    name = "amoco.arch.%s.%s" % (os.path.basename(os.path.dirname(f)), os.path.basename(f)[:-3])
+    try:
+        m = importlib.import_module(name)
+    except ImportError:
+        continue
+    d = m.cpu.disassemble
+    R[name] = codegen.signature(d, d.endian())
+print(json.dumps(R))
+"""
+
+
+def test_specs_cache_imports(tmp_path):
+    # (see bench_specs_cache.py for the import times)
+    import os
+    import sys
+    import json
+    import subprocess
+    import amoco
+
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(amoco.__file__)))
+
+    def imports():
+        r = subprocess.run(
+            [sys.executable, "-c", SPECS_IMPORTS, str(tmp_path)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(r.stdout.splitlines()[-1])
+
+    cold = imports()
+    assert any(f.name.startswith("amoco_ispecs_") for f in tmp_path.iterdir())
+    warm = imports()
+    assert "amoco.arch.x86.cpu_x86" in cold
+    # identical specs trees:
+    assert cold == warm
@@ -0,0 +1,53 @@
+import pytest
+from amoco.cas.batch import has_numpy, evaluate
+from amoco.cas.expressions import reg, mem, cst, tst, composer, ror, ltu
+from amoco.cas.mapper import mapper
+
+
+@pytest.mark.skipif(not has_numpy, reason="numpy package not found")
+@pytest.mark.parametrize("size", [8, 32, 64])
+def test_batch_eval(size):
+    a = reg("a", size)
+    b = reg("b", size)
+    p = reg("p", 32)
+    x = mem(p, size)
+    s = b & 0x7
+    L = [
+        a - b,
+        a**b,
+        a / (b | 1),
+        a.signed() < b.signed(),
+        ltu(a, b),
+        a // s,
+        ror(a, s),
+        -a,
+        composer([a[0:4], (a >> 3)[0:2], cst(3, 2)]),
+        tst(a < b, a + x, b ^ x),
+    ]
+    M = (1 << size) - 1
+    values = [0, 1, M, M >> 1, (M >> 1) + 1, 0x1234567812345678 & M]
+    va = [v for v in values for _ in values]
+    vb = values * len(values)
+    vx = [u ^ v for (u, v) in zip(va, vb)]
+    for e in L:
+        res = evaluate(e, {a: va, b: vb, x: vx})
+        assert len(res) == len(va)
+        for i in range(len(va)):
+            m = mapper()
+            m[a] = cst(va[i], size)
+            m[b] = cst(vb[i], size)
+            m[p] = cst(0x1000)
+            m[mem(cst(0x1000), size)] = cst(vx[i], size)
+            assert int(res[i]) == m(e).v
+
+
+@pytest.mark.skipif(not has_numpy, reason="numpy package not found")
+def test_batch_mapper(a, b):
+    m = mapper()
+    m[a] = a + b
+    m[b] = cst(3)
+    res = dict(evaluate(m, {a: [1, 2, -1], b: [3, 4, 5]}))
+    assert list(res[a]) == [4, 6, 4]
+    assert list(res[b]) == [3, 3, 3]
+    with pytest.raises(ValueError):
+        evaluate(a + b, {a: [1]})
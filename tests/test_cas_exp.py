@@ -1,6 +1,6 @@
 import pytest
 import pickle
-from amoco.cas.expressions import cst, reg, mem, comp, composer, slc, ptr, vec, top, sym, ext, tst
+from amoco.cas.expressions import cst, reg, mem, comp, composer, slc, ptr, vec, top, sym, ext, tst, bit1
 from amoco.cas.expressions import extract_offset, conf
 
 conf.Cas.complexity = 0
@@ -249,3 +249,123 @@ def test_pickle_vec(a, b):
     assert y._is_vec
     assert y.l[0] == a
     assert y.l[1] == -b
+
+
+def test_hashcons(a, b):
+    from amoco.cas.expressions import hashcons
+
+    hc = hashcons()
+    x = hc((a + 1) ^ mem(a, 32))
+    y = hc((a + 1) ^ mem(a, 32))
+    assert x is y
+    assert x in hc
+    assert hc(cst(1, 32)) is x.l.r
+    assert hc.hits > 0
+    assert hc(x.l) is x.l
+    z = hc(tst(a == b, x, cst(0, 32)))
+    assert z.l is x
+    assert (x == y) is bit1
+    assert hash(x) == hash((a + 1) ^ mem(a, 32))
+    c = hc(composer([a[0:16], cst(1, 16)]))
+    assert c is hc(composer([a[0:16], cst(1, 16)]))
+    hc.clear()
+    assert len(hc) == 0
+    assert x == y
+
+
+def test_simplify_cache(a, b):
+    from amoco.cas.expressions import scache, hcons
+
+    conf.Cas.simplify_cache = 2
+    ha, hb, one = hcons(a), hcons(b), hcons(cst(1, 32))
+    x = (ha + one) - hb
+    assert scache.misses > 0
+    h = scache.hits
+    y = (ha + one) - hb
+    assert scache.hits > h
+    assert x == y
+    assert len(scache) <= 2
+    c = composer([hcons(a[0:16]), hcons(cst(1, 16))])
+    assert c.simplify() is not c.simplify()
+    conf.Cas.simplify_cache = 0
+    assert len(scache) == 0
+    hcons.clear()
+
+
+def test_simplify_cache_inplace(a, b):
+    conf.Cas.simplify_cache = 100
+    x = a + b
+    x.simplify()
+    x.r = cst(0, 32)
+    assert x.simplify() == a
+    c = composer([a[0:16], b[0:16]])
+    c.simplify()
+    c[16:32] = cst(1, 16)
+    assert c.simplify()[16:32] == cst(1, 16)
+    conf.Cas.simplify_cache = 0
+
+
+def test_simplify_cache_endian(a):
+    conf.Cas.simplify_cache = 100
+    x = mem(a, 32, endian=1) + cst(1, 32)
+    y = mem(a, 32, endian=-1) + cst(1, 32)
+    assert str(x) == str(y)
+    assert x.simplify().l.endian == 1
+    assert y.simplify().l.endian == -1
+    conf.Cas.simplify_cache = 0
+
+
+def test_symbols_of(a, b):
+    from amoco.cas.expressions import op, symbols_of, locations_of, leaves_of
+    from amoco.cas.expressions import complexity, hcons
+
+    e = (a + b) ^ mem(a + 4, 32)
+    assert symbols_of(e) == [a, b]
+    assert len(leaves_of(e)) == 3
+    assert len(locations_of(e)) == 3
+    assert locations_of(e)[0]._is_mem
+    x = a
+    for _ in range(5000):
+        x = op("+", x, b)
+    assert symbols_of(x) == [a, b]
+    assert len(leaves_of(x, locations=True)) == 5001
+    x = hcons(e)
+    c = complexity(x)
+    assert hcons.complexity[id(x)] == c
+    assert symbols_of(x) == [a, b]
+    hcons.clear()
+
+
+def test_compile(a, b):
+    from amoco.cas.expressions import compile_expr, evaluator, ror, ltu
+    from amoco.cas.mapper import mapper
+
+    p = reg("p", 32)
+    x = mem(p, 32)
+    s = b & 0xF
+    L = [
+        a - b,
+        a**b,
+        a / (b | 1),
+        a < b,
+        ltu(a, b),
+        a // s,
+        ror(a, s),
+        -a,
+        composer([a[0:16], (a >> 3)[0:8], cst(3, 8)]),
+        tst(a < b, a + x, b ^ x),
+    ]
+    values = [0, 1, -1, 0x7FFFFFFF, 0x80000000, 0x12345678]
+    for e in L:
+        f = compile_expr(e, [a, b, x])
+        for va in values:
+            for vb in values:
+                m = mapper()
+                m[a] = cst(va)
+                m[b] = cst(vb)
+                m[p] = cst(0x1000)
+                m[mem(cst(0x1000), 32)] = cst(vb ^ va)
+                assert f(va, vb, vb ^ va) == m(e).v
+                assert evaluator(e)(m) == m(e)
+    with pytest.raises(NotImplementedError):
+        compile_expr(a + b, [a])
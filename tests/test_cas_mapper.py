@@ -227,3 +227,21 @@ def test_pickle_mapper(a, m):
     parts = M.read(ptr(w(a)), 1)
     assert len(parts) == 1
     assert parts[0] == b"\x01"
+
+
+def test_fork(m, x, y):
+    m.clear()
+    m[x] = cst(0xABCDEF89, 32)
+    m[mem(y, 32)] = x
+    m[mem(cst(0x1000, 32), 16)] = cst(0x1234, 16)
+    f = m.fork()
+    assert f.mmap.shared() == m.mmap.shared() == 6
+    xl = slc(x, 0, 8, ref="xl")
+    f[xl] = cst(0x11, 8)
+    f[mem(cst(0x1000, 32), 8)] = cst(0x56, 8)
+    assert m(x) == 0xABCDEF89
+    assert f(x) == 0xABCDEF11
+    assert m(mem(cst(0x1000, 32), 16)) == 0x1234
+    assert f(mem(cst(0x1000, 32), 16)) == 0x1256
+    assert str(f(mem(y, 32))) == str(m(mem(y, 32)))
+    assert f.mmap.shared() == 4
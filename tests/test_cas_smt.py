@@ -38,3 +38,129 @@ def test_mem_bv():
     assert m(xh) == m(yl)
     assert m(z) == 0
     conf.Cas.complexity = clx
+
+
+@pytest.mark.skipif(not has_solver, reason="no smt solver loaded")
+def test_smt_cache(x, y):
+    from amoco.cas.smt import zcache
+    from amoco.cas.expressions import hcons
+
+    zcache.clear()
+    z = hcons((x + y) ^ cst(0x1234, 32))
+    zz = z.to_smtlib()
+    hits = zcache.hits
+    assert z.to_smtlib() is zz
+    assert zcache.hits == hits + 1
+    # expressions that are not interned can be updated in-place:
+    z = x + y
+    z.to_smtlib()
+    z.r = cst(0, 32)
+    assert z.to_smtlib().eq(x.to_smtlib() + 0)
+    hcons.clear()
+
+
+@pytest.mark.skipif(not has_solver, reason="no smt solver loaded")
+def test_solver_push_pop(x, y):
+    s = solver([x == cst(1, 32)])
+    s.push()
+    s.add([x == y, y == cst(2, 32)])
+    assert len(s.eqns) == 3
+    assert s.get_model() is None
+    s.pop()
+    assert len(s.eqns) == 1
+    m = s.get_model()
+    assert m is not None
+    assert m.eval(x.to_smtlib()).as_long() == 1
+    with pytest.raises(ValueError):
+        s.pop()
+
+
+@pytest.mark.skipif(not has_solver, reason="no smt solver loaded")
+def test_querydb(tmp_path):
+    from amoco.cas.smt import querydb
+
+    conf.Cas.smt_db = str(tmp_path / "queries.db")
+    try:
+        db = querydb.current()
+        a, b = reg("qa", 32), reg("qb", 32)
+        m = solver([a + b == cst(3, 32), a == cst(1, 32)]).get_mapper()
+        assert m(b) == 2
+        assert (db.hits, db.misses) == (0, 1)
+        # same query up to variables renaming:
+        c, d = reg("qc", 32), reg("qd", 32)
+        m = solver([c + d == cst(3, 32), c == cst(1, 32)]).get_mapper()
+        assert (db.hits, db.misses) == (1, 1)
+        assert m(c) == 1 and m(d) == 2
+        assert solver([c == cst(1, 32), c == cst(2, 32)]).get_mapper() is None
+        assert solver([d == cst(1, 32), d == cst(2, 32)]).get_mapper() is None
+        assert db.hitrate == 0.5
+        conf.Cas.smt_db_size = 1
+        solver([c != cst(1, 32)]).check()
+        assert len(db) == 1
+        db.close()
+        db = querydb(conf.Cas.smt_db)
+        assert len(db) == 1
+        db.close()
+    finally:
+        conf.Cas.smt_db = ""
+        conf.Cas.smt_db_size = 100000
+
+
+def test_independent(x, y, z):
+    from amoco.cas.smt import independent, relevant, precheck
+
+    c1 = x == cst(1, 32)
+    c2 = y > cst(2, 32)
+    c3 = (x + z) == cst(4, 32)
+    c4 = mem(y, 32) == cst(0, 32)
+    c5 = mem(z, 32) != cst(0, 32)
+    assert independent([c1, c2, c3]) == [[c1, c3], [c2]]
+    assert len(independent([c1, c2, c3, c4, c5])) == 1
+    assert relevant([c1, c2, c3], [z == cst(3, 32)]) == [c1, c3]
+    assert precheck([c1, cst(1, 1), c2]) == [c1, c2]
+    assert precheck([c1, cst(0, 1)]) is None
+    assert precheck([c2, y < cst(3, 32)]) is None
+    assert precheck([c2, y <= cst(3, 32), y != cst(3, 32)]) is None
+    assert precheck([c1, x == cst(2, 32)]) is None
+    m1 = mem(y, 32, endian=1) == cst(0x01000000, 32)
+    m2 = mem(y, 32, endian=-1) == cst(1, 32)
+    assert precheck([m1, m2]) == [m1, m2]
+
+
+@pytest.mark.skipif(not has_solver, reason="no smt solver loaded")
+def test_solver_groups(x, y, z):
+    from amoco.cas.smt import gcache
+
+    conds = [x == cst(1, 32), y > cst(2, 32), (x + z) == cst(4, 32)]
+    m = solver(conds).get_mapper(query=[z != cst(0, 32)])
+    assert m(z) == 3
+    assert y not in [l for l, _ in m]
+    assert solver(conds).get_mapper(query=[z == cst(0, 32)]) is None
+    assert solver(conds + [y < cst(2, 32)]).get_mapper() is None
+    s = solver(conds)
+    assert s.groups() == [[0, 2], [1]]
+    s.get_mapper()
+    h = gcache.hits
+    m = solver(conds).get_mapper()
+    assert gcache.hits == h + 2
+    assert m(x) == 1 and m(z) == 3
+    m = solver(conds).get_model(query=[z != cst(0, 32)])
+    assert m.eval(z.to_smtlib()).as_long() == 3
+
+
+@pytest.mark.skipif(not has_solver, reason="no smt solver loaded")
+def test_solver_groups_endian():
+    p = reg("p", 32)
+    for endian, b in ((1, 0x44), (-1, 0x11)):
+        x = mem(p, 32, endian=endian)
+        m = solver([x == cst(0x11223344, 32), p == cst(0x1000, 32)]).get_mapper()
+        assert m(x) == 0x11223344
+        assert m(mem(p, 8)) == b
+    m = solver(
+        [
+            mem(p, 32, endian=1) == cst(0x01000000, 32),
+            mem(p, 32, endian=-1) == cst(1, 32),
+            p == cst(0x1000, 32),
+        ]
+    ).get_mapper()
+    assert m is not None and m(mem(p, 8)) == 0
@@ -61,3 +61,82 @@ def test_func(ploop):
     assert y.blocks == f.blocks
     assert y.support == f.support
     # assert cfg.signature(y.cfg) == sig
+
+
+def test_psweep(ploop):
+    p = amoco.load_program(ploop)
+    z = lsweep(p)
+    R = z.code_ranges()
+    assert len(R) > 0
+    start, end = R[0]
+    B1 = list(z.psweep([(start, end)], workers=1))
+    assert z.G.order() == len(B1)
+    z2 = lsweep(p)
+    B2 = list(z2.psweep([(start, end)], workers=2, chunksize=0x40))
+    assert [str(b) for b in B1] == [str(b) for b in B2]
+    assert B1[0].address == start
+    # psweep proceeds like iterblocks as long as bytes can be decoded:
+    for b, x in zip(z.iterblocks(start), B1):
+        if b.address + b.length > end:
+            break
+        assert b == x
+
+
+def test_psweep_records(ploop, monkeypatch):
+    import amoco.sa.lsweep as m
+
+    p = amoco.load_program(ploop)
+    start, end = max(lsweep(p).code_ranges(), key=lambda r: r[1] - r[0])
+    B1 = list(lsweep(p).psweep([(start, end)], workers=1))
+    calls = []
+    decode = m.decode
+
+    def counted(cpu, address, istr):
+        calls.append(address)
+        return decode(cpu, address, istr)
+
+    monkeypatch.setattr(m, "decode", counted)
+    z = lsweep(p)
+    B2 = list(z.psweep([(start, end)], workers=2, chunksize=0x40))
+    # synchronized chunks are not decoded again by the parent process:
+    assert calls == []
+    assert z.G.order() == len(B2)
+    assert [(b.address, b.length) for b in B1] == [(b.address, b.length) for b in B2]
+    # until instructions of blocks are accessed:
+    assert [str(b) for b in B1] == [str(b) for b in B2]
+    assert len(calls) == sum(len(b.instr) for b in B2)
+
+
+def test_listing(ploop):
+    from io import StringIO
+
+    p = amoco.load_program(ploop)
+    z = lsweep(p)
+    out = StringIO()
+    n = z.dump(out, p.cpu.cst(0x804849D, 32))
+    lines = out.getvalue().splitlines()
+    assert n == len(lines) > 10
+    assert lines[0].startswith("0x804849d:\t55 ")
+    assert lines[0].split("\t")[2].split() == ["push", "ebp"]
+    assert lines == list(z.listing(p.cpu.cst(0x804849D, 32)))
+
+
+def test_code_ranges_nocode(samples):
+    # sections of CoST.exe are not flagged as code:
+    p = amoco.load_program([s for s in samples if s.endswith("CoST.exe")][0])
+    assert lsweep(p).code_ranges() == [p.state.mmap._zones[None].range()]
+
+
+def test_psweep_sparc(samples):
+    # sparc disassembler takes no keyword argument and has delayed branches:
+    p = amoco.load_program([s for s in samples if s.endswith("solaris-sed.elf")][0])
+    z = lsweep(p)
+    start, end = z.code_ranges()[0]
+    B1 = list(z.psweep([(start, start + 0x200)], workers=1))
+    B2 = list(lsweep(p).psweep([(start, start + 0x200)], workers=2, chunksize=0x80))
+    assert [str(b) for b in B1] == [str(b) for b in B2]
+    for b in B1:
+        for i in b.instr:
+            x = p.read_instruction(i.address)
+            assert (i.bytes, str(i)) == (x.bytes, str(x))
+    assert any(b.instr[-2].misc["delayed"] for b in B1 if len(b.instr) > 1)
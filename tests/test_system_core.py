@@ -79,3 +79,141 @@ def test_pickle_memorymap(a, m):
     parts = M.read(ptr(a + 1), 2)
     assert len(parts) == 1
     assert parts[0] == b"\xba\xfe"
+
+
+def test_memoryzone_locate(y):
+    from amoco.system.memory import MemoryZone
+
+    z = MemoryZone()
+    for i in range(100, 0, -1):
+        z.write(i * 8, y)
+    assert len(z._map) == 100
+    assert z.locate(0) is None
+    assert z.locate(8) == 0
+    assert z.locate(13) == 0
+    assert z.locate(800) == 99
+    z.write(10, b"A" * 12)
+    assert [o.vaddr for o in z._map[:4]] == [8, 10, 24, 32]
+    assert z.locate(22) == 1
+    assert z.read(9, 2)[1] == b"A"
+    assert z.read(26, 2)[0] == y[16:32]
+
+
+def test_memorymap_paged(sc1, y):
+    from amoco.system.memory import MemoryMap, PagedMemoryZone
+
+    M = MemoryMap(pagesize=16)
+    z = M._zones[None]
+    assert isinstance(z, PagedMemoryZone)
+    M.write(0x0, sc1)
+    assert len(M) == len(sc1)
+    assert M.read(10, 12) == [sc1[10:22]]
+    mv = M.memview(2, 8)
+    assert isinstance(mv, memoryview) and mv == sc1[2:10]
+    assert M.memview(10, 12) is None
+    M.write(cst(0x10, 32), y)
+    assert M.memview(16, 2) is None
+    assert M.read(14, 4) == [sc1[14:16], y[0:16]]
+    assert len(z.overlay._map) == 1
+    M.write(0x12, b"AB")
+    assert M.read(0x10, 4) == [y[0:16], b"AB"]
+    M.write(0x10, cst(0x4443, 16))
+    assert M.read(0x10, 4) == [b"CDAB"]
+    assert len(z.overlay._map) == 0
+    r = M.read(len(sc1) - 1, 4)
+    assert r[0] == sc1[-1:] and r[1].size == 24
+    assert [o.vaddr for o in z._map] == [0]
+    assert M.copy().read(0x10, 4) == [b"CDAB"]
+
+
+def test_memorymap_cow(sc1, y):
+    from amoco.system.memory import MemoryMap
+
+    M = MemoryMap(pagesize=16)
+    M.write(0x0, sc1)
+    C = M.copy()
+    assert C.shared() == M.shared() == len(sc1)
+    C.write(0x10, y)
+    # only the written page is not shared anymore:
+    assert C.shared() == 32
+    assert M.read(0x10, 4) == [sc1[0x10:0x14]]
+    assert C.read(0x10, 4) == [y]
+    M.write(0x0, b"A")
+    assert C.read(0, 1) == [sc1[0:1]]
+
+
+def test_dataio_mmap(tmp_path, sc1):
+    from amoco.system.core import DataIO
+    from amoco.system.memory import MemoryMap
+
+    fn = tmp_path / "sc1.bin"
+    fn.write_bytes(sc1)
+    f = DataIO(open(fn, "rb"))
+    assert f.m is not None
+    assert f[4:8] == sc1[4:8]
+    v = f.memview(0)
+    assert isinstance(v, memoryview) and v.readonly
+    M = MemoryMap()
+    M.write(0x0, v)
+    M.write(0x8, b"AAAA")
+    z = M._zones[None]
+    assert [type(o.data.val) for o in z._map] == [memoryview, bytes, memoryview]
+    assert M.read(0x6, 4) == [sc1[6:8], b"AA"]
+    assert M[0:len(sc1)] == sc1[:8] + b"AAAA" + sc1[12:]
+    P = MemoryMap(pagesize=16)
+    P.write(0x0, v)
+    assert P.shared() == 32
+    P.write(0x8, b"AAAA")
+    assert P.shared() == 16
+    assert P.read(0x0, len(sc1)) == [sc1[:8] + b"AAAA" + sc1[12:]]
+    del v
+    f.close()
+
+
+def test_read_program_probe(samples, sc1):
+    from amoco.system.core import read_program, shellcode, FORMATS
+    from amoco.system.elf import Elf
+
+    assert isinstance(read_program(sc1), shellcode)
+    for filename in samples:
+        if filename[-4:] == ".elf":
+            p = read_program(filename)
+            assert isinstance(p, Elf)
+    assert len(FORMATS) == 6
+
+
+def test_address_index():
+    from amoco.system.core import AddressIndex, SymbolIndex
+
+    I = AddressIndex([(10, 20, "a"), (0, 40, "b"), (15, 30, "c"), (50, 60, "d")])
+    assert I.find(5) == ("b", 5, 0)
+    assert I.find(10) == ("a", 0, 10)
+    assert I.find(19) == ("a", 9, 10)
+    assert I.find(20) == ("b", 20, 0)
+    assert I.find(35) == ("b", 35, 0)
+    assert I.find(40) == (None, 0, 0)
+    assert I.find(55) == ("d", 5, 50)
+    assert len(I) == 4
+    S = SymbolIndex({0x100: ("main", 0x20, 0, 0), 0x200: "puts"}, {0x300: ("v", 4)})
+    assert S.nearest(0x100) == ("main", 0)
+    assert S.nearest(0x110) == ("main", 0x10)
+    assert S.nearest(0x120) == (None, 0)
+    assert S.nearest(0x201) == (None, 0)
+    assert S.nearest(0x303) == ("v", 3)
+    assert S.address_of("puts") == 0x200
+
+
+def test_symbol_near(samples):
+    import amoco
+
+    f = [s for s in samples if s.endswith("x86/loop_simple.elf")][0]
+    p = amoco.load_program(f)
+    assert p.symbol_near(0x804849D) == "<fct_a>"
+    assert p.symbol_near(0x80484D0) == "<fct_a>+0x33"
+    b = amoco.cfg.node(amoco.code.block([p.read_instruction(0x80484AA)]))
+    assert p.view.code(b).rows[0].rawcols(2)[0].endswith("<fct_a>+0x33")
+    S = p.bin.symindex
+    p.bin.functions[0x804849D] = ("fct_b", 72, 0, 0)
+    assert p.bin.symindex is S
+    p.bin.update_symbols()
+    assert p.bin.symindex.nearest(0x80484D0) == ("fct_b", 0x33)
@@ -1,4 +1,4 @@
-from amoco.system.elf import Elf
+from amoco.system.elf import Elf, STT_FUNC
 from amoco.system.core import DataIO
 
 
@@ -18,3 +18,21 @@ def test_parser_elf64(samples):
                 p = Elf(DataIO(f))
                 assert p.Ehdr.e_ident.ELFMAG == b"ELF"
                 assert p.Ehdr.e_ident.EI_CLASS == 2
+
+
+def test_elf_lazy_symbols(samples):
+    for filename in samples:
+        if filename[-6:] == ".elf64":
+            with open(filename, "rb") as f:
+                p = Elf(DataIO(f))
+                assert p._functions is None
+                symtab = p.symtab
+                if not symtab:
+                    continue
+                assert p.functions is p.functions
+                values = symtab.column("st_value")
+                for i in range(0, len(symtab), 7):
+                    sym = symtab[i]
+                    assert sym.st_value == values[i]
+                    if sym.st_type == STT_FUNC and sym.st_value:
+                        assert values[i] in p.functions
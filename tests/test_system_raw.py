@@ -13,3 +13,21 @@ def test_raw_001(samples):
 def test_raw_002(sc1):
     p = RawExec(shellcode(DataIO(sc1)))
     assert p is not None
+
+
+def test_raw_icache(sc1):
+    import pickle
+
+    p = RawExec(shellcode(DataIO(sc1)))
+    p.use_x86()
+    i = p.read_instruction(0x2)
+    assert i.mnemonic == "POP" and len(p.icache) == 1
+    i.misc["trace"] = 1
+    j = p.read_instruction(0x2)
+    assert p.icache.hits == 1 and j is not i and "trace" not in j.misc
+    p.read_instruction(0x3)
+    p.state.mmap.write(0x2, b"\x90")
+    assert len(p.icache) == 1
+    assert p.read_instruction(0x2).mnemonic == "NOP"
+    M = pickle.loads(pickle.dumps(p.state.mmap))
+    assert M.watchers == []
@@ -1,3 +1,4 @@
+import pytest
 from amoco.system.structs import RawField, VarField, CntField, BitField, BitFieldEx, BindedField
 from amoco.system.structs import (StructDefine, StructCore, UnionDefine,
                                   StructFormatter, TypeDefine, Alltypes,
@@ -350,3 +351,130 @@ def test_wasm_():
     assert i.mod == "AAAAA"
     assert i.n2 == 7
     assert i.nm == "BBBBBBB"
+
+
+def test_unpack_array():
+    TypeDefine("int32", "I")
+
+    @StructDefine("""
+    B : tag
+    int32 : val
+    s*3 : name
+    H :> length
+    P : ptr
+    """)
+    class stru_array(StructFormatter):
+        order = "<"
+
+        def __init__(self, data="", offset=0):
+            if data:
+                self.unpack(data, offset)
+
+    s = stru_array()
+    assert s.dtype(psize=8).itemsize == s.size(psize=8) == 24
+    data = bytes(range(24 * 3))
+    t = s.unpack_array(data, 0, 3, psize=8)
+    assert len(t) == 3
+    for i, x in enumerate(t):
+        y = stru_array().unpack(data, i * 24, psize=8)
+        for k in ("tag", "val", "name", "length", "ptr"):
+            assert x[k] == y[k]
+    assert t.values("length") == [x.length for x in t]
+    t = s.unpack_array(data, 0, None, psize=4, stride=24)
+    assert len(t) == 3 and t[2].tag == 48
+
+
+def test_unpack_array_nonumpy(monkeypatch):
+    import amoco.system.structs.core as core
+
+    monkeypatch.setattr(core, "has_numpy", False)
+
+    @StructDefine("""
+    B : tag
+    I : val
+    s*3 : name
+    """)
+    class stru_array_nonumpy(StructFormatter):
+        order = "<"
+
+        def __init__(self, data="", offset=0):
+            if data:
+                self.unpack(data, offset)
+
+    data = bytes(range(12 * 4))
+    t = stru_array_nonumpy().unpack_array(data, 0, 4, stride=12)
+    assert t.array is None and len(t) == 4
+    assert len(t._StructArray__objs) == 0
+    assert t.values("tag") == [0, 12, 24, 36]
+    assert len(t._StructArray__objs) == 0
+    x = t[-1]
+    assert x.tag == 36 and x.name == bytes(range(44, 47))
+    assert len(t._StructArray__objs) == 1
+    x.extra = 1
+    assert t[3] is x and t[3].extra == 1
+    assert [y.val for y in t] == [stru_array_nonumpy(data, i * 12).val for i in range(4)]
+    with pytest.raises(IndexError):
+        t[4]
+
+
+def test_struct_codec():
+    @StructDefine("""
+    B : tag
+    H :> length
+    I * #4/28 : lo/hi
+    c * 2 : magic
+    I * 2 : v
+    """)
+    class stru_codec(StructFormatter):
+        order = "<"
+
+        def __init__(self, data="", offset=0):
+            if data:
+                self.unpack(data, offset)
+
+    s = stru_codec()
+    c = s.codec()
+    assert c is not None and c.span == s.size() == 20
+    assert len(c.groups) == 3
+    data = bytes(range(48))
+    for offset in (0, 4, 5):
+        x = stru_codec().unpack(data, offset)
+        y = stru_codec()
+        for f in y.fields:
+            offset = f.align(offset)
+            v = f.unpack(data, offset)
+            if f.name:
+                assert x[f.name] == v
+            else:
+                assert all(x[k] == v[k] for k in v)
+            offset += f.size()
+    assert s.codec() is c
+
+
+def test_struct_codec_layout():
+    @StructDefine("""
+    H : a
+    I : b
+    """)
+    class stru_layout(StructFormatter):
+        def __init__(self, data="", offset=0, order=None):
+            if order:
+                for f in self.fields:
+                    f.order = order
+                self.update_layout()
+            if data:
+                self.unpack(data, offset)
+
+    data = bytes(range(8))
+    c = stru_layout().codec()
+    assert stru_layout().codec() is c
+    assert type(stru_layout().fields[0]) is RawField
+    x = stru_layout(data, 0, ">")
+    assert x.codec() is not c
+    assert x.a == 0x0001 and x.b == 0x04050607
+    assert stru_layout(data).a == 0x0100
+    # updating the class fields applies to all new instances:
+    stru_layout.fields[0].order = ">"
+    assert stru_layout().codec() is not c
+    assert stru_layout(data).a == 0x0001
+    assert stru_layout(data).b == 0x07060504